@@ -0,0 +1,508 @@
+# -*- coding: utf-8 -*-
+"""
+Generator of synthetic GeoNames dumps for benchmarks.
+
+Files have the layout, columns and compression of GeoNames dumps and
+roughly their distributions: administrative skeleton of countries
+(continents, countries, first and second level divisions, capitals)
+with about 0.04% and 0.4% of records in divisions, about 40% of
+populated places and the rest of features (streams, mountains, hotels
+etc.) which are not imported by default filters. Records are written
+in the order of geonameid, so records may come before their parents
+like in GeoNames dumps.
+
+Output is deterministic for the same number of rows and seed.
+"""
+from __future__ import absolute_import, unicode_literals, print_function
+
+import argparse
+import bisect
+import collections
+import datetime
+import io
+import os
+import random
+import zipfile
+
+from django.utils import six
+
+FILES = collections.OrderedDict((
+    ('objects', ('dump', 'allCountries.zip')),
+    ('hierarchy', ('dump', 'hierarchy.zip')),
+    ('translations', ('dump', 'alternateNames.zip')),
+    ('countries', ('dump', 'countryInfo.txt')),
+    ('admin1_codes', ('dump', 'admin1CodesASCII.txt')),
+    ('admin2_codes', ('dump', 'admin2Codes.txt')),
+    ('postal_codes', ('zip', 'allCountries.zip')),
+))
+
+CONTINENTS = (
+    ('AF', 6255146, 'Africa'),
+    ('AS', 6255147, 'Asia'),
+    ('EU', 6255148, 'Europe'),
+    ('NA', 6255149, 'North America'),
+    ('SA', 6255150, 'South America'),
+    ('OC', 6255151, 'Oceania'),
+    ('AN', 6255152, 'Antarctica'),
+)
+
+Country = collections.namedtuple('Country', (
+    'code', 'iso3', 'numeric', 'fips', 'name', 'capital', 'continent',
+    'tld', 'currency_code', 'currency_name', 'phone', 'languages',
+    'timezone', 'cyrillic', 'weight'))
+
+COUNTRIES = (
+    Country('RU', 'RUS', '643', 'RS', 'Russia', 'Moscow', 'EU', '.ru',
+            'RUB', 'Ruble', '7', 'ru', 'Europe/Moscow', True, 4),
+    Country('UA', 'UKR', '804', 'UP', 'Ukraine', 'Kyiv', 'EU', '.ua',
+            'UAH', 'Hryvnia', '380', 'uk,ru-UA', 'Europe/Kiev', True, 2),
+    Country('BY', 'BLR', '112', 'BO', 'Belarus', 'Minsk', 'EU', '.by',
+            'BYN', 'Ruble', '375', 'be,ru', 'Europe/Minsk', True, 1),
+    Country('DE', 'DEU', '276', 'GM', 'Germany', 'Berlin', 'EU', '.de',
+            'EUR', 'Euro', '49', 'de', 'Europe/Berlin', False, 3),
+    Country('FR', 'FRA', '250', 'FR', 'France', 'Paris', 'EU', '.fr',
+            'EUR', 'Euro', '33', 'fr-FR', 'Europe/Paris', False, 3),
+    Country('US', 'USA', '840', 'US', 'United States', 'Washington', 'NA',
+            '.us', 'USD', 'Dollar', '1', 'en-US,es-US', 'America/New_York',
+            False, 20),
+    Country('BR', 'BRA', '076', 'BR', 'Brazil', 'Brasilia', 'SA', '.br',
+            'BRL', 'Real', '55', 'pt-BR', 'America/Sao_Paulo', False, 5),
+    Country('CN', 'CHN', '156', 'CH', 'China', 'Beijing', 'AS', '.cn',
+            'CNY', 'Yuan Renminbi', '86', 'zh-CN', 'Asia/Shanghai', False,
+            12),
+    Country('IN', 'IND', '356', 'IN', 'India', 'New Delhi', 'AS', '.in',
+            'INR', 'Rupee', '91', 'en-IN,hi', 'Asia/Kolkata', False, 10),
+    Country('NG', 'NGA', '566', 'NI', 'Nigeria', 'Abuja', 'AF', '.ng',
+            'NGN', 'Naira', '234', 'en-NG', 'Africa/Lagos', False, 3),
+    Country('AU', 'AUS', '036', 'AS', 'Australia', 'Canberra', 'OC', '.au',
+            'AUD', 'Dollar', '61', 'en-AU', 'Australia/Sydney', False, 3),
+    Country('AQ', 'ATA', '010', 'AY', 'Antarctica', '', 'AN', '.aq',
+            '', '', '', '', 'Antarctica/Troll', False, 0.1),
+)
+
+# Continents are not in any country
+NO_COUNTRY = Country('', '', '', '', '', '', '', '', '', '', '', '', '',
+                     False, 0)
+
+# (feature class, feature code, weight) of records out of skeleton
+POPULATED_PLACES = (
+    ('P', 'PPL', 90),
+    ('P', 'PPLA2', 4),
+    ('P', 'PPLA3', 3),
+    ('P', 'PPLX', 3),
+)
+OTHER_FEATURES = (
+    ('H', 'STM', 20),
+    ('T', 'MT', 10),
+    ('T', 'HLL', 10),
+    ('H', 'LK', 8),
+    ('S', 'HTL', 12),
+    ('S', 'SCH', 8),
+    ('L', 'PRK', 6),
+    ('V', 'FRST', 4),
+    ('A', 'ADM3', 4),
+)
+POPULATED_SHARE = 0.4
+# Share of populated places which are in hierarchy
+HIERARCHY_SHARE = 0.5
+
+LANGUAGES = (
+    ('', 30), ('en', 15), ('ru', 10), ('uk', 3), ('de', 5), ('fr', 5),
+    ('es', 5), ('zh', 3), ('ja', 2), ('link', 8), ('post', 3),
+    ('iata', 1),
+)
+
+LATIN_SYLLABLES = ('ka', 'ri', 'to', 'ne', 'sa', 'mo', 'lu', 'ber', 'gan',
+                   'vil', 'dor', 'sen', 'ta', 'po', 'lin', 'ham')
+# (cyrillic, transliteration)
+CYRILLIC_SYLLABLES = (
+    ('ка', 'ka'), ('ри', 'ri'), ('то', 'to'), ('не', 'ne'), ('са', 'sa'),
+    ('мо', 'mo'), ('лу', 'lu'), ('бер', 'ber'), ('ган', 'gan'),
+    ('вил', 'vil'), ('дор', 'dor'), ('сен', 'sen'), ('ово', 'ovo'),
+    ('жи', 'zhi'), ('щё', 'shchyo'), ('цы', 'tsy'),
+)
+
+MODIFICATION_DATES = (datetime.date(2010, 1, 1), datetime.date(2016, 6, 1))
+
+# Below that the administrative skeleton dominates the file
+MIN_ROWS = 1000
+
+
+def parse_size(value):
+    """
+    Number of rows from string like ``10000``, ``10k`` or ``1M``.
+    """
+    value = value.strip().lower()
+    multiplier = 1
+    if value[-1:] in ('k', 'm'):
+        multiplier = 1000 if value[-1] == 'k' else 1000000
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+
+def get_path(directory, name):
+    return os.path.join(directory, *FILES[name])
+
+
+class WeightedChoice(object):
+
+    def __init__(self, rng, items, weights):
+        self.rng = rng
+        self.items = list(items)
+        self.cumulative = []
+        total = 0
+        for weight in weights:
+            total += weight
+            self.cumulative.append(total)
+        self.total = total
+
+    def __call__(self):
+        position = self.rng.random() * self.total
+        return self.items[bisect.bisect_right(self.cumulative, position)]
+
+
+class DumpGenerator(object):
+    """
+    Writes synthetic dumps of ``rows`` GeoNames records to ``directory``
+    with GeoNames layout of files (see ``FILES``). Alternate names and
+    postal codes are generated at ``translations_ratio`` and
+    ``postal_codes_ratio`` of number of records.
+    """
+    def __init__(self, directory, rows, seed=0, translations_ratio=1.3,
+                 postal_codes_ratio=0.1):
+        if rows < MIN_ROWS:
+            raise ValueError('At least {0} rows are required.'.format(
+                MIN_ROWS))
+        self.directory = directory
+        self.rows = rows
+        self.seed = seed
+        self.translations_ratio = translations_ratio
+        self.postal_codes_ratio = postal_codes_ratio
+        self.rng = random.Random(seed)
+        self.country = WeightedChoice(
+            self.rng, COUNTRIES, [c.weight for c in COUNTRIES])
+        self.populated_place = WeightedChoice(
+            self.rng, POPULATED_PLACES, [f[2] for f in POPULATED_PLACES])
+        self.other_feature = WeightedChoice(
+            self.rng, OTHER_FEATURES, [f[2] for f in OTHER_FEATURES])
+        self.language = WeightedChoice(
+            self.rng, LANGUAGES, [language[1] for language in LANGUAGES])
+        self.skeleton = []
+        self.divisions = {}
+        self.alternate_name_id = 0
+
+    def generate(self):
+        """
+        Writes all files and returns dictionary of their paths.
+        """
+        for subdirectory in set(path for path, _ in FILES.values()):
+            path = os.path.join(self.directory, subdirectory)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        self.build_skeleton()
+        self.write_objects()
+        self.write_countries()
+        self.write_admin_codes()
+        self.write_postal_codes()
+        return dict((name, get_path(self.directory, name)) for name in FILES)
+
+    def open_text(self, path):
+        return io.open(path, 'w', encoding='utf-8', newline='\n')
+
+    def write_row(self, f, values):
+        f.write('\t'.join(six.text_type(v) for v in values))
+        f.write('\n')
+
+    def compress(self, name):
+        """
+        Moves text file of dump to zip archive like GeoNames does.
+        """
+        path = get_path(self.directory, name)
+        text_path = os.path.splitext(path)[0] + '.txt'
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED,
+                             allowZip64=True) as zfile:
+            zfile.write(text_path, os.path.basename(text_path))
+        os.remove(text_path)
+
+    def get_name(self, cyrillic=False):
+        syllables = self.rng.randint(2, 4)
+        if cyrillic:
+            parts = [self.rng.choice(CYRILLIC_SYLLABLES)
+                     for _ in range(syllables)]
+            name = ''.join(p[0] for p in parts).capitalize()
+            asciiname = ''.join(p[1] for p in parts).capitalize()
+        else:
+            name = ''.join(self.rng.choice(LATIN_SYLLABLES)
+                           for _ in range(syllables)).capitalize()
+            asciiname = name
+        return name, asciiname
+
+    def get_date(self):
+        start, end = MODIFICATION_DATES
+        days = self.rng.randint(0, (end - start).days)
+        return (start + datetime.timedelta(days=days)).strftime('%Y-%m-%d')
+
+    def get_record(self, geonameid, country, feature_class, feature_code,
+                   admin1_code='', admin2_code='', population=0, name=None):
+        if name is None:
+            name, asciiname = self.get_name(country.cyrillic)
+        else:
+            asciiname = name
+        alternatenames = ','.join(
+            self.get_name(country.cyrillic)[1]
+            for _ in range(self.rng.choice((0, 0, 1, 2, 3))))
+        elevation = self.rng.randint(0, 3000) \
+            if self.rng.random() < 0.2 else ''
+        return (
+            geonameid, name, asciiname, alternatenames,
+            '{0:.5f}'.format(self.rng.uniform(-90, 90)),
+            '{0:.5f}'.format(self.rng.uniform(-180, 180)),
+            feature_class, feature_code, country.code, '',
+            admin1_code, admin2_code, '', '', population, elevation,
+            self.rng.randint(-10, 5000), country.timezone, self.get_date(),
+        )
+
+    def get_population(self, scale):
+        return int(min(self.rng.paretovariate(1.2), 100000) * scale)
+
+    def build_skeleton(self):
+        """
+        Continents, countries, their divisions and capitals. Builds
+        list of ``(record, parent geonameid)`` and divisions of
+        countries in ``divisions``.
+        """
+        countries = len(COUNTRIES)
+        admin1_count = max(countries, self.rows * 4 // 10000)
+        admin2_count = max(admin1_count, self.rows * 4 // 1000)
+        top = self.rows * 2
+        ids = iter(self.rng.sample(
+            six.moves.range(2, top), countries * 2 + admin1_count +
+            admin2_count))
+
+        continents = {}
+        for code, geonameid, name in CONTINENTS:
+            continents[code] = geonameid
+            self.skeleton.append((self.get_record(
+                geonameid, NO_COUNTRY, 'L', 'CONT', name=name), None))
+
+        # Every country has at least one division of every level
+        weights = [c.weight for c in COUNTRIES]
+        total_weight = float(sum(weights))
+        admin1 = {}
+        for country in COUNTRIES:
+            geonameid = next(ids)
+            self.skeleton.append((self.get_record(
+                geonameid, country, 'A', 'PCLI',
+                population=self.get_population(100000),
+                name=country.name), continents[country.continent]))
+            admin1[country.code] = geonameid
+            self.divisions[country.code] = []
+        spare = admin1_count - countries
+        admin1_codes = []
+        for country in COUNTRIES:
+            count = 1 + int(spare * country.weight / total_weight)
+            for code in range(1, count + 1):
+                admin1_codes.append((country, '{0:02d}'.format(code)))
+
+        admin1_ids = []
+        for country, code in admin1_codes:
+            geonameid = next(ids)
+            self.skeleton.append((self.get_record(
+                geonameid, country, 'A', 'ADM1', admin1_code=code,
+                population=self.get_population(10000)),
+                admin1[country.code]))
+            admin1_ids.append((country, code, geonameid))
+
+        for i in range(max(admin2_count, len(admin1_ids))):
+            if i < len(admin1_ids):
+                country, code, parent = admin1_ids[i]
+            else:
+                country, code, parent = self.rng.choice(admin1_ids)
+            admin2_code = '{0:03d}'.format(
+                len(self.divisions[country.code]) + 1)
+            geonameid = next(ids)
+            record = self.get_record(
+                geonameid, country, 'A', 'ADM2', admin1_code=code,
+                admin2_code=admin2_code,
+                population=self.get_population(1000))
+            self.skeleton.append((record, parent))
+            self.divisions[country.code].append(record)
+
+        for country in COUNTRIES:
+            division = self.divisions[country.code][0]
+            geonameid = next(ids)
+            self.skeleton.append((self.get_record(
+                geonameid, country, 'P', 'PPLC', admin1_code=division[10],
+                admin2_code=division[11],
+                population=self.get_population(100000),
+                name=country.capital or country.name), division[0]))
+        self.skeleton.sort(key=lambda item: item[0][0])
+
+    def get_bulk_records(self):
+        """
+        Yields ``(record, parent geonameid or None)`` of records out of
+        skeleton with geonameids between geonameids of skeleton.
+        """
+        reserved = set(record[0] for record, _ in self.skeleton)
+        geonameid = 1
+        for _ in range(self.rows - len(self.skeleton)):
+            geonameid += self.rng.randint(1, 2)
+            while geonameid in reserved:
+                geonameid += 1
+            country = self.country()
+            division = self.rng.choice(self.divisions[country.code])
+            if self.rng.random() < POPULATED_SHARE:
+                feature_class, feature_code, _ = self.populated_place()
+                population = self.get_population(10)
+                parent = division[0] \
+                    if self.rng.random() < HIERARCHY_SHARE else None
+            else:
+                feature_class, feature_code, _ = self.other_feature()
+                population = 0
+                parent = None
+            yield self.get_record(
+                geonameid, country, feature_class, feature_code,
+                admin1_code=division[10], admin2_code=division[11],
+                population=population), parent
+
+    def get_records(self):
+        """
+        Merges skeleton and the rest of records in the order of
+        geonameid.
+        """
+        skeleton = iter(self.skeleton)
+        pending = next(skeleton, None)
+        for item in self.get_bulk_records():
+            while pending is not None and pending[0][0] < item[0][0]:
+                yield pending
+                pending = next(skeleton, None)
+            yield item
+        while pending is not None:
+            yield pending
+            pending = next(skeleton, None)
+
+    def write_objects(self):
+        """
+        Writes records, hierarchy and alternate names of records.
+        """
+        objects = self.open_text(
+            os.path.splitext(get_path(self.directory, 'objects'))[0] + '.txt')
+        hierarchy = self.open_text(
+            os.path.splitext(get_path(self.directory, 'hierarchy'))[0] +
+            '.txt')
+        translations = self.open_text(
+            os.path.splitext(get_path(self.directory, 'translations'))[0] +
+            '.txt')
+        with objects, hierarchy, translations:
+            for record, parent in self.get_records():
+                self.write_row(objects, record)
+                if parent is not None:
+                    self.write_row(hierarchy, (parent, record[0], 'ADM'))
+                self.write_translations(translations, record)
+        for name in ('objects', 'hierarchy', 'translations'):
+            self.compress(name)
+
+    def write_translations(self, f, record):
+        # Mean number of names per record is translations_ratio
+        if self.rng.random() < 0.45:
+            return
+        count = self.rng.randint(
+            1, max(1, int(round(self.translations_ratio / 0.55 * 2 - 1))))
+        for _ in range(count):
+            language = self.language()[0]
+            if language == 'link':
+                name = 'https://en.wikipedia.org/wiki/' + record[2]
+            elif language == 'post':
+                name = '{0:06d}'.format(self.rng.randint(0, 999999))
+            elif language == 'iata':
+                name = record[2][:3].upper()
+            else:
+                name = self.get_name(language in ('ru', 'uk'))[0]
+            self.alternate_name_id += 1
+            self.write_row(f, (
+                self.alternate_name_id, record[0], language, name,
+                '1' if self.rng.random() < 0.1 else '',
+                '1' if self.rng.random() < 0.05 else '',
+                '1' if self.rng.random() < 0.02 else '',
+                '1' if self.rng.random() < 0.03 else '',
+            ))
+
+    def write_countries(self):
+        geonameids = dict((record[8], record[0]) for record, _ in
+                          self.skeleton if record[7] == 'PCLI')
+        with self.open_text(get_path(self.directory, 'countries')) as f:
+            f.write('# GeoNames.org Country Information\n'
+                    '# Synthetic data for benchmarks\n')
+            f.write('#ISO\tISO3\tISO-Numeric\tfips\tCountry\tCapital\t'
+                    'Area(in sq km)\tPopulation\tContinent\ttld\t'
+                    'CurrencyCode\tCurrencyName\tPhone\tPostal Code Format\t'
+                    'Postal Code Regex\tLanguages\tgeonameid\tneighbours\t'
+                    'EquivalentFipsCode\n')
+            for country in COUNTRIES:
+                neighbours = ','.join(
+                    c.code for c in COUNTRIES
+                    if c.continent == country.continent and c is not country)
+                self.write_row(f, (
+                    country.code, country.iso3, country.numeric, country.fips,
+                    country.name, country.capital,
+                    self.rng.randint(1000, 17000000),
+                    self.get_population(100000), country.continent,
+                    country.tld, country.currency_code, country.currency_name,
+                    country.phone, '######', r'^(\d{6})$', country.languages,
+                    geonameids[country.code], neighbours, '',
+                ))
+
+    def write_admin_codes(self):
+        admin1 = self.open_text(get_path(self.directory, 'admin1_codes'))
+        admin2 = self.open_text(get_path(self.directory, 'admin2_codes'))
+        rows = {admin1: [], admin2: []}
+        for record, _ in self.skeleton:
+            if record[7] == 'ADM1':
+                code = '{0}.{1}'.format(record[8], record[10])
+                rows[admin1].append((code, record[1], record[2], record[0]))
+            elif record[7] == 'ADM2':
+                code = '{0}.{1}.{2}'.format(record[8], record[10], record[11])
+                rows[admin2].append((code, record[1], record[2], record[0]))
+        with admin1, admin2:
+            # GeoNames files are sorted by code
+            for f, codes in rows.items():
+                for row in sorted(codes):
+                    self.write_row(f, row)
+
+    def write_postal_codes(self):
+        names = dict((record[0], record[1]) for record, _ in self.skeleton)
+        admin1_names = dict(((r[8], r[10]), r[1]) for r, _ in self.skeleton
+                            if r[7] == 'ADM1')
+        path = get_path(self.directory, 'postal_codes')
+        with self.open_text(os.path.splitext(path)[0] + '.txt') as f:
+            for i in range(int(self.rows * self.postal_codes_ratio)):
+                country = self.country()
+                division = self.rng.choice(self.divisions[country.code])
+                accuracy = self.rng.choice(('', 1, 4, 4, 6))
+                self.write_row(f, (
+                    country.code, '{0:06d}'.format(i),
+                    self.get_name(country.cyrillic)[0],
+                    admin1_names[(country.code, division[10])], division[10],
+                    names[division[0]], division[11], '', '',
+                    '{0:.4f}'.format(self.rng.uniform(-90, 90)),
+                    '{0:.4f}'.format(self.rng.uniform(-180, 180)), accuracy,
+                ))
+        self.compress('postal_codes')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate synthetic GeoNames dumps.')
+    parser.add_argument('directory')
+    parser.add_argument('--rows', type=parse_size, default=parse_size('10k'),
+                        help='Number of GeoNames records, e.g. 10k or 1M '
+                             '(default: 10k)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    paths = DumpGenerator(args.directory, args.rows, seed=args.seed).generate()
+    for name in FILES:
+        print(name, paths[name])
+
+
+if __name__ == '__main__':
+    main()
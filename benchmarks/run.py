@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of import of synthetic GeoNames dumps (see
+``benchmarks.generator``) by ``smartgeonames`` management command::
+
+    python -m benchmarks.run --sizes 10k,1M --output results.json
+    python -m benchmarks.run --sizes 10k,1M --baseline results.json
+
+Every size is imported in every memory mode with and without Pandas,
+every import into a fresh database. Rows per second and peak RSS are
+taken from statistics of import stages, peak RSS of the import is the
+largest process peak reported by its stages. With ``--baseline`` run fails
+if some of results is slower or uses more memory than in baseline
+results by more than ``--tolerance``.
+
+Generated dumps are kept in ``--workdir`` and reused by next runs.
+"""
+from __future__ import absolute_import, unicode_literals, print_function
+
+import argparse
+import json
+import os
+import platform
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import DumpGenerator, parse_size
+
+MEMORY_MODES = ('low', 'normal', 'max')
+DATABASES = ('spatialite', 'postgis')
+
+MANAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      'manage.py')
+WORKDIR = os.path.join(tempfile.gettempdir(), 'smartgeonames-benchmarks')
+
+
+def get_dataset(workdir, rows, seed=0):
+    """
+    Returns directory of generated dumps, generates them once.
+    """
+    directory = os.path.join(workdir, 'dataset-{0}-{1}'.format(rows, seed))
+    marker = os.path.join(directory, '.generated')
+    if not os.path.exists(marker):
+        print('Generate {0} rows to {1}'.format(rows, directory))
+        DumpGenerator(directory, rows, seed=seed).generate()
+        open(marker, 'w').close()
+    return directory
+
+
+def manage(env, *args):
+    subprocess.check_call((sys.executable, MANAGE) + args, env=env)
+
+
+def get_key(result):
+    return '{0}/{1}/{2}/{3}'.format(
+        result['size'], result['memory_mode'],
+        'csv' if result['without_pandas'] else 'pandas', result['database'])
+
+
+def run_import(workdir, dataset, size, memory_mode, without_pandas,
+               database, command_args=()):
+    data_dir = tempfile.mkdtemp(prefix='run-', dir=workdir)
+    env = dict(os.environ,
+               SMART_GEONAMES_BENCHMARK_DATASET=dataset,
+               SMART_GEONAMES_BENCHMARK_DATA_DIR=data_dir,
+               SMART_GEONAMES_BENCHMARK_DB=database)
+    report_path = os.path.join(data_dir, 'report.json')
+    args = ['smartgeonames', '--memory-mode', memory_mode,
+            '--stats-file', report_path]
+    if without_pandas:
+        args.append('--without-pandas')
+    args.extend(command_args)
+    try:
+        manage(env, 'migrate', '--noinput', '-v', '0')
+        if database == 'postgis':
+            manage(env, 'flush', '--noinput', '-v', '0')
+        started = time.time()
+        manage(env, *args)
+        wall_time = time.time() - started
+        with open(report_path) as f:
+            report = json.load(f)
+    finally:
+        shutil.rmtree(data_dir)
+    rows = sum(stage['records'] for stage in report['stages'])
+    return {
+        'size': size,
+        'memory_mode': memory_mode,
+        'without_pandas': without_pandas,
+        'database': database,
+        'command_args': list(command_args),
+        'rows': rows,
+        'duration': report['duration'],
+        'wall_time': wall_time,
+        'rows_per_second': rows / report['duration'],
+        'peak_rss': max(stage['max_rss'] for stage in report['stages']),
+        'stages': report['stages'],
+    }
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Returns list of regressions of results against baseline results.
+    """
+    previous = dict((get_key(result), result) for result in baseline)
+    regressions = []
+    for result in results:
+        key = get_key(result)
+        if key not in previous:
+            continue
+        rate = previous[key]['rows_per_second']
+        if result['rows_per_second'] < rate * (1 - tolerance):
+            regressions.append('{0}: {1:.0f} rows/s, was {2:.0f}'.format(
+                key, result['rows_per_second'], rate))
+        rss = previous[key]['peak_rss']
+        if result['peak_rss'] > rss * (1 + tolerance):
+            regressions.append('{0}: peak RSS {1:.1f} MB, was {2:.1f}'.format(
+                key, result['peak_rss'] / 1024.0 / 1024.0,
+                rss / 1024.0 / 1024.0))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark import of synthetic GeoNames dumps.')
+    parser.add_argument(
+        '--sizes', default='10k',
+        help='Comma-separated numbers of GeoNames records, e.g. 10k,1M,10M '
+             '(default: 10k)')
+    parser.add_argument(
+        '--memory-modes', default=','.join(MEMORY_MODES),
+        help='Comma-separated memory modes (default: all)')
+    parser.add_argument(
+        '--parsers', choices=('both', 'pandas', 'csv'), default='both',
+        help='Run with Pandas, without it (--without-pandas) or both '
+             '(default: both)')
+    parser.add_argument(
+        '--database', choices=DATABASES, default='spatialite',
+        help='Database of imports (default: spatialite)')
+    parser.add_argument(
+        '--command-args', default='',
+        help='Extra arguments of smartgeonames command, '
+             'e.g. --command-args="--backend copy -j 4"')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--workdir', default=WORKDIR,
+        help='Directory of generated dumps (default: %s)' % WORKDIR)
+    parser.add_argument('--output', help='Write results to JSON file')
+    parser.add_argument('--baseline',
+                        help='JSON file of previous results to compare with')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.1,
+        help='Allowed slowdown and memory growth against baseline '
+             '(default: 0.1)')
+    args = parser.parse_args()
+
+    parsers = {
+        'both': (False, True),
+        'pandas': (False,),
+        'csv': (True,),
+    }[args.parsers]
+    command_args = shlex.split(args.command_args)
+    if not os.path.isdir(args.workdir):
+        os.makedirs(args.workdir)
+
+    results = []
+    for size in [parse_size(s) for s in args.sizes.split(',')]:
+        dataset = get_dataset(args.workdir, size, args.seed)
+        for memory_mode in args.memory_modes.split(','):
+            for without_pandas in parsers:
+                result = run_import(args.workdir, dataset, size, memory_mode,
+                                    without_pandas, args.database,
+                                    command_args)
+                results.append(result)
+                print('{0}: {1:.0f} rows/s, peak RSS {2:.1f} MB'.format(
+                    get_key(result), result['rows_per_second'],
+                    result['peak_rss'] / 1024.0 / 1024.0))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
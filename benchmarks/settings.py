@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Django settings of benchmark runs, see ``benchmarks.run``.
+
+Database is SpatiaLite in data directory of run or local PostGIS
+if ``SMART_GEONAMES_BENCHMARK_DB`` is ``postgis`` (connection is set
+by ``PGDATABASE``, ``PGUSER``, ``PGPASSWORD``, ``PGHOST`` and ``PGPORT``).
+"""
+import os
+
+from benchmarks.generator import get_path
+
+DATASET_DIR = os.environ['SMART_GEONAMES_BENCHMARK_DATASET']
+SMART_GEONAMES_DATA_DIR = os.environ['SMART_GEONAMES_BENCHMARK_DATA_DIR']
+
+SECRET_KEY = 'benchmarks'
+DEBUG = False
+USE_TZ = True
+LANGUAGE_CODE = 'ru'
+
+INSTALLED_APPS = (
+    'django.contrib.contenttypes',
+    'django.contrib.auth',
+    'django.contrib.gis',
+    'smartgeonames',
+)
+
+if os.environ.get('SMART_GEONAMES_BENCHMARK_DB') == 'postgis':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.contrib.gis.db.backends.postgis',
+            'NAME': os.environ.get('PGDATABASE', 'smartgeonames_benchmarks'),
+            'USER': os.environ.get('PGUSER', ''),
+            'PASSWORD': os.environ.get('PGPASSWORD', ''),
+            'HOST': os.environ.get('PGHOST', ''),
+            'PORT': os.environ.get('PGPORT', ''),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.contrib.gis.db.backends.spatialite',
+            'NAME': os.path.join(SMART_GEONAMES_DATA_DIR, 'db.sqlite3'),
+        }
+    }
+    if os.environ.get('SPATIALITE_LIBRARY_PATH'):
+        SPATIALITE_LIBRARY_PATH = os.environ['SPATIALITE_LIBRARY_PATH']
+
+SMART_GEONAMES_OBJECTS_FILE_LOCAL_PATH = get_path(DATASET_DIR, 'objects')
+SMART_GEONAMES_HIERARCHY_FILE_LOCAL_PATH = get_path(DATASET_DIR, 'hierarchy')
+SMART_GEONAMES_TRANSLATIONS_FILE_LOCAL_PATH = \
+    get_path(DATASET_DIR, 'translations')
+SMART_GEONAMES_COUNTRIES_FILE_LOCAL_PATH = get_path(DATASET_DIR, 'countries')
+SMART_GEONAMES_ADMIN1_CODES_FILE_LOCAL_PATH = \
+    get_path(DATASET_DIR, 'admin1_codes')
+SMART_GEONAMES_ADMIN2_CODES_FILE_LOCAL_PATH = \
+    get_path(DATASET_DIR, 'admin2_codes')
+SMART_GEONAMES_POSTAL_CODES_FILE_LOCAL_PATH = \
+    get_path(DATASET_DIR, 'postal_codes')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'smartgeonames': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
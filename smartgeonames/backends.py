@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals, print_function
+
+import io
+import logging
+
+from django.contrib.gis.db.models import GeometryField
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import AutoField
+from django.utils import six
+
+from smartgeonames import settings
+from smartgeonames.instrumentation import WRITE, timed
+
+BATCH_SIZE = settings.BATCH_SIZE
+
+logger = logging.getLogger("smartgeonames")
+
+
+class OrmBackend(object):
+    """
+    Ingestion backend based on Django ORM ``bulk_create``.
+    Works with any database.
+    """
+    name = 'orm'
+
+    def __init__(self, batch_size=BATCH_SIZE, using=DEFAULT_DB_ALIAS):
+        self.batch_size = batch_size
+        self.using = using
+
+    @timed(WRITE)
+    def bulk_insert(self, model, objects):
+        model._default_manager.using(self.using).bulk_create(
+            objects, batch_size=self.batch_size)
+
+    @classmethod
+    def is_supported(cls, using=DEFAULT_DB_ALIAS):
+        return True
+
+
+class CopyBackend(OrmBackend):
+    """
+    Ingestion backend based on PostgreSQL ``COPY ... FROM STDIN``.
+    Geometries are sent as hex-encoded EWKB.
+    """
+    name = 'copy'
+    null = '\\N'
+    escapes = (
+        ('\\', '\\\\'),
+        ('\t', '\\t'),
+        ('\n', '\\n'),
+        ('\r', '\\r'),
+    )
+
+    @classmethod
+    def is_supported(cls, using=DEFAULT_DB_ALIAS):
+        return connections[using].vendor == 'postgresql'
+
+    @timed(WRITE)
+    def bulk_insert(self, model, objects):
+        if not objects:
+            return
+        connection = connections[self.using]
+        fields = [f for f in model._meta.concrete_fields
+                  if not isinstance(f, AutoField)]
+        sql = 'COPY {0} ({1}) FROM STDIN'.format(
+            connection.ops.quote_name(model._meta.db_table),
+            ', '.join(connection.ops.quote_name(f.column) for f in fields)
+        )
+        stream = io.StringIO()
+        for obj in objects:
+            stream.write('\t'.join(
+                self.to_copy_value(f, obj, connection) for f in fields
+            ))
+            stream.write('\n')
+        stream.seek(0)
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(sql, stream)
+
+    def to_copy_value(self, field, obj, connection):
+        value = field.pre_save(obj, True)
+        if value is None:
+            return self.null
+        if isinstance(field, GeometryField):
+            if value.srid is None:
+                value = value.clone()
+                value.srid = field.srid
+            hexewkb = value.hexewkb
+            if isinstance(hexewkb, bytes):
+                hexewkb = hexewkb.decode('ascii')
+            return hexewkb
+        value = field.get_db_prep_save(value, connection)
+        if value is None:
+            return self.null
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        value = six.text_type(value)
+        for char, escaped in self.escapes:
+            value = value.replace(char, escaped)
+        return value
+
+
+BACKENDS = {
+    OrmBackend.name: OrmBackend,
+    CopyBackend.name: CopyBackend,
+}
+
+
+def get_backend(name, batch_size=BATCH_SIZE, using=DEFAULT_DB_ALIAS):
+    backend_class = BACKENDS[name]
+    if not backend_class.is_supported(using):
+        logger.warning('Backend "%s" is not supported by database "%s". '
+                       'Fallback to "%s".',
+                       name, using, OrmBackend.name)
+        backend_class = OrmBackend
+    return backend_class(batch_size=batch_size, using=using)
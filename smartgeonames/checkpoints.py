@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals, print_function
+
+import errno
+import logging
+import os
+
+from django.utils.six.moves import cPickle as pickle
+
+from smartgeonames import settings
+
+CHECKPOINT_INTERVAL = settings.CHECKPOINT_INTERVAL
+
+logger = logging.getLogger("smartgeonames")
+
+
+class CheckpointError(Exception):
+    pass
+
+
+class Checkpoint(object):
+    """
+    Saved state of import stages, one file per stage in ``directory``.
+
+    State is written to temporary file before ``commit()`` of records
+    it describes and renamed after it. Temporary file left by crash
+    between them is accepted on load only if ``verify(state)`` confirms
+    that its records are committed.
+
+    Changes since the previous save may be appended to journal of stage
+    instead of saving the whole state every time. State keeps the size
+    of journal it includes and loaded state gets its entries in
+    ``journal``, entries of rejected state are truncated.
+    """
+    suffix = '.checkpoint'
+    journal_suffix = '.journal'
+
+    def __init__(self, directory, interval=CHECKPOINT_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+
+    def get_path(self, name):
+        return os.path.join(self.directory, name + self.suffix)
+
+    def get_journal_path(self, name):
+        return os.path.join(self.directory, name + self.journal_suffix)
+
+    def load(self, name, verify=None):
+        path = self.get_path(name)
+        partial = path + '.part'
+        if os.path.exists(partial):
+            state = self.read(partial)
+            if state is not None and (verify is None or verify(state)):
+                os.rename(partial, path)
+            else:
+                os.remove(partial)
+        state = self.read(path) if os.path.exists(path) else None
+        size = state.get('journal_size') if state is not None else None
+        self.truncate_journal(name, size)
+        if size is not None:
+            state['journal'] = self.read_journal(name, size)
+            if state['journal'] is None:
+                return None
+        return state
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            try:
+                return pickle.load(f)
+            except (EOFError, pickle.UnpicklingError):
+                logger.warning('Checkpoint %s is broken, ignored.', path)
+                return None
+
+    def read_journal(self, name, size):
+        path = self.get_journal_path(name)
+        entries = []
+        try:
+            with open(path, 'rb') as f:
+                while f.tell() < size:
+                    entries.append(pickle.load(f))
+        except (IOError, EOFError, pickle.UnpicklingError):
+            logger.warning('Checkpoint journal %s is broken, ignored.', path)
+            return None
+        return entries
+
+    def truncate_journal(self, name, size):
+        path = self.get_journal_path(name)
+        if not os.path.exists(path):
+            return
+        if not size:
+            os.remove(path)
+            return
+        with open(path, 'r+b') as f:
+            f.truncate(size)
+
+    def append_journal(self, name, entry):
+        """
+        Appends entry to journal, returns the size of journal.
+        """
+        with open(self.get_journal_path(name), 'ab') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def save(self, name, state, commit=None, journal=None):
+        self.mkdir()
+        if journal is not None:
+            state = dict(state, journal_size=self.append_journal(name,
+                                                                 journal))
+        path = self.get_path(name)
+        partial = path + '.part'
+        with open(partial, 'wb') as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            if commit:
+                commit()
+        except Exception:
+            os.remove(partial)
+            raise
+        os.rename(partial, path)
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for filename in os.listdir(self.directory):
+            if filename.endswith((self.suffix, self.suffix + '.part',
+                                  self.journal_suffix)):
+                os.remove(os.path.join(self.directory, filename))
+
+    def mkdir(self):
+        try:
+            os.makedirs(self.directory)
+        except os.error as e:
+            if e.errno != errno.EEXIST or not os.path.isdir(self.directory):
+                raise
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals, print_function
+
+import hashlib
+import io
+import logging
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+
+import requests
+from django.utils import six
+
+from smartgeonames import settings
+from smartgeonames.manifest import hash_file, makedirs
+from smartgeonames.progress import Progress
+
+DOWNLOAD_JOBS = settings.DOWNLOAD_JOBS
+
+logger = logging.getLogger("smartgeonames")
+
+
+class DownloadError(Exception):
+    """
+    Some of files are not downloaded. ``failures`` is a list of
+    ``(remote, exception)``.
+    """
+    def __init__(self, failures):
+        self.failures = failures
+        super(DownloadError, self).__init__(
+            'Download of {0} failed: {1}'.format(
+                ', '.join(remote for remote, _ in failures),
+                '; '.join(six.text_type(e) for _, e in failures)))
+
+
+class SharedProgress(object):
+    """
+    Progress of several downloads at once. Total size grows as
+    responses of downloads arrive.
+    """
+    def __init__(self, name):
+        self.progress = Progress(name, unit='bytes')
+        self.lock = threading.Lock()
+        self.done = 0
+
+    def add_total(self, size):
+        with self.lock:
+            self.progress.total = (self.progress.total or 0) + size
+
+    def advance(self, size):
+        with self.lock:
+            self.done += size
+            self.progress.update(self.done)
+
+    def finish(self):
+        self.progress.finish()
+
+
+class Downloader(object):
+    """
+    Downloads GeoNames files and records them in ``manifest`` (see
+    ``manifest.Manifest``) with their SHA-256. Files which are
+    downloaded before and not changed locally are requested
+    conditionally by their ETag and Last-Modified, so unchanged files
+    are not transferred.
+
+    File is written to ``<local>.part`` and renamed to ``local`` when it
+    is complete. Download interrupted by error is resumed from the size
+    of ``.part`` file by Range request next time, if the remote file
+    is not changed since (its ETag is kept in ``<local>.part.etag``).
+
+    ``download_all`` downloads files concurrently by ``jobs`` threads.
+    """
+    chunk_size = 1024 * 1024
+
+    def __init__(self, manifest, jobs=DOWNLOAD_JOBS):
+        self.manifest = manifest
+        self.jobs = jobs
+
+    def get_conditions(self, remote, local):
+        headers = {}
+        entry = self.manifest.get_file(remote)
+        if entry is None or entry['local'] != local or \
+                not self.manifest.verify(local):
+            return headers
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def get_resume_offset(self, partial):
+        """
+        Returns size and ETag of partially downloaded file.
+        """
+        etag_path = partial + '.etag'
+        if not os.path.exists(partial) or not os.path.exists(etag_path):
+            return 0, None
+        with io.open(etag_path, encoding='utf-8') as f:
+            etag = f.read().strip()
+        return os.path.getsize(partial), etag or None
+
+    def download(self, remote, local, progress=None):
+        makedirs(os.path.dirname(os.path.abspath(local)))
+        partial = local + '.part'
+        headers = self.get_conditions(remote, local)
+        offset, partial_etag = self.get_resume_offset(partial)
+        if offset and partial_etag:
+            headers['Range'] = 'bytes={0}-'.format(offset)
+            headers['If-Range'] = partial_etag
+
+        r = requests.get(remote, stream=True, headers=headers)
+        try:
+            if r.status_code == 304:
+                logger.info('File %s is up-to-date (Etag: %s).', local,
+                            headers.get('If-None-Match'))
+                self.remove_partial(partial)
+                return local
+            if r.status_code == 416:
+                # Partial file is not a prefix of remote file anymore
+                self.remove_partial(partial)
+                return self.download(remote, local, progress)
+            r.raise_for_status()
+
+            if r.status_code == 206:
+                logger.info('Resume download of %s from %s bytes',
+                            remote, offset)
+                mode = 'ab'
+                sha256 = hash_file(partial)
+            else:
+                offset = 0
+                mode = 'wb'
+                sha256 = hashlib.sha256()
+            length = int(r.headers.get('content-length', 0))
+            total_length = offset + length
+            etag = r.headers.get('etag')
+            with io.open(partial + '.etag', 'w', encoding='utf-8') as f:
+                f.write(six.text_type(etag or ''))
+
+            logger.info('Download of %s in progress, size: %s bytes',
+                        remote, total_length)
+            own_progress = progress is None
+            if own_progress:
+                progress = SharedProgress(os.path.basename(local))
+            progress.add_total(length)
+            with open(partial, mode) as f:
+                for chunk in r.iter_content(chunk_size=self.chunk_size):
+                    if chunk:
+                        f.write(chunk)
+                        sha256.update(chunk)
+                        progress.advance(len(chunk))
+            if own_progress:
+                progress.finish()
+            size = os.path.getsize(partial)
+            if length and size != total_length:
+                raise IOError('Download of {0} is incomplete: {1} of {2} '
+                              'bytes.'.format(remote, size, total_length))
+            os.rename(partial, local)
+            os.remove(partial + '.etag')
+            self.manifest.add_file(
+                remote, local, etag=etag, size=size,
+                sha256=sha256.hexdigest(),
+                last_modified=r.headers.get('last-modified'),
+                date=r.headers.get('date'))
+        finally:
+            r.close()
+        return local
+
+    def remove_partial(self, partial):
+        for path in (partial, partial + '.etag'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def download_all(self, files):
+        """
+        Downloads list of ``(remote, local)`` files. Failed download
+        does not stop others, ``DownloadError`` is raised when all of
+        them are finished. Returns dictionary of local paths by URL.
+        """
+        progress = SharedProgress('download')
+        pool = ThreadPool(max(1, min(self.jobs, len(files))))
+        paths = {}
+        failures = []
+        try:
+            results = [
+                pool.apply_async(self.download, (remote, local, progress))
+                for remote, local in files
+            ]
+            for (remote, local), result in six.moves.zip(files, results):
+                try:
+                    paths[remote] = result.get()
+                except Exception as e:
+                    logger.error('Download of %s failed: %s', remote, e)
+                    failures.append((remote, e))
+        finally:
+            pool.close()
+            pool.join()
+        progress.finish()
+        if failures:
+            raise DownloadError(failures)
+        return paths
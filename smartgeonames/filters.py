@@ -1,36 +1,139 @@
 # -*- coding: utf-8 -*-
-import shutil
-import tempfile
+from __future__ import unicode_literals
+
+import numpy
+from django.utils import six
 
 from smartgeonames import settings
 
-OBJECTS_FILTER = settings.OBJECTS_FILTER
 
+# Pre-processors are streaming stages: each of them takes an iterator
+# of lines (bytes) of source file and yields lines. They are composed
+# in the order of ``pre_processors`` of stage.
 
-def comment_stripper(iterator):
-    for line in iterator:
-        if line[:1] == '#':
+def remove_comments(lines):
+    for line in lines:
+        if line[:1] == b'#':
             continue
+        yield line
+
+
+def remove_blank_lines(lines):
+    for line in lines:
         if not line.strip():
             continue
         yield line
 
 
-def remove_comments(filepath):
-    tmp = tempfile.NamedTemporaryFile(mode='wb', delete=True)
-    source = open(filepath, 'rb')
-    try:
-        for line in comment_stripper(source):
-            tmp.write(line)
-            tmp.flush()
-    finally:
-        source.close()
-        shutil.copy2(tmp.name, filepath)
-        tmp.close()
-
-
-def objects_filter(data):
-    result = []
-    for filter_key, lambda_filter in OBJECTS_FILTER.iteritems():
-        result.append(lambda_filter(data[filter_key]))
-    return all(result)
\ No newline at end of file
+def fix_encoding(lines, encoding='utf-8'):
+    """
+    Re-encodes lines to UTF-8 replacing undecodable bytes
+    and drops byte order mark.
+    """
+    for number, line in enumerate(lines):
+        line = line.decode(encoding, 'replace')
+        if number == 0:
+            line = line.lstrip('\ufeff')
+        yield line.encode('utf-8')
+
+
+class DataFilter(object):
+    """
+    Filter of parsed records by the dictionary from settings
+    ``{column: predicate}``. Predicate is a function of column value
+    or a collection of accepted values.
+
+    Filter is referenced by the name of settings attribute, so it
+    may be sent to worker processes even if predicates are lambdas.
+    Predicates of ``ignored`` columns are not checked.
+    """
+    def __init__(self, setting_name, ignored=(), restrictions=None):
+        self.setting_name = setting_name
+        self.ignored = tuple(ignored)
+        self.restrictions = dict(restrictions or {})
+
+    @property
+    def filters(self):
+        filters = getattr(settings, self.setting_name)
+        if self.ignored or self.restrictions:
+            filters = dict((key, predicate)
+                           for key, predicate in six.iteritems(filters)
+                           if key not in self.ignored)
+            filters.update(self.restrictions)
+        return filters
+
+    def ignore(self, *columns):
+        """
+        Returns copy of filter without predicates of ``columns``, e.g.
+        of country code for files of one country.
+        """
+        return DataFilter(self.setting_name, self.ignored + columns,
+                          self.restrictions)
+
+    def restrict(self, column, values):
+        """
+        Returns copy of filter which accepts only ``values`` of
+        ``column`` instead of its predicate from settings.
+        """
+        restrictions = dict(self.restrictions)
+        restrictions[column] = tuple(values)
+        return DataFilter(self.setting_name, self.ignored, restrictions)
+
+    def __bool__(self):
+        return bool(self.filters)
+
+    __nonzero__ = __bool__
+
+    def __call__(self, data):
+        for key, predicate in six.iteritems(self.filters):
+            value = data[key]
+            if callable(predicate):
+                if not predicate(value):
+                    return False
+            elif value not in predicate:
+                return False
+        return True
+
+    def mask(self, frame):
+        """
+        Boolean mask of accepted rows of pandas DataFrame. Predicate
+        functions are called once per unique value of column.
+        """
+        mask = numpy.ones(len(frame), dtype=bool)
+        for key, predicate in six.iteritems(self.filters):
+            column = frame[key]
+            if callable(predicate):
+                accepted = [v for v in column.unique() if predicate(v)]
+            else:
+                accepted = list(predicate)
+            mask &= column.isin(accepted).values
+        return mask
+
+
+class IdsFilter(object):
+    """
+    Filter of records by ``ids`` of ``column``, e.g. of geonameids of
+    ancestors of cities. Values are compared as parsed, so ids are
+    strings. Set of ids may be filled after the filter is created.
+    """
+    def __init__(self, ids, column='geonameid'):
+        self.ids = ids
+        self.column = column
+
+    def __bool__(self):
+        # Empty set of ids accepts nothing
+        return True
+
+    __nonzero__ = __bool__
+
+    def __call__(self, data):
+        return data[self.column] in self.ids
+
+    def mask(self, frame):
+        return frame[self.column].isin(list(self.ids)).values
+
+
+objects_filter = DataFilter('OBJECTS_FILTER')
+translations_filter = DataFilter('TRANSLATIONS_FILTER')
+countries_filter = DataFilter('COUNTRIES_FILTER')
+postal_codes_filter = DataFilter('POSTAL_CODES_FILTER')
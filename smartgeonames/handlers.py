@@ -1,97 +1,290 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals, print_function
 
-from pprint import pprint
+import logging
+import os
+import shutil
+import tempfile
+from timeit import default_timer
 
-from django.core.exceptions import ObjectDoesNotExist
-from treelib.tree import NodeIDAbsentError
+from django.utils import six
+from django.utils.six.moves import cPickle as pickle
 
 from smartgeonames import settings
-from smartgeonames.models import GeoNamesRecord
+from smartgeonames.instrumentation import TREE, timings
 
 OBJECTS_IGNORE = settings.OBJECTS_IGNORE
 HIERARCHY_TREE_ROOT = settings.HIERARCHY_TREE_ROOT
+CONTINENTS_GEONAMEIDS = settings.CONTINENTS_GEONAMEIDS
+DATA_DIR = settings.DATA_DIR
 
+logger = logging.getLogger("smartgeonames")
 
-def dummy_handler(schema, data):
-    result = schema.load(data)
-    if result.errors:
-        # print(result)
-        # print(counter, 'ERROR', row_result.errors)
-        # print(counter, ', '.join(
-        #     [f for f, m in result.errors.iteritems()]))
-        print(result)
-    return result, result.errors
-
-
-def object_handler(schema, data, tree):
-    result = schema.load(data)
-    obj = None
-
-    def create_children(node, geoname_object):
-        created = set()
-        children_to_create = node.data['children_to_create']
-        for child_id in children_to_create:
-            child_node = tree[child_id]
-            child_data = child_node.data.get('object')
-            if child_data:
-                geoname_object.add_child(**child_data)
-                created.add(child_id)
-        node.data['children_to_create'] = children_to_create - created
-
-    if not result.errors:
-        geonameid = result.data['geonameid']
-        tree_node = tree.get_node(geonameid)
-        try:
-            parent_node = tree.parent(geonameid)
-        except NodeIDAbsentError:
-            parent_node = None
-
-        if tree_node and parent_node:
-            if parent_node.identifier == HIERARCHY_TREE_ROOT:
-                node_is_created = tree_node.data.get('created', False)
-                if not node_is_created:
-                    obj = GeoNamesRecord.add_root(**result.data)
-                    tree_node.data['created'] = True
-                    create_children(tree_node, obj)
-            else:
-                parent_is_created = parent_node.data.get('created', False)
-                if parent_is_created:
-                    parent_geo_record = GeoNamesRecord.objects.get(
-                            geonameid=geonameid)
-                    obj = parent_geo_record.add_child(**result.data)
-                    tree_node.data['created'] = True
-                    create_children(tree_node, obj)
-                else:
-                    parent_node.data['children_to_create'].add(geonameid)
-                    tree_node.data['object'] = result.data
-        else:
-            print(result.data)
+
+def object_handler(data, tree, loader):
+    """
+    Creates record if its parent is created, otherwise keeps it in
+    hierarchy until the parent is created.
+    """
+    geonameid = data['geonameid']
+    started = default_timer()
+    parent_id = tree.parent(geonameid)
+    is_ready = parent_id is not None and tree.is_created(parent_id)
+    timings.add(TREE, default_timer() - started)
+    if parent_id is None:
+        logger.debug('Record is not in hierarchy: %s', data)
+        return None
+    if not is_ready:
+        tree.add_pending(parent_id, geonameid, data)
+        return None
+    if parent_id == HIERARCHY_TREE_ROOT:
+        obj = loader.add_root(**data)
     else:
-        print(data)
-        print(result)
-    return obj, result.errors
+        obj = loader.add_child(parent_id, **data)
+    tree.set_created(geonameid)
+
+    # Create waiting descendants
+    created = [geonameid]
+    while created:
+        node_id = created.pop()
+        for child_id, child_data in tree.pop_pending(node_id):
+            loader.add_child(node_id, **child_data)
+            tree.set_created(child_id)
+            created.append(child_id)
+    return obj
+
+
+def translation_handler(data, loader):
+    return loader.add(data)
+
+
+def postal_code_handler(data, loader):
+    return loader.add(data)
+
+
+def country_info_handler(data, loader):
+    return loader.add(data)
+
+
+def admin_code_handler(data, loader):
+    return loader.add(data)
+
+
+def finish_loader(loader):
+    return loader.finish()
+
+
+def level_handler(data, spool):
+    return spool.add(data)
+
+
+class LevelSpool(object):
+    """
+    Two-pass import of hierarchy. Records are spooled to temporary
+    files by their depth in hierarchy while file is parsed, then
+    ``load`` creates them level by level: roots first, then their
+    children and so on. Every record whose ancestors are imported is
+    created and nothing is kept in memory waiting for parents.
+
+    Records whose parent is not created yet stay spooled, so spool
+    shared by several stages creates them when their parent is loaded
+    by a later stage. ``close`` drops records which are still waiting
+    and removes files.
+    """
+    def __init__(self, tree, loader, directory=DATA_DIR):
+        self.tree = tree
+        self.loader = loader
+        self.directory = directory
+        self.path = None
+        self.files = {}
+        # Levels which have spooled records
+        self.levels = set()
+        self.waiting = 0
+
+    def get_path(self, level):
+        return os.path.join(self.path, '{0}.pickle'.format(level))
+
+    def add(self, data):
+        with timings.measure(TREE):
+            level = self.tree.level(data['geonameid'])
+        if level is None:
+            logger.debug('Record is not in hierarchy: %s', data)
+            return
+        if level not in self.files:
+            if self.path is None:
+                self.path = tempfile.mkdtemp(prefix='levels-',
+                                             dir=self.directory)
+            self.files[level] = open(self.get_path(level), 'ab')
+            self.levels.add(level)
+        pickle.dump(data, self.files[level], pickle.HIGHEST_PROTOCOL)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def load(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        self.waiting = 0
+        for level in sorted(self.levels):
+            path = self.get_path(level)
+            created = 0
+            orphans = []
+            for data in self.read(path):
+                geonameid = data['geonameid']
+                parent_id = self.tree.parent(geonameid)
+                if not self.tree.is_created(parent_id):
+                    orphans.append(data)
+                    continue
+                if parent_id == HIERARCHY_TREE_ROOT:
+                    self.loader.add_root(**data)
+                else:
+                    self.loader.add_child(parent_id, **data)
+                self.tree.set_created(geonameid)
+                created += 1
+            os.remove(path)
+            self.levels.discard(level)
+            for data in orphans:
+                self.add(data)
+            self.waiting += len(orphans)
+            logger.info('Level %s: %s records are created, %s records '
+                        'wait for their parents', level, created,
+                        len(orphans))
+        self.loader.finish()
 
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        if self.waiting:
+            logger.info('%s records without imported parent are skipped',
+                        self.waiting)
+        self.waiting = 0
+        self.levels = set()
+        if self.path is not None:
+            shutil.rmtree(self.path)
+            self.path = None
 
-def hierarchy_builder_handler(schema, data, tree):
+
+class HierarchyState(object):
+    """
+    Resumable state of objects import: which records of hierarchy are
+    created and which ones wait for their parents. Records of ``loader``
+    are committed together with saving of this state.
+
+    State is small, changes of hierarchy since the previous checkpoint
+    are appended to checkpoint journal, so checkpoints do not grow with
+    the size of import.
+    """
+    def __init__(self, tree, loader):
+        self.tree = tree
+        self.loader = loader
+        tree.track_changes()
+
+    def get_state(self):
+        return {'last_pk': self.loader.get_last_pk()}
+
+    def get_changes(self):
+        return self.tree.get_changes()
+
+    def set_state(self, state, journal):
+        for changes in journal:
+            self.tree.apply_changes(changes)
+
+    def commit(self):
+        self.loader.flush()
+
+    def is_committed(self, state):
+        return state['last_pk'] is None or \
+            self.loader.model.objects.filter(pk=state['last_pk']).exists()
+
+
+def hierarchy_builder_handler(data, tree):
     parent = int(data['parent'])
     child = int(data['child'])
-    default_data = {
-        'created': False,
-        'children_to_create': set(),
-        'object': {},
-    }
 
     if parent not in OBJECTS_IGNORE and child not in OBJECTS_IGNORE:
-        try:
-            if not tree.contains(parent):
-                tree.create_node(parent, parent, HIERARCHY_TREE_ROOT,
-                                 data=default_data)
-            if child != 0 and not tree.contains(child):
-                tree.create_node(child, child, parent, data=default_data)
-        except:
-            print(parent, child)
-            raise
+        tree.add_edge(parent, child)
     else:
-        print(parent, child)
-    return tree, {}
\ No newline at end of file
+        logger.debug('Ignored hierarchy edge: %s -> %s', parent, child)
+    return tree
+
+
+class CityHierarchy(object):
+    """
+    Hierarchy of cities datasets (``cities15000.zip`` etc.) resolved by
+    codes of records: continent -> country -> first-level admin division
+    -> city. Edges are added to ``tree`` from countryInfo, admin1 codes
+    and the dataset in this order, so continents are roots.
+
+    Geonameids of records which are ancestors of cities are collected
+    to ``ancestors`` (as strings, like parsed values), they are imported
+    by a separate pass before cities.
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        self.countries = {}
+        self.continents = {}
+        self.divisions = {}
+        self.ancestors = set()
+        self.cities = 0
+        self.skipped = 0
+
+    def add_country(self, data):
+        geonameid = data.get('geonameid')
+        if not geonameid:
+            return
+        self.countries[data['iso_3166_1_a2']] = geonameid
+        continent = CONTINENTS_GEONAMEIDS.get(data['continent'])
+        if continent is None:
+            self.tree.add_edge(geonameid, HIERARCHY_TREE_ROOT)
+        else:
+            self.continents[geonameid] = continent
+            self.tree.add_edge(continent, geonameid)
+
+    def add_division(self, data):
+        country_code, _, code = data['concatenated_code'].partition('.')
+        country = self.countries.get(country_code)
+        if country is None:
+            return
+        self.divisions[(country_code, code)] = data['geonameid']
+        self.tree.add_edge(country, data['geonameid'])
+
+    def add_city(self, data):
+        country_code = data['country_code']
+        country = self.countries.get(country_code)
+        if country is None:
+            logger.debug('City of unknown country: %s', data)
+            self.skipped += 1
+            return
+        ancestors = [country, self.continents.get(country)]
+        division = self.divisions.get((country_code, data['admin1_code']))
+        if division is not None:
+            ancestors.append(division)
+        self.tree.add_edge(division or country, int(data['geonameid']))
+        self.ancestors.update(six.text_type(geonameid)
+                              for geonameid in ancestors if geonameid)
+        self.cities += 1
+
+    def build(self):
+        self.tree.build()
+        logger.info('Hierarchy of cities: %s cities, %s ancestors, %s '
+                    'cities of unknown countries', self.cities,
+                    len(self.ancestors), self.skipped)
+
+
+def country_hierarchy_handler(data, hierarchy):
+    return hierarchy.add_country(data)
+
+
+def division_hierarchy_handler(data, hierarchy):
+    return hierarchy.add_division(data)
+
+
+def city_hierarchy_handler(data, hierarchy):
+    return hierarchy.add_city(data)
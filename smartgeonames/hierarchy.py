@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals, print_function
+
+import array
+import logging
+import os
+import shutil
+
+import numpy
+
+from smartgeonames import settings
+
+HIERARCHY_TREE_ROOT = settings.HIERARCHY_TREE_ROOT
+
+logger = logging.getLogger("smartgeonames")
+
+CREATED = 1
+# Created node is saved to checkpoint journal
+SAVED = 2
+
+
+class HierarchyIndex(object):
+    """
+    Compact hierarchy of GeoNames records in int32 arrays.
+
+    Edges are collected by ``add_edge`` and ``build`` turns them into
+    arrays sorted by geonameid: ids, index of parent of every node
+    (-1 for children of the virtual root ``HIERARCHY_TREE_ROOT``),
+    children of every node as offsets in ``children_index`` and status
+    flags. Nodes are found by binary search.
+
+    Node is attached to the first parent it is seen with. Node which is
+    seen as parent before it is seen as child is attached to the root,
+    so hierarchy is always a tree.
+
+    Records waiting for creation of their parents are kept in
+    ``pending`` (parent geonameid -> geonameids of children) and
+    ``objects`` (geonameid -> data of record) dictionaries. Changes of
+    them are logged after ``track_changes``, so ``get_changes`` returns
+    only what is changed since its previous call.
+
+    Built arrays may be saved to directory and memory-mapped from it
+    later, so they are loaded instantly and shared between processes.
+    """
+    arrays = ('ids', 'parents', 'offsets', 'children_index')
+
+    def __init__(self):
+        self.edges = array.array(str('i'))
+        self.ids = numpy.zeros(0, dtype=numpy.int32)
+        self.parents = numpy.zeros(0, dtype=numpy.int32)
+        self.offsets = numpy.zeros(2, dtype=numpy.int32)
+        self.children_index = numpy.zeros(0, dtype=numpy.int32)
+        self.flags = numpy.zeros(0, dtype=numpy.uint8)
+        self.pending = {}
+        self.objects = {}
+        self.changes = None
+        self.levels = None
+        self.is_built = False
+
+    def add_edge(self, parent, child):
+        self.edges.append(parent)
+        self.edges.append(child)
+        self.is_built = False
+
+    def build(self):
+        edges = numpy.frombuffer(self.edges, dtype=numpy.int32) \
+            if self.edges else numpy.zeros(0, dtype=numpy.int32)
+        # Child 0 means parent without children
+        is_node = numpy.ones(len(edges), dtype=bool)
+        is_node[1::2] = edges[1::2] != HIERARCHY_TREE_ROOT
+        positions = numpy.flatnonzero(is_node)
+        self.ids, first = numpy.unique(edges[positions], return_index=True)
+        self.ids = self.ids.astype(numpy.int32)
+        first = positions[first]
+        # Odd positions are children, their parent is just before them
+        is_child = first % 2 == 1
+        self.parents = numpy.full(len(self.ids), -1, dtype=numpy.int32)
+        self.parents[is_child] = numpy.searchsorted(
+            self.ids, edges[first[is_child] - 1])
+        self.flags = numpy.zeros(len(self.ids), dtype=numpy.uint8)
+
+        order = numpy.argsort(self.parents, kind='mergesort')
+        self.children_index = order.astype(numpy.int32)
+        # Children of node i are between offsets i + 1 and i + 2,
+        # children of the root are between offsets 0 and 1
+        self.offsets = numpy.searchsorted(
+            self.parents[order],
+            numpy.arange(-1, len(self.ids) + 1)).astype(numpy.int32)
+        self.edges = array.array(str('i'))
+        self.levels = None
+        self.is_built = True
+        logger.info('Hierarchy: %s nodes, depth %s', self.size(),
+                    self.depth())
+
+    def save(self, directory):
+        partial = directory + '.part'
+        if os.path.exists(partial):
+            shutil.rmtree(partial)
+        os.makedirs(partial)
+        for name in self.arrays:
+            numpy.save(os.path.join(partial, name + '.npy'),
+                       getattr(self, name))
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.rename(partial, directory)
+        logger.info('Hierarchy is saved to %s', directory)
+
+    def load(self, directory):
+        """
+        Memory-maps arrays saved by ``save``. Returns False if directory
+        has no saved hierarchy.
+        """
+        if not os.path.isdir(directory):
+            return False
+        for name in self.arrays:
+            setattr(self, name, numpy.load(
+                os.path.join(directory, name + '.npy'), mmap_mode='r'))
+        self.flags = numpy.zeros(len(self.ids), dtype=numpy.uint8)
+        self.edges = array.array(str('i'))
+        self.levels = None
+        self.is_built = True
+        logger.info('Hierarchy is loaded from %s: %s nodes',
+                    directory, self.size())
+        return True
+
+    def find(self, geonameid):
+        """
+        Returns index of node or None.
+        """
+        i = int(numpy.searchsorted(self.ids, geonameid))
+        if i < len(self.ids) and self.ids[i] == geonameid:
+            return i
+        return None
+
+    def contains(self, geonameid):
+        return self.find(geonameid) is not None
+
+    def parent(self, geonameid):
+        """
+        Returns geonameid of parent, ``HIERARCHY_TREE_ROOT`` for top
+        level nodes or None if node is not in hierarchy.
+        """
+        i = self.find(geonameid)
+        if i is None:
+            return None
+        parent = self.parents[i]
+        if parent < 0:
+            return HIERARCHY_TREE_ROOT
+        return int(self.ids[parent])
+
+    def children(self, geonameid):
+        if geonameid == HIERARCHY_TREE_ROOT:
+            start, end = self.offsets[0], self.offsets[1]
+        else:
+            i = self.find(geonameid)
+            if i is None:
+                return []
+            start, end = self.offsets[i + 1], self.offsets[i + 2]
+        return [int(self.ids[c]) for c in self.children_index[start:end]]
+
+    def count_children(self, geonameid):
+        i = self.find(geonameid)
+        if i is None:
+            return 0
+        return int(self.offsets[i + 2] - self.offsets[i + 1])
+
+    def is_created(self, geonameid):
+        if geonameid == HIERARCHY_TREE_ROOT:
+            return True
+        i = self.find(geonameid)
+        return i is not None and bool(self.flags[i] & CREATED)
+
+    def set_created(self, geonameid):
+        self.flags[self.find(geonameid)] |= CREATED
+
+    def add_pending(self, parent, geonameid, data):
+        self.pending.setdefault(parent, []).append(geonameid)
+        self.objects[geonameid] = data
+        if self.changes is not None:
+            self.changes.append((parent, geonameid))
+
+    def pop_pending(self, parent):
+        """
+        Returns list of ``(geonameid, data)`` of records waiting for
+        parent.
+        """
+        children = self.pending.pop(parent, ())
+        if children and self.changes is not None:
+            self.changes.append((parent, None))
+        return [(child, self.objects.pop(child)) for child in children]
+
+    def size(self):
+        # Including the virtual root
+        return len(self.ids) + 1
+
+    def depth(self):
+        levels = self.get_levels()
+        return int(levels.max()) if len(levels) else 0
+
+    def level(self, geonameid):
+        """
+        Returns depth of node (1 for top level nodes) or None if node
+        is not in hierarchy.
+        """
+        i = self.find(geonameid)
+        if i is None:
+            return None
+        return int(self.get_levels()[i])
+
+    def get_levels(self):
+        """
+        Returns array of depths of all nodes, computed once.
+        """
+        if self.levels is None:
+            is_top = self.parents < 0
+            self.levels = numpy.zeros(len(self.ids), dtype=numpy.uint8)
+            level = is_top
+            depth = 0
+            while level.any():
+                depth += 1
+                self.levels[level] = depth
+                next_level = numpy.zeros(len(self.ids), dtype=bool)
+                next_level[~is_top] = level[self.parents[~is_top]]
+                level = next_level
+        return self.levels
+
+    def track_changes(self):
+        if self.changes is None:
+            self.changes = []
+
+    def get_changes(self):
+        """
+        Returns changes since the previous call: created nodes and
+        records added to pending ones (with data) or popped from them
+        ``(parent, None)`` in order. Records which are already popped
+        are omitted.
+        """
+        created = (self.flags & (CREATED | SAVED)) == CREATED
+        self.flags[created] |= SAVED
+        pending = [(parent, geonameid, self.objects[geonameid])
+                   if geonameid is not None else (parent, None, None)
+                   for parent, geonameid in self.changes
+                   if geonameid is None or geonameid in self.objects]
+        self.changes = []
+        return {
+            'created': self.ids[created],
+            'pending': pending,
+        }
+
+    def apply_changes(self, changes):
+        """
+        Restores state from changes returned by ``get_changes``.
+        """
+        i = numpy.searchsorted(self.ids, changes['created'])
+        self.flags[i] |= CREATED | SAVED
+        for parent, geonameid, data in changes['pending']:
+            if geonameid is None:
+                for child in self.pending.pop(parent, ()):
+                    self.objects.pop(child, None)
+            else:
+                self.pending.setdefault(parent, []).append(geonameid)
+                self.objects[geonameid] = data
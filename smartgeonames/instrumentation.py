@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals, print_function
+
+import cProfile
+import errno
+import functools
+import logging
+import os
+import pstats
+from contextlib import contextmanager
+from timeit import default_timer
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+logger = logging.getLogger("smartgeonames")
+
+PARSE = 'parse'
+FILTER = 'filter'
+SCHEMA = 'schema'
+TREE = 'tree'
+WRITE = 'write'
+
+
+class Timings(object):
+    """
+    Cumulative time in seconds spent in phases of import stage
+    (``PARSE``, ``FILTER``, ``SCHEMA``, ``TREE``, ``WRITE``) by
+    current process. Reset by ``pipeline.run_stage`` for every stage.
+    """
+    def __init__(self):
+        self.totals = {}
+
+    def add(self, phase, seconds):
+        self.totals[phase] = self.totals.get(phase, 0.0) + seconds
+
+    def update(self, totals):
+        for phase, seconds in totals.items():
+            self.add(phase, seconds)
+
+    @contextmanager
+    def measure(self, phase):
+        started = default_timer()
+        try:
+            yield
+        finally:
+            self.add(phase, default_timer() - started)
+
+    def reset(self):
+        self.totals = {}
+
+    def get(self):
+        return dict(self.totals)
+
+
+timings = Timings()
+
+
+def timed(phase):
+    """
+    Decorator which adds time of every call to ``phase``.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timings.measure(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StageProfiler(object):
+    """
+    Optional instrumentation of import stages: cProfile statistics saved
+    to ``profile_dir`` (one file per stage, ``top`` functions by
+    cumulative time are reported) and peak of memory allocated by Python
+    according to tracemalloc.
+
+    Profiler is passed to worker processes, so it holds only options.
+    """
+    top = 20
+
+    def __init__(self, profile_dir=None, trace_memory=False):
+        if trace_memory and tracemalloc is None:
+            raise ValueError('Memory tracing requires tracemalloc '
+                             '(Python 3.4+).')
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+
+    def __bool__(self):
+        return bool(self.profile_dir or self.trace_memory)
+    __nonzero__ = __bool__
+
+    def run(self, name, func, *args):
+        """
+        Returns result of ``func(*args)`` and report of instrumentation.
+        """
+        report = {}
+        profile = cProfile.Profile() if self.profile_dir else None
+        if self.trace_memory:
+            tracemalloc.start()
+        try:
+            if profile is not None:
+                result = profile.runcall(func, *args)
+            else:
+                result = func(*args)
+            if self.trace_memory:
+                report['memory_peak'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            if self.trace_memory:
+                tracemalloc.stop()
+        if profile is not None:
+            report['profile'] = self.save_profile(name, profile)
+        return result, report
+
+    def save_profile(self, name, profile):
+        try:
+            os.makedirs(self.profile_dir)
+        except os.error as e:
+            if e.errno != errno.EEXIST or not os.path.isdir(self.profile_dir):
+                raise
+        path = os.path.join(self.profile_dir, name + '.prof')
+        profile.dump_stats(path)
+        logger.info('Profile of stage %s is saved to %s', name, path)
+        stats = pstats.Stats(path)
+        stats.sort_stats('cumulative')
+        functions = []
+        for func in stats.fcn_list[:self.top]:
+            primitive_calls, calls, total, cumulative, callers = \
+                stats.stats[func]
+            functions.append({
+                'function': '{0}:{1}({2})'.format(*func),
+                'calls': calls,
+                'total_time': total,
+                'cumulative_time': cumulative,
+            })
+        return {
+            'path': path,
+            'functions': functions,
+        }
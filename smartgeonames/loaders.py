@@ -0,0 +1,623 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals, print_function
+
+import logging
+from collections import defaultdict
+
+import numpy
+from django.db import transaction
+from django.db.models import F, Case, When, Value
+from django.utils import timezone
+from django.utils import six
+
+from smartgeonames import settings
+from smartgeonames.backends import OrmBackend
+from smartgeonames.instrumentation import WRITE, timed
+from smartgeonames import lookups
+from smartgeonames.models import GeoNamesRecord, PostalCode, CountryInfo, \
+    AdminCode
+
+BATCH_SIZE = settings.BATCH_SIZE
+OBJECTS_COUNTRIES_FILTER_VALUES = settings.OBJECTS_COUNTRIES_FILTER_VALUES
+OBJECTS_CITIES_FILTER_VALUES = settings.OBJECTS_CITIES_FILTER_VALUES
+CONTINENTS_GEONAMEIDS = settings.CONTINENTS_GEONAMEIDS
+
+logger = logging.getLogger("smartgeonames")
+
+
+class TreebeardLoader(object):
+    """
+    Per-row loader. Every record is created through treebeard API
+    (``add_root`` / ``add_child``), i.e. several queries per record.
+    """
+    def __init__(self, model=GeoNamesRecord):
+        self.model = model
+
+    @timed(WRITE)
+    def add_root(self, **data):
+        return self.model.add_root(**data)
+
+    @timed(WRITE)
+    def add_child(self, parent_id, **data):
+        parent = self.model.objects.get(pk=parent_id)
+        return parent.add_child(**data)
+
+    def finish(self):
+        pass
+
+
+class BulkTreeLoader(object):
+    """
+    Bulk loader. Materialized path values (``path``, ``depth``,
+    ``numchild``) are computed in memory exactly as treebeard does it
+    for ``add_root`` / ``add_child`` calls made in the same order,
+    and records are written in batches by ingestion backend.
+
+    Without ``auto_flush`` records are written only by explicit
+    ``flush`` calls, e.g. on checkpoints of import.
+
+    With hierarchy ``tree`` only nodes which may still get children
+    are kept in memory: leaves are not kept at all and parent is
+    dropped when its last child is added.
+
+    Records which are in database before import (e.g. on re-import of
+    updated GeoNames files) keep their place in tree, their fields and
+    translation are updated instead.
+    """
+    def __init__(self, model=GeoNamesRecord, batch_size=BATCH_SIZE,
+                 backend=None, auto_flush=True, tree=None):
+        self.model = model
+        self.tree = tree
+        self.batch_size = batch_size
+        self.auto_flush = auto_flush
+        self.backend = backend or OrmBackend(batch_size=batch_size)
+        self.translation_model = model._parler_meta.root_model
+        self.translated_fields = model._parler_meta.get_translated_fields()
+        # geonameid -> [path, depth, last child step, children to add]
+        self.nodes = {}
+        self.last_root_step = None
+        self.pending = []
+        self.pending_translations = []
+        self.pending_by_pk = {}
+        self.numchild_updates = defaultdict(int)
+        self.pending_updates = []
+        self.existing = None
+        self.language = None
+        self.written = 0
+        self.updated = 0
+        self.last_pk = None
+
+    def get_existing(self):
+        """
+        Sorted array of primary keys of records which are in database
+        before import, fetched once.
+        """
+        if self.existing is None:
+            pks = self.model.objects.order_by('pk').values_list(
+                'pk', flat=True)
+            self.existing = numpy.fromiter(pks.iterator(), dtype=numpy.int32)
+        return self.existing
+
+    def is_existing(self, pk):
+        existing = self.get_existing()
+        i = numpy.searchsorted(existing, pk)
+        return i < len(existing) and existing[i] == pk
+
+    def add_root(self, **data):
+        if self.is_existing(data['geonameid']):
+            return self.replace(**data)
+        if self.last_root_step is None:
+            last_root = self.model.get_last_root_node()
+            self.last_root_step = self.get_step(last_root.path) \
+                if last_root else 0
+        self.last_root_step += 1
+        path = self.model._get_path(None, 1, self.last_root_step)
+        return self.add(path, 1, **data)
+
+    def add_child(self, parent_id, **data):
+        if self.is_existing(data['geonameid']):
+            return self.replace(**data)
+        parent = self.get_node(parent_id)
+        parent_path, parent_depth, _, _ = parent
+        parent[2] += 1
+        depth = parent_depth + 1
+        path = self.model._get_path(parent_path, depth, parent[2])
+        if parent[3] is not None:
+            parent[3] -= 1
+            if parent[3] <= 0:
+                del self.nodes[parent_id]
+        if parent_id in self.pending_by_pk:
+            self.pending_by_pk[parent_id].numchild += 1
+        else:
+            self.numchild_updates[parent_id] += 1
+        return self.add(path, depth, **data)
+
+    def add(self, path, depth, **data):
+        translated = {name: data.pop(name, None)
+                      for name in self.translated_fields}
+        obj = self.model(path=path, depth=depth, numchild=0, **data)
+        children = self.count_children(obj.pk)
+        if children != 0:
+            self.nodes[obj.pk] = [path, depth, 0, children]
+        self.pending.append(obj)
+        self.pending_by_pk[obj.pk] = obj
+        self.pending_translations.append(self.translation_model(
+            master_id=obj.pk,
+            language_code=obj.get_current_language(),
+            **translated
+        ))
+        if self.auto_flush and len(self.pending) >= self.batch_size:
+            self.flush()
+        return obj
+
+    def replace(self, **data):
+        """
+        Updates existing record by the next ``flush``. Translated
+        fields which are not in data are kept.
+        """
+        pk = data.pop('geonameid')
+        translated = dict((name, data.pop(name))
+                          for name in self.translated_fields if name in data)
+        self.pending_updates.append((pk, data, translated))
+        if self.auto_flush and \
+                len(self.pending) + len(self.pending_updates) >= \
+                self.batch_size:
+            self.flush()
+        return None
+
+    def get_node(self, pk):
+        """
+        Returns [path, depth, last child step, children to add] of
+        node. Nodes which are not created by this loader are fetched
+        from database.
+        """
+        if pk not in self.nodes:
+            parent = self.model.objects.get(pk=pk)
+            last_child = parent.get_last_child()
+            self.nodes[pk] = [
+                parent.path,
+                parent.depth,
+                self.get_step(last_child.path) if last_child else 0,
+                self.count_children(pk)
+            ]
+        return self.nodes[pk]
+
+    def count_children(self, pk):
+        """
+        Number of children which may be added to node, None without
+        hierarchy.
+        """
+        if self.tree is None:
+            return None
+        return self.tree.count_children(pk)
+
+    def get_step(self, path):
+        return self.model._str2int(path[-self.model.steplen:])
+
+    def get_last_pk(self):
+        """
+        Primary key of the last record written by the next ``flush``.
+        """
+        return self.pending[-1].pk if self.pending else self.last_pk
+
+    def flush(self):
+        if not self.pending and not self.numchild_updates and \
+                not self.pending_updates:
+            return
+        with transaction.atomic():
+            self.write(self.pending, self.pending_translations)
+            self.update(self.pending_updates)
+            self.update_numchild(self.numchild_updates)
+        self.written += len(self.pending)
+        self.updated += len(self.pending_updates)
+        self.last_pk = self.get_last_pk()
+        logger.debug('Bulk loader: %s records are written, %s updated.',
+                     self.written, self.updated)
+        self.pending = []
+        self.pending_translations = []
+        self.pending_by_pk = {}
+        self.pending_updates = []
+        self.numchild_updates = defaultdict(int)
+
+    def write(self, objects, translations):
+        self.backend.bulk_insert(self.model, objects)
+        self.backend.bulk_insert(self.translation_model, translations)
+
+    @timed(WRITE)
+    def update(self, updates):
+        if not updates:
+            return
+        if self.language is None:
+            self.language = self.model().get_current_language()
+        modified = timezone.now()
+        for pk, fields, translated in updates:
+            self.model.objects.filter(pk=pk).update(modified=modified,
+                                                    **fields)
+            if translated:
+                self.translation_model.objects.filter(
+                    master_id=pk, language_code=self.language).update(
+                    **translated)
+
+    def update_numchild(self, updates):
+        by_increment = defaultdict(list)
+        for pk, increment in six.iteritems(updates):
+            by_increment[increment].append(pk)
+        for increment, pks in six.iteritems(by_increment):
+            self.model.objects.filter(pk__in=pks).update(
+                numchild=F('numchild') + increment)
+
+    def finish(self):
+        self.flush()
+
+
+def get_name_rank(data):
+    """
+    Rank of alternate name, the lowest is the best: preferred names
+    first, then short ones.
+    """
+    return not data['isPreferredName'], not data['isShortName']
+
+
+class TranslationLoader(object):
+    """
+    Loader of alternate names into translations of GeoNames records.
+    Keeps the best name (see ``get_name_rank``) of every record and
+    language, historic and colloquial names and names of records which
+    are not imported are skipped. Names are written by ``finish``:
+    new translations in batches by ingestion backend, existing ones
+    are updated.
+    """
+    def __init__(self, model=GeoNamesRecord, batch_size=BATCH_SIZE,
+                 backend=None):
+        self.model = model
+        self.batch_size = batch_size
+        self.backend = backend or OrmBackend(batch_size=batch_size)
+        self.translation_model = model._parler_meta.root_model
+        self.imported = None
+        # (geonameid, language) -> (rank, name, alternate name ID)
+        self.names = {}
+
+    def get_imported(self):
+        """
+        Sorted array of primary keys of imported records, fetched once.
+        """
+        if self.imported is None:
+            pks = self.model.objects.order_by('pk').values_list(
+                'pk', flat=True)
+            self.imported = numpy.fromiter(pks.iterator(), dtype=numpy.int32)
+        return self.imported
+
+    def is_imported(self, geonameid):
+        imported = self.get_imported()
+        i = numpy.searchsorted(imported, geonameid)
+        return i < len(imported) and imported[i] == geonameid
+
+    def add(self, data):
+        if data['isHistoric'] or data['isColloquial']:
+            return
+        if not data['isolanguage'] or not data['alternate_name']:
+            return
+        if not self.is_imported(data['geonameid']):
+            return
+        key = (data['geonameid'], data['isolanguage'])
+        rank = get_name_rank(data)
+        current = self.names.get(key)
+        if current is None or rank < current[0]:
+            self.names[key] = (rank, data['alternate_name'],
+                               data['alternateNameId'])
+
+    def finish(self):
+        languages = set(language for _, language in self.names)
+        existing = set(self.translation_model.objects.filter(
+            language_code__in=languages).values_list(
+            'master_id', 'language_code').iterator())
+        pending = []
+        updated = 0
+        with transaction.atomic():
+            for key, (_, name, alternatenameid) in six.iteritems(self.names):
+                geonameid, language = key
+                if key in existing:
+                    self.translation_model.objects.filter(
+                        master_id=geonameid, language_code=language).update(
+                        name=name, alternatenameid=alternatenameid)
+                    updated += 1
+                    continue
+                pending.append(self.translation_model(
+                    master_id=geonameid,
+                    language_code=language,
+                    name=name,
+                    alternatenameid=alternatenameid
+                ))
+                if len(pending) >= self.batch_size:
+                    self.backend.bulk_insert(self.translation_model, pending)
+                    pending = []
+            self.backend.bulk_insert(self.translation_model, pending)
+        logger.info('Translations: %s created, %s updated',
+                    len(self.names) - updated, updated)
+        self.names = {}
+
+
+class AdminDivisionsIndex(object):
+    """
+    In-memory indexes of imported countries (country code -> geonameid)
+    and administrative divisions ((country code, admin1 code[, admin2
+    code[, admin3 code]]) -> geonameid), built by one query.
+    """
+    levels = {
+        'ADM1': 1,
+        'ADM2': 2,
+        'ADM3': 3,
+    }
+    sovereign_country = 'PCLI'
+
+    def __init__(self, model=GeoNamesRecord):
+        self.model = model
+        self.countries = None
+        self.divisions = None
+
+    def build(self):
+        self.countries = {}
+        self.divisions = {}
+        feature_codes = list(self.levels) + \
+            list(OBJECTS_COUNTRIES_FILTER_VALUES)
+        records = self.model.objects.filter(
+            feature_code__in=feature_codes).values_list(
+            'geonameid', 'feature_code', 'country_code', 'admin1_code',
+            'admin2_code', 'admin3_code')
+        for record in records.iterator():
+            geonameid, feature_code, country_code = record[:3]
+            level = self.levels.get(feature_code)
+            if level is None:
+                if country_code not in self.countries or \
+                        feature_code == self.sovereign_country:
+                    self.countries[country_code] = geonameid
+            else:
+                key = (country_code,) + tuple(record[3:3 + level])
+                self.divisions.setdefault(key, geonameid)
+        logger.info('Index of %s countries and %s admin divisions is built',
+                    len(self.countries), len(self.divisions))
+
+    def get_country(self, country_code):
+        if self.countries is None:
+            self.build()
+        return self.countries.get(country_code)
+
+    def get_division(self, country_code, *admin_codes):
+        """
+        Returns geonameid of admin division of level equal to the number
+        of admin codes or None.
+        """
+        if self.divisions is None:
+            self.build()
+        if not all(admin_codes):
+            return None
+        return self.divisions.get((country_code,) + admin_codes)
+
+
+class PostalCodeLoader(object):
+    """
+    Loader of postal codes. Country and admin divisions are resolved
+    by ``AdminDivisionsIndex`` and postal codes are written in batches
+    by ingestion backend. Postal codes of countries which are not
+    imported or without location are skipped.
+
+    Existing postal codes of a country are deleted in the transaction
+    of its first batch, so re-import, ``--force`` and an interrupted
+    run do not leave duplicates.
+    """
+    def __init__(self, model=PostalCode, batch_size=BATCH_SIZE,
+                 backend=None, index=None):
+        self.model = model
+        self.batch_size = batch_size
+        self.backend = backend or OrmBackend(batch_size=batch_size)
+        self.index = index or AdminDivisionsIndex()
+        self.pending = []
+        self.replaced = set()
+        self.written = 0
+        self.skipped = 0
+
+    def add(self, data):
+        country_code = data['country_code']
+        country = self.index.get_country(country_code)
+        if country is None or data['location'] is None:
+            self.skipped += 1
+            return None
+        codes = (data['admin_code1'], data['admin_code2'],
+                 data['admin_code3'])
+        obj = self.model(
+            country_id=country,
+            code=data['postal_code'],
+            place_name=data['place_name'],
+            admin1_id=self.index.get_division(country_code, *codes[:1]),
+            admin2_id=self.index.get_division(country_code, *codes[:2]),
+            admin3_id=self.index.get_division(country_code, *codes[:3]),
+            location=data['location'],
+            accuracy=data['accuracy']
+        )
+        self.pending.append(obj)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return obj
+
+    def flush(self):
+        if not self.pending:
+            return
+        countries = set(obj.country_id for obj in self.pending)
+        countries.difference_update(self.replaced)
+        with transaction.atomic():
+            if countries:
+                self.model.objects.filter(country_id__in=countries).delete()
+            self.backend.bulk_insert(self.model, self.pending)
+        self.replaced.update(countries)
+        self.written += len(self.pending)
+        self.pending = []
+
+    def finish(self):
+        self.flush()
+        logger.info('Postal codes: %s written, %s skipped',
+                    self.written, self.skipped)
+
+
+class CountryInfoLoader(object):
+    """
+    Loader of country info. Related records are resolved by lookup
+    maps built by a few queries: country codes of neighbours by
+    ``AdminDivisionsIndex``, capitals by (country code, name) of
+    imported cities, continents by ``CONTINENTS_GEONAMEIDS``.
+
+    Country info is written by ``finish``: new rows by one bulk insert,
+    existing ones by one update query per batch (``created`` is kept),
+    neighbours are replaced by one bulk insert into the through table.
+    """
+    capital_feature_code = 'PPLC'
+    # Fields which are not nullable in model
+    blank_fields = ('fips', 'tld', 'currency_code', 'postal_code_format',
+                    'postal_code_regex', 'languages')
+    # Fields which are set on existing rows
+    update_fields = ('iso_3166_1_a3', 'iso_3166_1_numeric', 'country',
+                     'capital', 'area', 'population', 'continent') + \
+        blank_fields
+
+    def __init__(self, model=CountryInfo, records_model=GeoNamesRecord,
+                 batch_size=BATCH_SIZE, backend=None, index=None):
+        self.model = model
+        self.records_model = records_model
+        self.batch_size = batch_size
+        self.backend = backend or OrmBackend(batch_size=batch_size)
+        self.index = index or AdminDivisionsIndex(records_model)
+        self.rows = []
+        self.imported = None
+        self.capitals = None
+
+    def add(self, data):
+        self.rows.append(data)
+
+    def build(self):
+        continents = list(CONTINENTS_GEONAMEIDS.values())
+        self.imported = set(self.records_model.objects.filter(
+            pk__in=[r['geonameid'] for r in self.rows if r['geonameid']] +
+            continents).values_list('pk', flat=True))
+        self.capitals = {}
+        cities = self.records_model.objects.filter(
+            feature_code__in=OBJECTS_CITIES_FILTER_VALUES).values_list(
+            'geonameid', 'country_code', 'feature_code', 'asciiname',
+            'translations__name')
+        for geonameid, country_code, feature_code, asciiname, name in \
+                cities.iterator():
+            for key in set((country_code, n) for n in (asciiname, name)
+                           if n):
+                if key not in self.capitals or \
+                        feature_code == self.capital_feature_code:
+                    self.capitals[key] = geonameid
+
+    def get_imported(self, geonameid):
+        return geonameid if geonameid in self.imported else None
+
+    def resolve(self, data):
+        country_code = data['iso_3166_1_a2']
+        obj = self.model(
+            iso_3166_1_a2=country_code,
+            iso_3166_1_a3=data['iso_3166_1_a3'],
+            iso_3166_1_numeric=data['iso_3166_1_numeric'],
+            country_id=self.get_imported(data['geonameid']),
+            capital_id=self.capitals.get((country_code, data['capital'])),
+            area=data['area'],
+            population=data['population'],
+            continent_id=self.get_imported(
+                CONTINENTS_GEONAMEIDS.get(data['continent'])),
+        )
+        for name in self.blank_fields:
+            setattr(obj, name, data[name] or '')
+        neighbours = []
+        for code in (data['neighbours'] or '').split(','):
+            neighbour = self.index.get_country(code.strip())
+            if neighbour is not None:
+                neighbours.append(neighbour)
+        return obj, neighbours
+
+    def finish(self):
+        if not self.rows:
+            return
+        self.build()
+        through = self.model.neighbours.through
+        existing = set(self.model.objects.values_list('pk', flat=True))
+        created = []
+        updated = []
+        neighbours = []
+        with transaction.atomic():
+            for data in self.rows:
+                obj, obj_neighbours = self.resolve(data)
+                if obj.pk in existing:
+                    updated.append(obj)
+                else:
+                    created.append(obj)
+                neighbours.extend(
+                    through(countryinfo_id=obj.pk, country_id=neighbour)
+                    for neighbour in obj_neighbours)
+            self.backend.bulk_insert(self.model, created)
+            self.update(updated)
+            through.objects.filter(countryinfo_id__in=[
+                data['iso_3166_1_a2'] for data in self.rows]).delete()
+            self.backend.bulk_insert(through, neighbours)
+        logger.info('Country info: %s created, %s updated, %s neighbours',
+                    len(created), len(updated), len(neighbours))
+        self.rows = []
+
+    @timed(WRITE)
+    def update(self, objects):
+        """
+        Updates existing rows by one query per batch: every field is set
+        by ``CASE`` over primary keys. ``ELSE`` keeps the column, so
+        database takes type of values from it.
+        """
+        modified = timezone.now()
+        for start in range(0, len(objects), self.batch_size):
+            batch = objects[start:start + self.batch_size]
+            values = {}
+            for name in self.update_fields:
+                field = self.model._meta.get_field(name)
+                values[field.attname] = Case(
+                    *[When(pk=obj.pk,
+                           then=Value(getattr(obj, field.attname)))
+                      for obj in batch],
+                    default=F(field.attname), output_field=field)
+            self.model.objects.filter(
+                pk__in=[obj.pk for obj in batch]).update(modified=modified,
+                                                         **values)
+
+
+class AdminCodeLoader(object):
+    """
+    Loader of names of admin divisions of one ``level`` (1 or 2).
+    All divisions of the level are replaced by ``finish`` at once.
+    """
+    def __init__(self, level, model=AdminCode, batch_size=BATCH_SIZE,
+                 backend=None):
+        self.level = level
+        self.model = model
+        self.backend = backend or OrmBackend(batch_size=batch_size)
+        self.pending = []
+
+    def add(self, data):
+        self.pending.append(self.model(
+            country_code=data['country_code'],
+            admin1_code=data['admin1_code'],
+            admin2_code=data.get('admin2_code') or '',
+            name=data['name'],
+            asciiname=data['asciiname'],
+            geonameid=data['geonameid']
+        ))
+
+    def finish(self):
+        existing = self.model.objects.all()
+        if self.level == 1:
+            existing = existing.filter(admin2_code='')
+        else:
+            existing = existing.exclude(admin2_code='')
+        with transaction.atomic():
+            existing.delete()
+            self.backend.bulk_insert(self.model, self.pending)
+        logger.info('Admin%s codes: %s written', self.level,
+                    len(self.pending))
+        self.pending = []
+        lookups.clear_cache()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals, print_function
+
+import threading
+from collections import namedtuple
+
+from smartgeonames.models import AdminCode
+
+AdminDivision = namedtuple('AdminDivision', ['geonameid', 'name',
+                                             'asciiname'])
+
+_cache = None
+_lock = threading.Lock()
+
+
+def get_admin_codes():
+    """
+    Returns dictionary of all admin divisions
+    ``{(country_code, admin1_code, admin2_code): AdminDivision}``
+    loaded by one query once per process. ``admin2_code`` is empty
+    for divisions of the 1st order.
+    """
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                rows = AdminCode.objects.values_list(
+                    'country_code', 'admin1_code', 'admin2_code',
+                    'geonameid', 'name', 'asciiname')
+                _cache = {
+                    row[:3]: AdminDivision(*row[3:])
+                    for row in rows.iterator()
+                }
+    return _cache
+
+
+def clear_cache():
+    global _cache
+    _cache = None
+
+
+def get_admin1(country_code, admin1_code):
+    return get_admin_codes().get((country_code, admin1_code or '', ''))
+
+
+def get_admin2(country_code, admin1_code, admin2_code):
+    if not admin2_code:
+        return None
+    return get_admin_codes().get(
+        (country_code, admin1_code or '', admin2_code))
+
+
+def get_admin_divisions(record):
+    """
+    Returns ``(admin1, admin2)`` divisions of GeoNames record
+    (or any object with the same code attributes) without queries
+    of tree. Unknown divisions are None.
+    """
+    return (
+        get_admin1(record.country_code, record.admin1_code),
+        get_admin2(record.country_code, record.admin1_code,
+                   record.admin2_code),
+    )
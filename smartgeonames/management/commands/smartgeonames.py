@@ -1,32 +1,54 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals, print_function
 
-import csv
+import datetime
 import errno
+import functools
+import hashlib
+import json
 import logging
 import os
 import shutil
-import time
-import zipfile
 
-import pandas
-import requests
-from django.core.management import BaseCommand
-from six import StringIO
-from treelib import Tree
+from django.core.management import BaseCommand, CommandError
 
+import smartgeonames
 from smartgeonames import settings
-from smartgeonames.filters import remove_comments, objects_filter
-from smartgeonames.handlers import dummy_handler, hierarchy_builder_handler, \
-    object_handler
+from smartgeonames.backends import BACKENDS, get_backend
+from smartgeonames.checkpoints import Checkpoint, CheckpointError
+from smartgeonames.downloads import Downloader, DownloadError
+from smartgeonames.filters import remove_comments, remove_blank_lines, \
+    fix_encoding, objects_filter, translations_filter, countries_filter, \
+    postal_codes_filter, IdsFilter
+from smartgeonames.handlers import hierarchy_builder_handler, \
+    object_handler, level_handler, translation_handler, postal_code_handler, \
+    country_info_handler, admin_code_handler, finish_loader, HierarchyState, \
+    LevelSpool, CityHierarchy, country_hierarchy_handler, \
+    division_hierarchy_handler, city_hierarchy_handler
+from smartgeonames.hierarchy import HierarchyIndex
+from smartgeonames.instrumentation import StageProfiler
+from smartgeonames.loaders import BulkTreeLoader, TreebeardLoader, \
+    TranslationLoader, PostalCodeLoader, CountryInfoLoader, AdminCodeLoader
+from smartgeonames.manifest import Manifest
+from smartgeonames.parsers import Parser
+from smartgeonames.pipeline import Stage, ShardedStage, StageScheduler, \
+    get_summary
+from smartgeonames.sync import DeltaSync, get_dates, DATE_FORMAT
 from smartgeonames.schemas import (
     CountryInfoSchema as DefaultCountryInfoSchema,
+    Admin1CodesSchema as DefaultAdmin1CodesSchema,
+    Admin2CodesSchema as DefaultAdmin2CodesSchema,
     GeoNamesRecordSchema as DefaultGeoNamesRecordSchema,
     AlternateNameSchema as DefaultAlternateNameSchema,
     PostalCodeSchema as DefaultPostalCodeSchema
 )
 
 DATA_DIR = settings.DATA_DIR
+BATCH_SIZE = settings.BATCH_SIZE
+CHECKPOINT_DIR = settings.CHECKPOINT_DIR
+CHECKPOINT_INTERVAL = settings.CHECKPOINT_INTERVAL
+DOWNLOAD_JOBS = settings.DOWNLOAD_JOBS
+PROFILE_DIR = settings.PROFILE_DIR
 
 COUNTRIES_FILE_PATH = settings.COUNTRIES_FILE_PATH
 COUNTRIES_FILE_LOCAL_PATH = settings.COUNTRIES_FILE_LOCAL_PATH
@@ -44,42 +66,60 @@ TRANSLATIONS_FILE_LOCAL_PATH = settings.TRANSLATIONS_FILE_LOCAL_PATH
 TRANSLATIONS_FILTER = settings.TRANSLATIONS_FILTER
 AlternateNameSchema = settings.TRANSLATIONS_SCHEMA or DefaultAlternateNameSchema
 
+ADMIN1_CODES_FILE_PATH = settings.ADMIN1_CODES_FILE_PATH
+ADMIN1_CODES_FILE_LOCAL_PATH = settings.ADMIN1_CODES_FILE_LOCAL_PATH
+Admin1CodesSchema = settings.ADMIN1_CODES_SCHEMA or DefaultAdmin1CodesSchema
+ADMIN2_CODES_FILE_PATH = settings.ADMIN2_CODES_FILE_PATH
+ADMIN2_CODES_FILE_LOCAL_PATH = settings.ADMIN2_CODES_FILE_LOCAL_PATH
+Admin2CodesSchema = settings.ADMIN2_CODES_SCHEMA or DefaultAdmin2CodesSchema
+
 POSTAL_CODES_FILE_PATH = settings.POSTAL_CODES_FILE_PATH
 POSTAL_CODES_FILE_LOCAL_PATH = settings.POSTAL_CODES_FILE_LOCAL_PATH
 POSTAL_CODES_FILTER = settings.POSTAL_CODES_FILTER
 PostalCodeSchema = settings.POSTAL_CODES_SCHEMA or DefaultPostalCodeSchema
 
+COUNTRY_OBJECTS_FILE_PATH = settings.COUNTRY_OBJECTS_FILE_PATH
+COUNTRY_OBJECTS_FILE_LOCAL_PATH = settings.COUNTRY_OBJECTS_FILE_LOCAL_PATH
+COUNTRY_TRANSLATIONS_FILE_PATH = settings.COUNTRY_TRANSLATIONS_FILE_PATH
+COUNTRY_TRANSLATIONS_FILE_LOCAL_PATH = \
+    settings.COUNTRY_TRANSLATIONS_FILE_LOCAL_PATH
+COUNTRY_POSTAL_CODES_FILE_PATH = settings.COUNTRY_POSTAL_CODES_FILE_PATH
+COUNTRY_POSTAL_CODES_FILE_LOCAL_PATH = \
+    settings.COUNTRY_POSTAL_CODES_FILE_LOCAL_PATH
+NO_COUNTRY_FILE_PATH = settings.NO_COUNTRY_FILE_PATH
+CITIES_DATASET = settings.CITIES_DATASET
+CITIES_DATASETS = ('cities500', 'cities1000', 'cities5000', 'cities15000')
+CITIES_FILE_PATH = settings.CITIES_FILE_PATH
+CITIES_FILE_LOCAL_PATH = settings.CITIES_FILE_LOCAL_PATH
+NO_COUNTRY_FILE_LOCAL_PATH = settings.NO_COUNTRY_FILE_LOCAL_PATH
+
 HIERARCHY_FILE_PATH = settings.HIERARCHY_FILE_PATH
 HIERARCHY_FILE_LOCAL_PATH = settings.HIERARCHY_FILE_LOCAL_PATH
 HIERARCHY_TREE_ROOT = settings.HIERARCHY_TREE_ROOT
+HIERARCHY_CACHE_DIR = settings.HIERARCHY_CACHE_DIR
 
-logger = logging.getLogger("smartgeonames")
+SYNC_SOURCE = settings.SYNC_SOURCE
+SYNC_DATA_DIR = settings.SYNC_DATA_DIR
 
-
-class GeoNamesDialect(csv.Dialect):
-    delimiter = str('\t')
-    escapechar = None
-    strict = True
-    quoting = csv.QUOTE_NONE
-    lineterminator = str('\r\n')
+logger = logging.getLogger("smartgeonames")
 
 
 class Command(BaseCommand):
     help = 'Smart GeoNames manager'
-    progress_width = 50
+    manifest_file = os.path.join(DATA_DIR, 'manifest.json')
+    # Replaced by manifest, migrated on the first run
     status_file = os.path.join(DATA_DIR, 'status.csv')
-    status_fields = [
-        'remote',
-        'local',
-        'etag',
-        'content_length',
-        'last_modified',
-        'date',
-    ]
     memory_mode = None
     without_pandas_mode = None
-    hierarchy = Tree()
-    hierarchy_file = os.path.join(DATA_DIR, 'hierarchy_tree.txt')
+    loader = None
+    translation_loader = None
+    postal_code_loader = None
+    country_info_loader = None
+    parser = None
+    checkpoint = None
+    hierarchy = None
+    manifest = None
+    downloader = None
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -96,7 +136,7 @@ class Command(BaseCommand):
             '--clean-up', action='store_true', dest='clean_up',
             default=False,
             help='Clean-up downloaded files and '
-                 'reset status file (default: false)'
+                 'reset manifest (default: false)'
         )
         parser.add_argument(
             '--memory-mode', dest='memory_mode',
@@ -109,12 +149,167 @@ class Command(BaseCommand):
             default=False,
             help='Don\'t use Pandas for CSV parsing (default: false)'
         )
+        parser.add_argument(
+            '--download-jobs', dest='download_jobs', type=int,
+            default=DOWNLOAD_JOBS,
+            help='Number of files downloaded at once '
+                 '(default: %s)' % DOWNLOAD_JOBS
+        )
+        parser.add_argument(
+            '--loader', dest='loader',
+            choices=['bulk', 'treebeard'],
+            default='bulk',
+            help='Loader of GeoNames records: precomputed materialized '
+                 'paths with bulk inserts or per-row treebeard API '
+                 '(default: bulk)'
+        )
+        parser.add_argument(
+            '--batch-size', dest='batch_size', type=int,
+            default=BATCH_SIZE,
+            help='Batch size of bulk loader (default: %s)' % BATCH_SIZE
+        )
+        parser.add_argument(
+            '--backend', dest='backend',
+            choices=sorted(BACKENDS.keys()),
+            default='orm',
+            help='Ingestion backend of bulk loader. "copy" uses PostgreSQL '
+                 'COPY and falls back to "orm" on other databases '
+                 '(default: orm)'
+        )
+        parser.add_argument(
+            '-j', '--jobs', dest='jobs', type=int,
+            default=1,
+            help='Number of processes for independent import stages '
+                 '(default: 1)'
+        )
+        parser.add_argument(
+            '--parse-jobs', dest='parse_jobs', type=int,
+            default=1,
+            help='Number of processes for sharded parsing of GeoNames '
+                 'records, 1 disables sharding (default: 1)'
+        )
+        parser.add_argument(
+            '--depth-ordered', action='store_true', dest='depth_ordered',
+            default=False,
+            help='Import GeoNames records in two passes: spool them by '
+                 'depth in hierarchy, then create level by level '
+                 '(default: false)'
+        )
+        parser.add_argument(
+            '--resume', action='store_true', dest='resume',
+            default=False,
+            help='Continue interrupted import from the last checkpoint, '
+                 'requires bulk loader (default: false)'
+        )
+        parser.add_argument(
+            '--checkpoint-interval', dest='checkpoint_interval', type=int,
+            default=CHECKPOINT_INTERVAL,
+            help='Number of rows between checkpoints of import '
+                 '(default: %s)' % CHECKPOINT_INTERVAL
+        )
+        parser.add_argument(
+            '--sync', action='store_true', dest='sync',
+            default=False,
+            help='Apply daily GeoNames deltas (modifications and deletes) '
+                 'since the last applied date instead of import '
+                 '(default: false)'
+        )
+        parser.add_argument(
+            '--sync-source', dest='sync_source',
+            default=SYNC_SOURCE,
+            help='URL or local directory of daily delta files '
+                 '(default: %s)' % SYNC_SOURCE
+        )
+        parser.add_argument(
+            '--sync-since', dest='sync_since',
+            default=None,
+            help='Date of the last applied deltas (YYYY-MM-DD), overrides '
+                 'the date from manifest'
+        )
+        parser.add_argument(
+            '--countries', dest='countries',
+            default=None,
+            help='Comma-separated ISO codes of countries, e.g. RU,UA. '
+                 'Only archives of these countries are downloaded and '
+                 'imported instead of files of all countries'
+        )
+        parser.add_argument(
+            '--cities', dest='cities',
+            choices=CITIES_DATASETS,
+            default=CITIES_DATASET,
+            help='Import cities dataset with their countries, continents '
+                 'and first-level divisions instead of all GeoNames '
+                 'records, only with --countries: ancestors of cities '
+                 'are taken from archives of these countries '
+                 '(default: %s)' % CITIES_DATASET
+        )
+        parser.add_argument(
+            '--force', action='store_true', dest='force',
+            default=False,
+            help='Import all stages, even if their files are not changed '
+                 'since the last successful import (default: false)'
+        )
+        parser.add_argument(
+            '--verify', action='store_true', dest='verify',
+            default=False,
+            help='Verify SHA-256 of downloaded files before import '
+                 '(default: false)'
+        )
+        parser.add_argument(
+            '--stats-file', dest='stats_file',
+            default=None,
+            help='Write JSON report of import stages (records, ignored, '
+                 'errors, imported, duration, time of phases) to file'
+        )
+        parser.add_argument(
+            '--profile', action='store_true', dest='profile',
+            default=False,
+            help='Profile import stages with cProfile, statistics are '
+                 'saved to %s (default: false)' % PROFILE_DIR
+        )
+        parser.add_argument(
+            '--trace-memory', action='store_true', dest='trace_memory',
+            default=False,
+            help='Trace peak memory of import stages with tracemalloc '
+                 '(default: false)'
+        )
 
     def handle(self, *args, **options):
         self.memory_mode = options.get('memory_mode')
         self.without_pandas_mode = options.get('without_pandas_mode')
-        if not self.hierarchy.contains(HIERARCHY_TREE_ROOT):
-            self.hierarchy.create_node(HIERARCHY_TREE_ROOT, HIERARCHY_TREE_ROOT)
+        self.parser = Parser(memory_mode=self.memory_mode,
+                             without_pandas_mode=self.without_pandas_mode)
+        if options.get('resume') and (options.get('loader') == 'treebeard' or
+                                      options.get('depth_ordered')):
+            raise CommandError('Import can be resumed only with bulk '
+                               'loader in file order.')
+        backend = get_backend(options.get('backend'),
+                              batch_size=options.get('batch_size'))
+        logger.info('Ingestion backend: %s', backend.name)
+        self.translation_loader = TranslationLoader(
+            batch_size=options.get('batch_size'), backend=backend)
+        self.postal_code_loader = PostalCodeLoader(
+            batch_size=options.get('batch_size'), backend=backend)
+        self.country_info_loader = CountryInfoLoader(
+            batch_size=options.get('batch_size'), backend=backend)
+        self.hierarchy = HierarchyIndex()
+        if options.get('loader') == 'treebeard':
+            self.loader = TreebeardLoader()
+        else:
+            # Records are written on checkpoints in file order
+            self.loader = BulkTreeLoader(
+                batch_size=options.get('batch_size'),
+                backend=backend,
+                auto_flush=options.get('depth_ordered'),
+                tree=self.hierarchy)
+        self.checkpoint = Checkpoint(
+            CHECKPOINT_DIR, interval=options.get('checkpoint_interval'))
+        # Shared by stages of GeoNames records in depth order
+        self.spool = None
+        self.manifest = Manifest(self.manifest_file)
+        self.manifest.migrate(self.status_file)
+        self.downloader = Downloader(self.manifest,
+                                     jobs=options.get('download_jobs'))
 
         if options.get('clean_up'):
             logger.info('CLEAN-UP')
@@ -127,97 +322,542 @@ class Command(BaseCommand):
                 logger.warn('%s is removed.', DATA_DIR)
 
             try:
-                os.remove(self.status_file)
+                os.remove(self.manifest_file)
             except os.error:
                 logger.error('Nothing to delete! No such file %s',
-                             self.status_file)
+                             self.manifest_file)
             else:
-                logger.warn('%s is removed.', self.status_file)
-
+                logger.warn('%s is removed.', self.manifest_file)
+            self.manifest = Manifest(self.manifest_file)
+            self.downloader.manifest = self.manifest
+
+        countries = self.get_countries(options.get('countries'))
+        cities = options.get('cities')
+        if cities and not countries and \
+                (options.get('download') or options.get('import')):
+            # Otherwise ancestors of cities are only in dumps of all
+            # countries, which --cities is intended to avoid
+            raise CommandError('--cities requires --countries')
         if options.get('download'):
             logger.info('DOWNLOAD')
-            self.download(HIERARCHY_FILE_PATH, HIERARCHY_FILE_LOCAL_PATH)
-            self.download(OBJECTS_FILE_PATH, OBJECTS_FILE_LOCAL_PATH)
-            self.download(TRANSLATIONS_FILE_PATH, TRANSLATIONS_FILE_LOCAL_PATH)
-            self.download(COUNTRIES_FILE_PATH, COUNTRIES_FILE_LOCAL_PATH)
-            self.download(POSTAL_CODES_FILE_PATH, POSTAL_CODES_FILE_LOCAL_PATH)
+            files, optional = self.get_files(countries, cities)
+            try:
+                self.downloader.download_all(files)
+            except DownloadError as e:
+                failures = [(remote, error) for remote, error in e.failures
+                            if remote not in optional]
+                if failures:
+                    raise CommandError(DownloadError(failures))
+                for remote, _ in e.failures:
+                    logger.warning('File %s is not available, skipped.',
+                                   remote)
+
+        if options.get('verify'):
+            logger.info('VERIFY')
+            self.verify()
+
+        if options.get('sync'):
+            logger.info('SYNC')
+            self.sync(options.get('sync_source'), options.get('sync_since'))
+            return
 
         if options.get('import'):
             logger.info('IMPORT (memory mode: %s, use Pandas: %s)',
                         self.memory_mode, not self.without_pandas_mode)
-            import_setup = (
-                (HIERARCHY_FILE_LOCAL_PATH, hierarchy_builder_handler, {
-                    'parsing': {
-                        'fields': ('parent', 'child', 'type'),
-                    },
-                    'handler': {
-                        'tree': self.hierarchy
-                    }
-                }),
-                (OBJECTS_FILE_LOCAL_PATH, object_handler, {
-                    'schema': GeoNameSchema(),
-                    'parsing': {
-                        'data_filter': objects_filter,
-                    },
-                    'handler': {
-                        'tree': self.hierarchy
-                    }
-                }),
-                (TRANSLATIONS_FILE_LOCAL_PATH, dummy_handler, {
-                    'schema': AlternateNameSchema(),
-                }),
-                (COUNTRIES_FILE_LOCAL_PATH, dummy_handler, {
-                    'schema': CountryInfoSchema(),
-                    'parsing': {
-                        'pre_processors': (remove_comments,)
+            if not options.get('resume'):
+                self.checkpoint.clear()
+            if cities:
+                # Hierarchy of cities is built by their codes every time
+                stages = self.get_cities_stages(cities, countries, backend,
+                                                options)
+            else:
+                hierarchy_is_cached = self.load_hierarchy()
+                depends_on = () if hierarchy_is_cached else ('hierarchy',)
+                if countries:
+                    stages = self.get_country_stages(countries, depends_on,
+                                                     backend, options)
+                else:
+                    stages = [
+                        self.get_objects_stage(
+                            'objects', OBJECTS_FILE_LOCAL_PATH,
+                            objects_filter, depends_on, options),
+                    ]
+                    stages.extend(self.get_data_stages(('objects',)))
+                if not hierarchy_is_cached:
+                    stages.insert(0, self.get_hierarchy_stage())
+            # Only stages of GeoNames records and hierarchy are local
+            objects_stages = [stage.name for stage in stages if stage.local]
+            stages.append(
+                Stage('countries', COUNTRIES_FILE_LOCAL_PATH,
+                      country_info_handler,
+                      schema=CountryInfoSchema,
+                      parsing={
+                          'data_filter': countries_filter,
+                          'pre_processors': (fix_encoding,
+                                             remove_comments,
+                                             remove_blank_lines),
+                      },
+                      handler_kwargs={
+                          'loader': self.country_info_loader,
+                      },
+                      finalize=functools.partial(finish_loader,
+                                                 self.country_info_loader),
+                      depends_on=objects_stages,
+                      checkpoint=self.checkpoint))
+            for level, filepath, schema in (
+                    (1, ADMIN1_CODES_FILE_LOCAL_PATH, Admin1CodesSchema),
+                    (2, ADMIN2_CODES_FILE_LOCAL_PATH, Admin2CodesSchema)):
+                loader = AdminCodeLoader(
+                    level, batch_size=options.get('batch_size'),
+                    backend=backend)
+                stages.append(Stage(
+                    'admin{0}_codes'.format(level), filepath,
+                    admin_code_handler,
+                    schema=schema,
+                    handler_kwargs={
+                        'loader': loader,
                     },
-                }),
-                (POSTAL_CODES_FILE_LOCAL_PATH, dummy_handler, {
-                    'schema': PostalCodeSchema(),
-                }),
-            )
-            for (filepath, handler, kwargs) in import_setup:
-                # TODO: Multiprocessing
-                schema = kwargs.pop('schema', None)
-                handler_kwargs = kwargs.get('handler', {})
-                parsing_kwargs = kwargs.get('parsing', {})
-                schema_fields = schema.fields.keys() if schema else ()
-                parsing_kwargs['fields'] = parsing_kwargs.get('fields',
-                                                              schema_fields)
-                logger.info('Importing file %s', filepath)
-                counter = 0
-                ignored_counter = 0
-                errors_counter = 0
-                imported_counter = 0
-                counter_msg = 'Records: {0}, ' \
-                              'ignored: {1}, ' \
-                              'errors: {2}, ' \
-                              'imported: {3}'
-                for data, is_ignored in self.parse(filepath, **parsing_kwargs):
-                    print(counter_msg.format(counter,
-                                             ignored_counter,
-                                             errors_counter,
-                                             imported_counter),
-                          end='\r')
-                    counter += 1
-                    if is_ignored:
-                        ignored_counter += 1
-                        continue
-                    result, errors = handler(schema, data, **handler_kwargs)
-                    if errors:
-                        errors_counter += 1
-                        print(counter)
-                    else:
-                        imported_counter += 1
-                print('Total records parsed:', counter)
-                print('Total records parsed with errors:', errors_counter)
-            # os.remove(self.hierarchy_file)
-            # self.hierarchy.subtree(HIERARCHY_TREE_ROOT).save2file(
-            #     self.hierarchy_file
-            # )
-            # print(self.hierarchy.subtree(HIERARCHY_TREE_ROOT).to_dict(sort=False))
+                    finalize=functools.partial(finish_loader, loader),
+                    checkpoint=self.checkpoint))
+            try:
+                profiler = StageProfiler(
+                    PROFILE_DIR if options.get('profile') else None,
+                    trace_memory=options.get('trace_memory'))
+            except ValueError as e:
+                raise CommandError(e)
+            fingerprints = dict(
+                (stage.name, self.manifest.get_sha256(stage.filepath))
+                for stage in stages)
+            if not options.get('force'):
+                stages = self.skip_unchanged(stages, fingerprints)
+            scheduler = StageScheduler(stages, self.parser,
+                                       jobs=options.get('jobs'),
+                                       profiler=profiler)
+            try:
+                stats = scheduler.run()
+            except CheckpointError as e:
+                raise CommandError(e)
+            finally:
+                if self.spool is not None:
+                    self.spool.close()
+                for stage in stages:
+                    if stage.name in scheduler.stats and \
+                            fingerprints[stage.name] is not None:
+                        self.manifest.set_imported(
+                            stage.name, stage.filepath,
+                            fingerprints[stage.name])
+            for stage in stages:
+                print('Stage {0}: {1:.2f}s, process peak RSS so far: '
+                      '{2:.1f} MB'.format(
+                          stage.name, stats[stage.name]['duration'],
+                          stats[stage.name]['max_rss'] / 1024.0 / 1024.0))
+            print('Total: {0:.2f}s (memory mode: {1})'.format(
+                stats['total']['duration'], self.memory_mode))
             print('Hierarchy tree size:', self.hierarchy.size())
             print('Hierarchy tree depth:', self.hierarchy.depth())
+            stats_file = options.get('stats_file')
+            if not stats_file and profiler:
+                stats_file = os.path.join(PROFILE_DIR, 'report.json')
+            if stats_file:
+                self.write_stats(stats_file, stages, stats, options)
+
+    def write_stats(self, path, stages, stats, options):
+        report = {
+            'version': smartgeonames.__version__,
+            'stages': [get_summary(stage.name, stats[stage.name])
+                       for stage in stages],
+            'duration': stats['total']['duration'],
+            'options': {
+                'memory_mode': self.memory_mode,
+                'without_pandas_mode': self.without_pandas_mode,
+                'loader': options.get('loader'),
+                'backend': options.get('backend'),
+                'batch_size': options.get('batch_size'),
+                'jobs': options.get('jobs'),
+                'parse_jobs': options.get('parse_jobs'),
+                'depth_ordered': options.get('depth_ordered'),
+                'countries': options.get('countries'),
+                'cities': options.get('cities'),
+                'force': options.get('force'),
+            },
+        }
+        self.mkdir(os.path.abspath(path))
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        logger.info('Import statistics are written to %s', path)
+
+    def get_objects_stage(self, name, filepath, data_filter, depends_on,
+                          options):
+        """
+        Stage of GeoNames records. It is local: records are created
+        in the main process by shared hierarchy and loader.
+        """
+        kwargs = {
+            'schema': GeoNameSchema,
+            'parsing': {
+                'data_filter': data_filter,
+            },
+            'depends_on': depends_on,
+            'local': True,
+            'checkpoint': self.checkpoint,
+        }
+        if options.get('depth_ordered'):
+            # Records of one stage may wait for parents from another one
+            if self.spool is None:
+                self.spool = LevelSpool(self.hierarchy, self.loader)
+            handler = level_handler
+            kwargs.update({
+                'handler_kwargs': {'spool': self.spool},
+                'finalize': self.spool.load,
+            })
+        else:
+            handler = object_handler
+            kwargs.update({
+                'handler_kwargs': {
+                    'tree': self.hierarchy,
+                    'loader': self.loader,
+                },
+                'finalize': self.loader.finish,
+            })
+            if isinstance(self.loader, BulkTreeLoader):
+                kwargs['resumable'] = HierarchyState(self.hierarchy,
+                                                     self.loader)
+        if options.get('parse_jobs') > 1:
+            return ShardedStage(name, filepath, handler,
+                                jobs=options.get('parse_jobs'), **kwargs)
+        return Stage(name, filepath, handler, **kwargs)
+
+    def get_data_stages(self, depends_on):
+        """
+        Stages of translations and postal codes of all countries.
+        """
+        return [
+            self.get_translations_stage(
+                'translations', TRANSLATIONS_FILE_LOCAL_PATH,
+                self.translation_loader, depends_on),
+            self.get_postal_codes_stage(
+                'postal_codes', POSTAL_CODES_FILE_LOCAL_PATH,
+                postal_codes_filter, self.postal_code_loader, depends_on),
+        ]
+
+    def get_translations_stage(self, name, filepath, loader, depends_on):
+        return Stage(name, filepath, translation_handler,
+                     schema=AlternateNameSchema,
+                     parsing={
+                         'data_filter': translations_filter,
+                     },
+                     handler_kwargs={
+                         'loader': loader,
+                     },
+                     # Stage may be sent to worker process, bound
+                     # methods can't be pickled on Python 2
+                     finalize=functools.partial(finish_loader, loader),
+                     depends_on=depends_on,
+                     checkpoint=self.checkpoint)
+
+    def get_postal_codes_stage(self, name, filepath, data_filter, loader,
+                               depends_on):
+        return Stage(name, filepath, postal_code_handler,
+                     schema=PostalCodeSchema,
+                     parsing={
+                         'data_filter': data_filter,
+                     },
+                     handler_kwargs={
+                         'loader': loader,
+                     },
+                     finalize=functools.partial(finish_loader, loader),
+                     depends_on=depends_on,
+                     checkpoint=self.checkpoint)
+
+    def get_country_stages(self, countries, depends_on, backend, options):
+        """
+        Stages of import from archives of ``countries``. Records of
+        countries are created one country after another in the main
+        process, because they share hierarchy. Translations and postal
+        codes of country depend only on its records, so with ``--jobs``
+        they are imported in worker processes while records of the next
+        countries are created.
+        """
+        # Archives contain only records of their countries
+        country_objects_filter = objects_filter.ignore('country_code')
+        stages = [
+            self.get_objects_stage(
+                'objects_no_country', NO_COUNTRY_FILE_LOCAL_PATH,
+                country_objects_filter, depends_on, options),
+        ]
+        previous = stages[0].name
+        for country in countries:
+            objects_stage = 'objects_{0}'.format(country)
+            # Hierarchy of the first countries may continue in the next
+            # ones, so their records are imported in the given order
+            stages.append(self.get_objects_stage(
+                objects_stage,
+                COUNTRY_OBJECTS_FILE_LOCAL_PATH.format(country=country),
+                country_objects_filter, (previous,), options))
+            previous = objects_stage
+            stages.extend(self.get_country_data_stages(
+                country, (objects_stage,), backend, options))
+        return stages
+
+    def get_country_data_stages(self, country, depends_on, backend, options):
+        """
+        Stages of translations and postal codes of ``country`` from its
+        archives.
+        """
+        return [
+            self.get_translations_stage(
+                'translations_{0}'.format(country),
+                COUNTRY_TRANSLATIONS_FILE_LOCAL_PATH.format(country=country),
+                TranslationLoader(batch_size=options.get('batch_size'),
+                                  backend=backend),
+                depends_on),
+            self.get_postal_codes_stage(
+                'postal_codes_{0}'.format(country),
+                COUNTRY_POSTAL_CODES_FILE_LOCAL_PATH.format(country=country),
+                # Archive contains only postal codes of its country
+                postal_codes_filter.ignore('country_code'),
+                PostalCodeLoader(batch_size=options.get('batch_size'),
+                                 backend=backend),
+                depends_on),
+        ]
+
+    def get_cities_stages(self, dataset, countries, backend, options):
+        """
+        Stages of import of cities ``dataset`` instead of all GeoNames
+        records. Hierarchy of cities is resolved by their codes (see
+        ``handlers.CityHierarchy``), then their ancestors (continents,
+        countries and first-level divisions) are picked from archives
+        of ``countries`` by a pass which accepts only their geonameids.
+        Cities of other countries are ignored.
+        """
+        hierarchy = CityHierarchy(self.hierarchy)
+        cities_filter = objects_filter.restrict('country_code', countries)
+        stages = [
+            Stage('hierarchy_countries', COUNTRIES_FILE_LOCAL_PATH,
+                  country_hierarchy_handler,
+                  schema=CountryInfoSchema,
+                  parsing={
+                      'pre_processors': (fix_encoding,
+                                         remove_comments,
+                                         remove_blank_lines),
+                  },
+                  handler_kwargs={'hierarchy': hierarchy},
+                  local=True),
+            Stage('hierarchy_admin1', ADMIN1_CODES_FILE_LOCAL_PATH,
+                  division_hierarchy_handler,
+                  schema=Admin1CodesSchema,
+                  handler_kwargs={'hierarchy': hierarchy},
+                  depends_on=('hierarchy_countries',),
+                  local=True),
+            Stage('hierarchy', CITIES_FILE_LOCAL_PATH.format(dataset=dataset),
+                  city_hierarchy_handler,
+                  parsing={
+                      'fields': list(GeoNameSchema().fields.keys()),
+                      'data_filter': cities_filter,
+                  },
+                  handler_kwargs={'hierarchy': hierarchy},
+                  finalize=hierarchy.build,
+                  depends_on=('hierarchy_admin1',),
+                  local=True),
+        ]
+        sources = [('ancestors_no_country', NO_COUNTRY_FILE_LOCAL_PATH)]
+        sources.extend(
+            ('ancestors_{0}'.format(country),
+             COUNTRY_OBJECTS_FILE_LOCAL_PATH.format(country=country))
+            for country in countries)
+        ancestors_filter = IdsFilter(hierarchy.ancestors)
+        previous = 'hierarchy'
+        for name, filepath in sources:
+            stages.append(self.get_objects_stage(
+                name, filepath, ancestors_filter, (previous,), options))
+            previous = name
+        stages.append(self.get_objects_stage(
+            'objects', CITIES_FILE_LOCAL_PATH.format(dataset=dataset),
+            cities_filter, (previous,), options))
+        for country in countries:
+            stages.extend(self.get_country_data_stages(
+                country, ('objects',), backend, options))
+        return stages
+
+    def get_countries(self, value):
+        """
+        Returns list of ISO codes of ``--countries`` option.
+        """
+        if not value:
+            return []
+        countries = []
+        for country in value.split(','):
+            country = country.strip().upper()
+            if not country:
+                continue
+            if len(country) != 2 or not country.isalpha():
+                raise CommandError('Invalid country code: {0}'.format(
+                    country))
+            if country not in countries:
+                countries.append(country)
+        return countries
+
+    def get_files(self, countries, cities=None):
+        """
+        Returns list of ``(remote, local)`` files to download and set of
+        URLs of them which may be absent (postal codes are published
+        not for all countries). Cities dataset is imported only with
+        ``countries``, so dumps of all countries are not needed for it.
+        """
+        files = [
+            (COUNTRIES_FILE_PATH, COUNTRIES_FILE_LOCAL_PATH),
+            (ADMIN1_CODES_FILE_PATH, ADMIN1_CODES_FILE_LOCAL_PATH),
+            (ADMIN2_CODES_FILE_PATH, ADMIN2_CODES_FILE_LOCAL_PATH),
+        ]
+        if cities:
+            files.append((CITIES_FILE_PATH.format(dataset=cities),
+                          CITIES_FILE_LOCAL_PATH.format(dataset=cities)))
+        else:
+            files.insert(0, (HIERARCHY_FILE_PATH, HIERARCHY_FILE_LOCAL_PATH))
+        optional = set()
+        if not countries:
+            files.extend([
+                (OBJECTS_FILE_PATH, OBJECTS_FILE_LOCAL_PATH),
+                (TRANSLATIONS_FILE_PATH, TRANSLATIONS_FILE_LOCAL_PATH),
+                (POSTAL_CODES_FILE_PATH, POSTAL_CODES_FILE_LOCAL_PATH),
+            ])
+            return files, optional
+        files.append((NO_COUNTRY_FILE_PATH, NO_COUNTRY_FILE_LOCAL_PATH))
+        for country in countries:
+            for remote, local in (
+                    (COUNTRY_OBJECTS_FILE_PATH,
+                     COUNTRY_OBJECTS_FILE_LOCAL_PATH),
+                    (COUNTRY_TRANSLATIONS_FILE_PATH,
+                     COUNTRY_TRANSLATIONS_FILE_LOCAL_PATH),
+                    (COUNTRY_POSTAL_CODES_FILE_PATH,
+                     COUNTRY_POSTAL_CODES_FILE_LOCAL_PATH)):
+                files.append((remote.format(country=country),
+                              local.format(country=country)))
+            optional.add(COUNTRY_POSTAL_CODES_FILE_PATH.format(
+                country=country))
+        return files, optional
+
+    def skip_unchanged(self, stages, fingerprints):
+        """
+        Returns stages which have to be imported: their file is changed
+        since the last successful import or some of stages they depend
+        on is imported. Local stages share hierarchy, so they are
+        skipped only all together. Stages are in order of dependencies.
+        """
+        unchanged = set(
+            stage.name for stage in stages
+            if self.manifest.is_imported(stage.name,
+                                         fingerprints[stage.name]))
+        local = set(stage.name for stage in stages if stage.local)
+        if not local <= unchanged:
+            unchanged -= local
+        skipped = set()
+        for stage in stages:
+            if stage.name in unchanged and \
+                    all(name in skipped for name in stage.depends_on):
+                logger.info('Stage %s is skipped, file %s is not changed '
+                            'since the last import.', stage.name,
+                            stage.filepath)
+                skipped.add(stage.name)
+        stages = [stage for stage in stages if stage.name not in skipped]
+        for stage in stages:
+            stage.depends_on = tuple(name for name in stage.depends_on
+                                     if name not in skipped)
+        return stages
+
+    def verify(self):
+        """
+        Checks SHA-256 of all downloaded files.
+        """
+        corrupted = []
+        for remote, entry in sorted(self.manifest.load()['files'].items()):
+            if not os.path.exists(entry['local']):
+                continue
+            if self.manifest.verify(entry['local'], deep=True):
+                logger.info('File %s is verified.', entry['local'])
+            else:
+                logger.error('File %s does not match its download from %s',
+                             entry['local'], remote)
+                corrupted.append(entry['local'])
+        if corrupted:
+            raise CommandError('Corrupted files: {0}. Download them '
+                               'again with --download.'.format(
+                                   ', '.join(corrupted)))
+
+    def get_hierarchy_stage(self):
+        return Stage('hierarchy', HIERARCHY_FILE_LOCAL_PATH,
+                     hierarchy_builder_handler,
+                     parsing={
+                         'fields': ('parent', 'child', 'type'),
+                     },
+                     handler_kwargs={
+                         'tree': self.hierarchy
+                     },
+                     finalize=self.build_hierarchy,
+                     local=True)
+
+    def get_hierarchy(self):
+        if not self.hierarchy.is_built and not self.load_hierarchy():
+            self.get_hierarchy_stage().run(self.parser)
+        return self.hierarchy
+
+    def get_hierarchy_cache(self):
+        """
+        Returns directory of cached hierarchy for the current hierarchy
+        file, keyed by its ETag or SHA-256 from manifest (or size and
+        modification time of local file if it was not downloaded) and
+        ignored objects.
+        """
+        entry = self.manifest.get_file(HIERARCHY_FILE_PATH)
+        key = entry and (entry['etag'] or entry['sha256'])
+        if not key:
+            if not os.path.exists(HIERARCHY_FILE_LOCAL_PATH):
+                return None
+            stat = os.stat(HIERARCHY_FILE_LOCAL_PATH)
+            key = '{0}-{1}'.format(stat.st_size, int(stat.st_mtime))
+        key = '{0}:{1}'.format(key, sorted(OBJECTS_IGNORE))
+        return os.path.join(HIERARCHY_CACHE_DIR,
+                            hashlib.md5(key.encode('utf-8')).hexdigest())
+
+    def load_hierarchy(self):
+        cache = self.get_hierarchy_cache()
+        return cache is not None and self.hierarchy.load(cache)
+
+    def build_hierarchy(self):
+        self.hierarchy.build()
+        cache = self.get_hierarchy_cache()
+        if cache is None:
+            return
+        # Hierarchy of previous files is not needed anymore
+        if os.path.isdir(HIERARCHY_CACHE_DIR):
+            shutil.rmtree(HIERARCHY_CACHE_DIR)
+        self.hierarchy.save(cache)
+
+    def sync(self, source, since=None):
+        if since:
+            last_applied = datetime.datetime.strptime(
+                since, DATE_FORMAT).date()
+        else:
+            last_applied = self.get_sync_date()
+        until = datetime.date.today() - datetime.timedelta(days=1)
+        delta_sync = DeltaSync(source, SYNC_DATA_DIR, self.parser,
+                               self.download, self.get_hierarchy,
+                               GeoNameSchema, AlternateNameSchema)
+        for date in get_dates(last_applied, until):
+            if not delta_sync.apply(date):
+                logger.warning('Deltas of %s are not available yet.',
+                               date.strftime(DATE_FORMAT))
+                break
+            self.set_sync_date(source, date)
+
+    def get_sync_date(self):
+        date = self.manifest.get_sync().get('date')
+        if date:
+            return datetime.datetime.strptime(date, DATE_FORMAT).date()
+        return None
+
+    def set_sync_date(self, source, date):
+        self.manifest.set_sync(source, date.strftime(DATE_FORMAT))
 
     def mkdir(self, path):
         path, _ = os.path.split(path)  # get only path to file
@@ -234,169 +874,4 @@ class Command(BaseCommand):
         logger.info('Created folder %s', path)
 
     def download(self, remote, local):
-        self.mkdir(local)
-
-        r = requests.get(remote, stream=True)
-        downloaded = 0
-        total_length = int(r.headers.get('content-length'))
-
-        if os.path.exists(local):
-            etag = r.headers.get('etag')
-            is_updated = self.is_file_updated(remote, local, etag)
-            if is_updated:
-                logger.info(
-                    'File %s is up-to-date (Etag: %s).', local, etag)
-                return
-            else:
-                logger.info(
-                    'File %s is outdated. Needs to update now.', local)
-
-            backup = local + '.bak'
-            logger.info(
-                'Create backup of existing local file to %s', backup)
-            shutil.copy2(local, backup)
-
-        logger.info('Download of %s in progress\n'
-                    'Size: %s bytes\n',
-                    remote, total_length)
-
-        # TODO: Use https://github.com/tqdm/tqdm
-        with open(local, 'wb') as f:
-            start = time.clock()
-            for chunk in r.iter_content(chunk_size=1024):
-                if chunk:
-                    downloaded += len(chunk)
-                    f.write(chunk)
-                    f.flush()
-                    done = int(self.progress_width * downloaded / total_length)
-                    percent = float(downloaded) / float(total_length)
-                    bps = int(downloaded // (time.clock() - start) / 1024)
-                    done_bar = '=' * done
-                    remain_bar = ' ' * (self.progress_width - done)
-                    print(
-                        "[{0}{1}] done: {2:.0%} | speed: {3} kbps".format(
-                            done_bar, remain_bar, percent, bps
-                        ),
-                        end='\r'
-                    )
-        self.update_status(remote, local, r.headers)
-        r.close()
-        print('\n')
-        return local
-
-    def update_status(self, remote, local, headers):
-        status = self.get_status()
-        update = {
-            'remote': remote,
-            'local': local,
-            'etag': headers.get('etag'),
-            'content_length': headers.get('content-length'),
-            'last_modified': headers.get('last-modified'),
-            'date': headers.get('date'),
-        }
-        with open(self.status_file, 'wb') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=self.status_fields)
-            writer.writeheader()
-            if not status:
-                status = [update, ]
-            else:
-                status = [f for f in status if f['remote'] != update['remote']]
-                status.append(update)
-            for row in status:
-                writer.writerow(row)
-
-    def get_status(self):
-        result = []
-        if os.path.exists(self.status_file):
-            with open(self.status_file) as csvfile:
-                reader = csv.DictReader(csvfile, fieldnames=self.status_fields)
-                result = [r for r in reader][1:]  # ignore first row (header)
-        return result
-
-    def is_file_updated(self, remote, local, etag):
-        status = self.get_status()
-        is_updated = False
-        for row in status:
-            if row['remote'] == remote and \
-               row['local'] == local and \
-               row['etag'] == etag:
-                is_updated = True
-        return is_updated
-
-    def parse(self, filepath, fields, data_filter=None, pre_processors=()):
-        if os.path.exists(filepath):
-            if pre_processors:
-                for process in pre_processors:
-                    process(filepath)
-            filename, ext = os.path.splitext(os.path.basename(filepath))
-            data = filepath
-            if ext.lower() == '.zip':
-                with open(filepath) as csv_archive:
-                    zfile = zipfile.ZipFile(csv_archive)
-                    file_in_zip = '.'.join([filename, 'txt'])
-                    data = StringIO(zfile.read(file_in_zip))
-
-            if self.without_pandas_mode:
-                reader = csv.DictReader(data,
-                                        dialect=GeoNamesDialect(),
-                                        fieldnames=fields)
-                for row in reader:
-                    yield row
-            else:
-                # dtype = {}
-                # num_types_to_dtype = {
-                #     int: np.int32,
-                #     float: np.float64,
-                #     decimal.Decimal: np.float64,
-                # }
-                # for name in schema.fields.keys():
-                #     field_type = 'str'
-                #     field = schema.fields[name]
-                #     if hasattr(field, 'num_type'):
-                #         if field.num_type in num_types_to_dtype.keys():
-                #             field_type = num_types_to_dtype[field.num_type]
-                #     dtype[name] = field_type
-                # pprint(dtype)
-
-                options = {}
-                if self.memory_mode == 'low':
-                    options['iterator'] = True
-                    options['chunksize'] = 1024
-
-                reader = pandas.read_csv(data,
-                                         engine='c',
-                                         sep=str('\t'),
-                                         escapechar=None,
-                                         quoting=csv.QUOTE_NONE,
-                                         lineterminator=str('\n'),
-                                         header=None,
-                                         names=fields,
-                                         na_values=None,
-                                         na_filter=False,
-                                         keep_default_na=False,
-                                         # dtype=dtype)
-                                         dtype='str',
-                                         **options)
-                # Low memory usage mode
-                # ./manage.py smartgeonames --memory-mode low  265,09s user 1,11s system 99% cpu 4:27,65 total
-                if self.memory_mode == 'low':
-                    for records in reader:
-                        for row in records.itertuples():
-                            is_ignored = False
-                            data = row._asdict()
-                            if data_filter:
-                                if not data_filter(data):
-                                    is_ignored = True
-                            yield data, is_ignored
-                # Normal memory usage mode
-                # ./manage.py smartgeonames --memory-mode normal  256,56s user 1,08s system 99% cpu 4:18,95 total
-                elif self.memory_mode == 'normal':
-                    for row in reader.itertuples():
-                        yield row._asdict()
-                # Maximum memory usage mode
-                # ./manage.py smartgeonames --memory-mode max  230,07s user 1,90s system 99% cpu 3:53,09 total
-                else:
-                    for row in reader.to_dict(orient='records'):
-                        yield row
-        else:
-            logger.error('File %s is not exists.', filepath)
+        return self.downloader.download(remote, local)
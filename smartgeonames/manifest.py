@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals, print_function
+
+import csv
+import datetime
+import errno
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+
+from django.utils import six
+
+logger = logging.getLogger("smartgeonames")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def makedirs(path):
+    try:
+        os.makedirs(path)
+    except os.error as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+
+def hash_file(path):
+    """
+    Returns SHA-256 hash object of file, it may be updated further.
+    """
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256
+
+
+def get_sha256(path):
+    return hash_file(path).hexdigest()
+
+
+def now():
+    return datetime.datetime.utcnow().replace(microsecond=0).isoformat()
+
+
+class Manifest(object):
+    """
+    JSON manifest of downloaded files and imports::
+
+        {
+            "files": {remote URL: {"local", "etag", "size", "sha256",
+                                   "last_modified", "date", "downloaded",
+                                   "mtime"}},
+            "imports": {stage: {"input", "sha256", "imported"}},
+            "sync": {"source", "date"}
+        }
+
+    Manifest is read once and kept in memory, files are found by URL
+    or local path in dictionaries. Updates are serialized by lock and
+    the file is replaced atomically.
+
+    Local file is verified cheaply by size and modification time
+    recorded after download, SHA-256 is computed only when they differ
+    or on demand (``deep``).
+    """
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.data = None
+        self.remotes = {}
+
+    def load(self):
+        with self.lock:
+            if self.data is None:
+                self.data = self.read()
+                self.remotes = dict(
+                    (entry['local'], remote)
+                    for remote, entry in six.iteritems(self.data['files']))
+            return self.data
+
+    def read(self):
+        data = {
+            'version': self.version,
+            'files': {},
+            'imports': {},
+            'sync': {},
+        }
+        if not os.path.exists(self.path):
+            return data
+        with io.open(self.path, encoding='utf-8') as f:
+            try:
+                data.update(json.load(f))
+            except ValueError:
+                logger.warning('Manifest %s is broken, ignored.', self.path)
+        return data
+
+    def save(self):
+        with self.lock:
+            makedirs(os.path.dirname(os.path.abspath(self.path)))
+            partial = self.path + '.part'
+            with io.open(partial, 'w', encoding='utf-8') as f:
+                f.write(six.text_type(json.dumps(self.load(), indent=2,
+                                                 sort_keys=True)))
+            os.rename(partial, self.path)
+
+    def get_file(self, remote):
+        return self.load()['files'].get(remote)
+
+    def find_file(self, local):
+        """
+        Returns entry of downloaded file by its local path or None.
+        """
+        self.load()
+        remote = self.remotes.get(local)
+        return self.get_file(remote) if remote else None
+
+    def add_file(self, remote, local, etag=None, size=None, sha256=None,
+                 last_modified=None, date=None):
+        with self.lock:
+            previous = self.find_file(local)
+            if previous is not None:
+                self.data['files'].pop(self.remotes[local])
+            self.load()['files'][remote] = {
+                'local': local,
+                'etag': etag,
+                'size': size,
+                'sha256': sha256,
+                'last_modified': last_modified,
+                'date': date,
+                'downloaded': now(),
+                'mtime': os.path.getmtime(local),
+            }
+            self.remotes[local] = remote
+            self.save()
+
+    def verify(self, local, deep=False):
+        """
+        Checks that local file is the downloaded one: by size and
+        modification time, by SHA-256 if they differ or if ``deep``.
+        """
+        entry = self.find_file(local)
+        if entry is None or not os.path.exists(local):
+            return False
+        stat = os.stat(local)
+        if entry['size'] is not None and stat.st_size != entry['size']:
+            return False
+        if not deep and stat.st_mtime == entry['mtime']:
+            return True
+        if entry['sha256'] is None or get_sha256(local) != entry['sha256']:
+            return False
+        with self.lock:
+            entry['mtime'] = stat.st_mtime
+            self.save()
+        return True
+
+    def get_sha256(self, local):
+        """
+        Returns SHA-256 of local file, computed only if the file is not
+        verified as downloaded. None if file is not exists.
+        """
+        if not os.path.exists(local):
+            return None
+        if self.verify(local):
+            return self.find_file(local)['sha256']
+        return get_sha256(local)
+
+    def is_imported(self, stage, sha256):
+        entry = self.load()['imports'].get(stage)
+        return sha256 is not None and entry is not None and \
+            entry['sha256'] == sha256
+
+    def set_imported(self, stage, local, sha256):
+        with self.lock:
+            self.load()['imports'][stage] = {
+                'input': local,
+                'sha256': sha256,
+                'imported': now(),
+            }
+            self.save()
+
+    def get_sync(self):
+        return self.load()['sync']
+
+    def set_sync(self, source, date):
+        with self.lock:
+            self.load()['sync'] = {
+                'source': source,
+                'date': date,
+            }
+            self.save()
+
+    def migrate(self, status_path):
+        """
+        Moves downloads and sync date from legacy ``status.csv`` to
+        manifest, so files are not downloaded again.
+        """
+        if not os.path.exists(status_path):
+            return
+        fields = ['remote', 'local', 'etag', 'content_length',
+                  'last_modified', 'date']
+        # csv module of Python 2 works with bytes
+        if six.PY2:
+            f = open(status_path, 'rb')
+        else:
+            f = io.open(status_path, newline='', encoding='utf-8')
+        with f:
+            rows = list(csv.DictReader(f, fieldnames=fields))[1:]
+        with self.lock:
+            for row in rows:
+                if row['remote'] == 'sync':
+                    self.load()['sync'] = {
+                        'source': row['local'],
+                        'date': row['date'],
+                    }
+                elif os.path.exists(row['local']):
+                    size = row['content_length']
+                    self.add_file(row['remote'], row['local'],
+                                  etag=row['etag'] or None,
+                                  size=int(size) if size else None,
+                                  sha256=get_sha256(row['local']),
+                                  last_modified=row['last_modified'] or None,
+                                  date=row['date'] or None)
+            self.save()
+        os.remove(status_path)
+        logger.info('Status file %s is migrated to manifest %s',
+                    status_path, self.path)
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartgeonames', '0003_auto_20151225_0022'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geonamesrecordtranslation',
+            name='alternatenameid',
+            field=models.IntegerField(db_index=True, null=True, verbose_name='GeoNames alternate name ID', blank=True),
+        ),
+    ]
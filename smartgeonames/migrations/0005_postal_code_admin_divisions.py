@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartgeonames', '0004_geonamesrecordtranslation_alternatenameid'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='postalcode',
+            name='accuracy',
+            field=models.PositiveIntegerField(null=True, blank=True),
+        ),
+        migrations.AlterField(
+            model_name='postalcode',
+            name='admin1',
+            field=models.ForeignKey(related_name='admin1_postal_codes', verbose_name='GeoNames record for the 1st administrative division', blank=True, to='smartgeonames.GeoNamesRecord', null=True),
+        ),
+        migrations.AlterField(
+            model_name='postalcode',
+            name='admin2',
+            field=models.ForeignKey(related_name='admin2_postal_codes', verbose_name='GeoNames record for the 2nd administrative division', blank=True, to='smartgeonames.GeoNamesRecord', null=True),
+        ),
+        migrations.AlterField(
+            model_name='postalcode',
+            name='admin3',
+            field=models.ForeignKey(related_name='admin3_postal_codes', verbose_name='GeoNames record for the 3rd administrative division', blank=True, to='smartgeonames.GeoNamesRecord', null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartgeonames', '0005_postal_code_admin_divisions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='countryinfo',
+            name='tld',
+            field=models.CharField(max_length=3, verbose_name='Top-level domain', blank=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartgeonames', '0006_countryinfo_tld'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdminCode',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('country_code', models.CharField(max_length=2, verbose_name='Country code')),
+                ('admin1_code', models.CharField(max_length=20, verbose_name='Code for the 1st administrative division')),
+                ('admin2_code', models.CharField(max_length=80, verbose_name='Code for the 2nd administrative division', blank=True)),
+                ('name', models.CharField(max_length=200, verbose_name='Name')),
+                ('asciiname', models.CharField(max_length=200, verbose_name='Name in ASCII')),
+                ('geonameid', models.IntegerField(verbose_name='GeoNames ID', db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Admin division code',
+                'verbose_name_plural': 'Admin division codes',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='admincode',
+            unique_together=set([('country_code', 'admin1_code', 'admin2_code')]),
+        ),
+    ]
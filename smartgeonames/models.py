@@ -26,6 +26,9 @@ class GeoNamesRecord(MP_Node, TranslatableModel, TimeStampedModel):
     geonameid = models.IntegerField(_('GeoNames ID'), primary_key=True)
     translations = TranslatedFields(
             name=models.CharField(_('Name'), max_length=255),
+            alternatenameid=models.IntegerField(
+                    _('GeoNames alternate name ID'), blank=True, null=True,
+                    db_index=True),
     )
     asciiname = models.CharField(_('Name in ASCII'), max_length=255)
     alternatenames = models.TextField(_('Alternate names'), max_length=10000,
@@ -125,7 +128,7 @@ class CountryInfo(TimeStampedModel, models.Model):
                                   verbose_name=_('Continent'),
                                   related_name='countries',
                                   blank=True, null=True)
-    tld = models.CharField(_('Top-level domain'), max_length=2, blank=True)
+    tld = models.CharField(_('Top-level domain'), max_length=3, blank=True)
     currency_code = models.CharField(_('Currency code'), max_length=3,
                                      db_index=True, blank=True)
     postal_code_format = models.CharField(_('Postal code format'),
@@ -154,28 +157,51 @@ class PostalCode(TimeStampedModel, models.Model):
                                 verbose_name=_('Country'))
     code = models.CharField(_('Postal code'), max_length=20, db_index=True)
     place_name = models.CharField(_('Place name'), max_length=180)
-    admin1 = models.OneToOneField(
+    admin1 = models.ForeignKey(
             'smartgeonames.GeoNamesRecord',
             verbose_name=_(
                 'GeoNames record for the 1st administrative division'),
-            related_name='admin1_postal_code',
+            related_name='admin1_postal_codes',
             blank=True, null=True)
-    admin2 = models.OneToOneField(
+    admin2 = models.ForeignKey(
             'smartgeonames.GeoNamesRecord',
             verbose_name=_(
                 'GeoNames record for the 2nd administrative division'),
-            related_name='admin2_postal_code',
+            related_name='admin2_postal_codes',
             blank=True, null=True)
-    admin3 = models.OneToOneField(
+    admin3 = models.ForeignKey(
             'smartgeonames.GeoNamesRecord',
             verbose_name=_(
                 'GeoNames record for the 3rd administrative division'),
-            related_name='admin3_postal_code',
+            related_name='admin3_postal_codes',
             blank=True, null=True)
     # latitude & longitude
     location = PointField()
-    accuracy = models.PositiveIntegerField()
+    accuracy = models.PositiveIntegerField(blank=True, null=True)
 
     class Meta:
         verbose_name = _('Postal code')
         verbose_name_plural = _('Postal codes')
+
+
+class AdminCode(TimeStampedModel, models.Model):
+    """
+    Names of admin divisions of the 1st and 2nd order by their codes.
+    ``admin2_code`` is empty for divisions of the 1st order.
+    """
+    country_code = models.CharField(_('Country code'), max_length=2)
+    admin1_code = models.CharField(
+            _('Code for the 1st administrative division'), max_length=20)
+    admin2_code = models.CharField(
+            _('Code for the 2nd administrative division'), max_length=80,
+            blank=True)
+    name = models.CharField(_('Name'), max_length=200)
+    asciiname = models.CharField(_('Name in ASCII'), max_length=200)
+    geonameid = models.IntegerField(_('GeoNames ID'), db_index=True)
+
+    class Meta:
+        unique_together = [
+            ('country_code', 'admin1_code', 'admin2_code'),
+        ]
+        verbose_name = _('Admin division code')
+        verbose_name_plural = _('Admin division codes')
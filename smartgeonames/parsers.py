@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals, print_function
+
+import csv
+import io
+import itertools
+import logging
+import os
+import shutil
+import zipfile
+from timeit import default_timer
+
+import pandas
+from django.utils import six
+
+try:
+    from pandas.errors import EmptyDataError
+except ImportError:
+    from pandas.io.common import EmptyDataError
+
+from smartgeonames import settings
+from smartgeonames.instrumentation import FILTER, PARSE, timings
+
+CHUNK_SIZE = settings.CHUNK_SIZE
+
+logger = logging.getLogger("smartgeonames")
+
+COPY_BUFFER_SIZE = 1024 * 1024
+READ_BUFFER_SIZE = 1024 * 1024
+
+
+class GeoNamesDialect(csv.Dialect):
+    delimiter = str('\t')
+    escapechar = None
+    strict = True
+    quoting = csv.QUOTE_NONE
+    lineterminator = str('\r\n')
+
+
+class LineStream(io.RawIOBase):
+    """
+    Read-only binary file object over iterator of lines, e.g. output
+    of pre-processors. Closes ``source`` file object on close.
+    """
+    def __init__(self, lines, source=None):
+        super(LineStream, self).__init__()
+        self.lines = lines
+        self.source = source
+        self.rest = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = len(buffer)
+        chunks = [self.rest]
+        length = len(self.rest)
+        while length < size:
+            try:
+                line = next(self.lines)
+            except StopIteration:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = b''.join(chunks)
+        chunk, self.rest = data[:size], data[size:]
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+    def close(self):
+        if self.source is not None:
+            self.source.close()
+        super(LineStream, self).close()
+
+
+class CountingStream(io.RawIOBase):
+    """
+    Read-only binary file object which counts bytes read from ``raw``.
+    """
+    def __init__(self, raw):
+        super(CountingStream, self).__init__()
+        self.raw = raw
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = self.raw.readinto(buffer)
+        self.count += size or 0
+        return size
+
+    def close(self):
+        self.raw.close()
+        super(CountingStream, self).close()
+
+
+class Parser(object):
+    """
+    Parser of GeoNames dumps. Yields records accepted by ``data_filter``
+    as dictionaries, the number of rejected ones is kept in ``ignored``.
+
+    ``position`` is the number of rows of file which are read and whose
+    records are consumed by caller, so reading may be continued from it
+    by ``skip`` argument.
+    """
+    def __init__(self, memory_mode='low', without_pandas_mode=False):
+        self.memory_mode = memory_mode
+        self.without_pandas_mode = without_pandas_mode
+        self.ignored = 0
+        self.position = 0
+        self.size = 0
+        self.stream = None
+
+    def get_options(self):
+        return {
+            'memory_mode': self.memory_mode,
+            'without_pandas_mode': self.without_pandas_mode,
+        }
+
+    def open(self, filepath, pre_processors=()):
+        """
+        Returns file object of GeoNames file for ``read`` and
+        ``read_frames`` or None if file is not exists. Text file inside
+        of zip archive is read as a stream, so memory usage is bounded
+        by the size of chunk. Caller is responsible for closing it.
+        """
+        if not os.path.exists(filepath):
+            logger.error('File %s is not exists.', filepath)
+            return None
+        filename, ext = os.path.splitext(os.path.basename(filepath))
+        if ext.lower() == '.zip':
+            with zipfile.ZipFile(filepath) as zfile:
+                file_in_zip = '.'.join([filename, 'txt'])
+                self.size = zfile.getinfo(file_in_zip).file_size
+                raw = zfile.open(file_in_zip)
+        else:
+            self.size = os.path.getsize(filepath)
+            raw = io.open(filepath, 'rb', buffering=0)
+        self.stream = CountingStream(raw)
+        data = io.BufferedReader(self.stream, buffer_size=READ_BUFFER_SIZE)
+        if pre_processors:
+            lines = iter(data)
+            for process in pre_processors:
+                lines = process(lines)
+            data = io.BufferedReader(LineStream(lines, data),
+                                     buffer_size=READ_BUFFER_SIZE)
+        return self.wrap(data)
+
+    def get_fraction(self):
+        """
+        Part of file opened by ``open`` which is read, from 0 to 1.
+        """
+        if self.stream is None or not self.size:
+            return None
+        return float(self.stream.count) / self.size
+
+    def open_range(self, filepath, start, end):
+        """
+        Returns data source of part of plain text file between byte
+        offsets. Both offsets must be aligned to the start of line.
+        """
+        with open(filepath, 'rb') as f:
+            f.seek(start)
+            data = io.BytesIO(f.read(end - start))
+        return self.wrap(data)
+
+    def wrap(self, data):
+        # csv module of Python 3 needs text, Pandas is fine with bytes
+        if self.without_pandas_mode and six.PY3:
+            data = io.TextIOWrapper(data, encoding='utf-8')
+        return data
+
+    def parse(self, filepath, fields, data_filter=None, pre_processors=()):
+        data = self.open(filepath, pre_processors)
+        if data is not None:
+            try:
+                for row in self.read(data, fields, data_filter):
+                    yield row
+            finally:
+                data.close()
+
+    def read(self, data, fields, data_filter=None, skip=0):
+        if self.without_pandas_mode:
+            self.ignored = 0
+            self.position = skip
+            reader = csv.DictReader(data,
+                                    dialect=GeoNamesDialect(),
+                                    fieldnames=fields)
+            rows = itertools.islice(reader, skip, None)
+            while True:
+                started = default_timer()
+                row = next(rows, None)
+                parsed = default_timer()
+                timings.add(PARSE, parsed - started)
+                if row is None:
+                    break
+                if data_filter:
+                    accepted = data_filter(row)
+                    timings.add(FILTER, default_timer() - parsed)
+                    if not accepted:
+                        self.ignored += 1
+                        self.position += 1
+                        continue
+                yield row
+                self.position += 1
+        else:
+            for records in self.read_frames(data, fields, data_filter,
+                                            skip):
+                # Maximum memory usage mode
+                if self.memory_mode == 'max':
+                    for row in records.to_dict(orient='records'):
+                        yield row
+                else:
+                    for row in records.itertuples(index=False):
+                        yield row._asdict()
+
+    def read_frames(self, data, fields, data_filter=None, skip=0):
+        """
+        Yields pandas DataFrames of records accepted by ``data_filter``.
+        """
+        self.ignored = 0
+        self.position = skip
+        # dtype = {}
+        # num_types_to_dtype = {
+        #     int: np.int32,
+        #     float: np.float64,
+        #     decimal.Decimal: np.float64,
+        # }
+        # for name in schema.fields.keys():
+        #     field_type = 'str'
+        #     field = schema.fields[name]
+        #     if hasattr(field, 'num_type'):
+        #         if field.num_type in num_types_to_dtype.keys():
+        #             field_type = num_types_to_dtype[field.num_type]
+        #     dtype[name] = field_type
+        # pprint(dtype)
+
+        options = {}
+        if self.memory_mode == 'low':
+            options['iterator'] = True
+            options['chunksize'] = CHUNK_SIZE
+        if skip:
+            options['skiprows'] = skip
+
+        try:
+            with timings.measure(PARSE):
+                reader = self.read_csv(data, fields, **options)
+        except EmptyDataError:
+            return
+        # Low memory usage mode reads file by chunks,
+        # normal and maximum memory usage modes read whole file at once
+        frames = iter(reader if self.memory_mode == 'low' else (reader,))
+        while True:
+            with timings.measure(PARSE):
+                records = next(frames, None)
+            if records is None:
+                break
+            rows = len(records)
+            ignored = 0
+            if data_filter:
+                with timings.measure(FILTER):
+                    mask = data_filter.mask(records)
+                    ignored = rows - int(mask.sum())
+                    records = records[mask]
+            yield records
+            # Frame is consumed
+            self.ignored += ignored
+            self.position += rows
+
+    def read_csv(self, data, fields, **options):
+        return pandas.read_csv(data,
+                               engine='c',
+                               sep=str('\t'),
+                               escapechar=None,
+                               quoting=csv.QUOTE_NONE,
+                               lineterminator=str('\n'),
+                               header=None,
+                               names=fields,
+                               na_values=None,
+                               na_filter=False,
+                               keep_default_na=False,
+                               # dtype=dtype)
+                               dtype='str',
+                               **options)
+
+
+def extract(filepath):
+    """
+    Decompress text file from GeoNames zip archive next to it, once.
+    Returns path to plain text file.
+    """
+    path, ext = os.path.splitext(filepath)
+    if ext.lower() != '.zip':
+        return filepath
+    extracted = path + '.txt'
+    if os.path.exists(extracted) and \
+       os.path.getmtime(extracted) >= os.path.getmtime(filepath):
+        return extracted
+    logger.info('Extract %s to %s', filepath, extracted)
+    file_in_zip = '.'.join([os.path.basename(path), 'txt'])
+    partial = extracted + '.part'
+    with zipfile.ZipFile(filepath) as zfile:
+        source = zfile.open(file_in_zip)
+        try:
+            with open(partial, 'wb') as target:
+                shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+        finally:
+            source.close()
+    os.rename(partial, extracted)
+    return extracted
+
+
+def split_file(filepath, shard_size, start=0):
+    """
+    Split plain text file from byte offset ``start`` to byte ranges of
+    about ``shard_size`` bytes, aligned to line ends.
+    """
+    total = os.path.getsize(filepath)
+    ranges = []
+    with open(filepath, 'rb') as f:
+        while start < total:
+            end = min(start + shard_size, total)
+            if end < total:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
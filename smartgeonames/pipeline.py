@@ -0,0 +1,501 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals, print_function
+
+import collections
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from contextlib import closing
+
+from django import db
+
+from smartgeonames import settings
+from smartgeonames.checkpoints import CheckpointError
+from smartgeonames.instrumentation import SCHEMA, timings
+from smartgeonames.parsers import Parser, extract, split_file
+from smartgeonames.progress import Progress
+from smartgeonames.validation import BatchValidator
+
+SHARD_SIZE = settings.SHARD_SIZE
+
+logger = logging.getLogger("smartgeonames")
+
+
+class Stage(object):
+    """
+    One step of import: file, schema, handler of valid records
+    ``handler(data, **handler_kwargs)`` and its settings.
+
+    Local stages are always executed in the main process, because
+    they share state with it (e.g. hierarchy tree). Other stages
+    may be executed in worker processes, so everything they hold
+    must be picklable.
+
+    With ``checkpoint`` finished stage is skipped on the next run.
+    Stage with ``resumable`` state (see ``handlers.HierarchyState``)
+    also saves its position in file every ``checkpoint.interval`` rows
+    and is continued from the last saved position. State of skipped
+    stage is restored, so stages sharing it (e.g. objects of several
+    countries) continue where the finished one stopped.
+
+    Position of stage is the number of rows of file (``position_kind``),
+    stage interrupted with position of another kind is not resumed.
+
+    Progress is shown by ``progress.Progress``, the first
+    ``max_logged_errors`` invalid records are logged as warnings and
+    the rest of them only in debug.
+    """
+    max_logged_errors = 10
+    position_kind = 'rows'
+
+    def __init__(self, name, filepath, handler, schema=None, parsing=None,
+                 handler_kwargs=None, finalize=None, depends_on=(),
+                 local=False, checkpoint=None, resumable=None):
+        self.name = name
+        self.filepath = filepath
+        self.handler = handler
+        self.schema = schema
+        self.parsing = parsing or {}
+        self.handler_kwargs = handler_kwargs or {}
+        self.finalize = finalize
+        self.depends_on = tuple(depends_on)
+        self.local = local
+        self.checkpoint = checkpoint
+        self.resumable = resumable
+
+    def __repr__(self):
+        return '<Stage: {0}>'.format(self.name)
+
+    def load_checkpoint(self):
+        """
+        Returns saved state of stage or None. Saved state of resumable
+        stage is restored.
+        """
+        if self.checkpoint is None:
+            return None
+        verify = self.is_committed if self.resumable else None
+        state = self.checkpoint.load(self.name, verify)
+        if state is None:
+            return None
+        if state['done']:
+            logger.info('Stage %s is already done.', self.name)
+            # Next stages continue from the state this stage left
+            if self.resumable is not None and state['state'] is not None:
+                self.resumable.set_state(state['state'],
+                                         state.get('journal', ()))
+        elif self.resumable is None:
+            return None
+        else:
+            position_kind = state.get('position_kind', 'rows')
+            if position_kind != self.position_kind:
+                raise CheckpointError(
+                    'Stage {0} was interrupted at position in {1}, it can '
+                    'not be resumed at position in {2}. Resume it with '
+                    'the same --parse-jobs or import it again without '
+                    '--resume.'.format(self.name, position_kind,
+                                       self.position_kind))
+            logger.info('Resume stage %s from position %s',
+                        self.name, state['position'])
+            self.resumable.set_state(state['state'],
+                                     state.get('journal', ()))
+        return state
+
+    def is_committed(self, state):
+        return state['state'] is not None and \
+            self.resumable.is_committed(state['state'])
+
+    def save_checkpoint(self, position, counters, done=False):
+        state = {
+            'position': position,
+            'position_kind': self.position_kind,
+            'counters': counters,
+            'done': done,
+            'state': None,
+        }
+        commit = None
+        journal = None
+        if self.resumable:
+            state['state'] = self.resumable.get_state()
+            journal = self.resumable.get_changes()
+            if not done:
+                commit = self.resumable.commit
+        self.checkpoint.save(self.name, state, commit, journal)
+
+    def is_resumable(self):
+        return self.checkpoint is not None and self.resumable is not None
+
+    def log_error(self, counters, row, data, errors):
+        log = logger.warning \
+            if counters['errors'] <= self.max_logged_errors else logger.debug
+        log('Stage %s, row %s: %s %s', self.name, row, data, errors)
+
+    def run(self, parser):
+        schema = self.schema() if self.schema else None
+        parsing_kwargs = dict(self.parsing)
+        schema_fields = list(schema.fields.keys()) if schema else ()
+        fields = parsing_kwargs.get('fields', schema_fields)
+        counters = {
+            'records': 0,
+            'ignored': 0,
+            'errors': 0,
+            'imported': 0,
+        }
+        position = 0
+        state = self.load_checkpoint()
+        if state is not None:
+            if state['done']:
+                return dict(state['counters'])
+            counters.update(state['counters'])
+            position = state['position']
+        logger.info('Importing file %s', self.filepath)
+        resumed_ignored = counters['ignored']
+        last_checkpoint = position
+        source = parser.open(self.filepath,
+                             parsing_kwargs.get('pre_processors', ()))
+        if source is not None:
+            progress = Progress(self.name, get_fraction=parser.get_fraction,
+                                counters=counters)
+            with closing(source):
+                records = load_records(parser, source, fields, schema,
+                                       parsing_kwargs.get('data_filter'),
+                                       skip=position)
+                for data, errors in records:
+                    counters['ignored'] = resumed_ignored + parser.ignored
+                    # All records before current position are handled
+                    if self.is_resumable() and parser.position - \
+                            last_checkpoint >= self.checkpoint.interval:
+                        self.save_checkpoint(parser.position, counters)
+                        last_checkpoint = parser.position
+                    counters['records'] += 1
+                    row = counters['records'] + counters['ignored']
+                    progress.update(row)
+                    if errors:
+                        counters['errors'] += 1
+                        self.log_error(counters, row, data, errors)
+                    else:
+                        self.handler(data, **self.handler_kwargs)
+                        counters['imported'] += 1
+            progress.finish()
+            counters['ignored'] = resumed_ignored + parser.ignored
+        return self.done(counters)
+
+    def done(self, counters):
+        if self.finalize:
+            self.finalize()
+        stats = dict(counters)
+        stats['records'] += stats['ignored']
+        if self.checkpoint is not None:
+            self.save_checkpoint(None, stats, done=True)
+        logger.info('Stage %s: %s records parsed, %s with errors',
+                    self.name, stats['records'], stats['errors'])
+        return stats
+
+
+def load_records(parser, source, fields, schema=None, data_filter=None,
+                 skip=0):
+    """
+    Yields ``(data, errors)`` for every accepted record of source
+    after first ``skip`` rows. Records are validated by schema in
+    batches in Pandas mode and one by one otherwise.
+    """
+    if schema is None:
+        for data in parser.read(source, fields, data_filter, skip):
+            yield data, {}
+    elif parser.without_pandas_mode:
+        for data in parser.read(source, fields, data_filter, skip):
+            with timings.measure(SCHEMA):
+                result = schema.load(data)
+            yield (data if result.errors else result.data), result.errors
+    else:
+        validator = BatchValidator(schema)
+        for frame in parser.read_frames(source, fields, data_filter, skip):
+            for data, errors in validator.load(frame):
+                yield data, errors
+
+
+def parse_shard(task):
+    """
+    Entry point of worker process of sharded stage. Parses, filters
+    and validates one byte range of file and returns valid records.
+    """
+    (filepath, start, end, fields, data_filter,
+     schema_class, parser_options) = task
+    parser = Parser(**parser_options)
+    schema = schema_class()
+    stats = {'records': 0, 'ignored': 0, 'errors': 0}
+    batch = []
+    timings.reset()
+    try:
+        source = parser.open_range(filepath, start, end)
+        with closing(source):
+            for data, errors in load_records(parser, source, fields, schema,
+                                             data_filter):
+                stats['records'] += 1
+                if errors:
+                    stats['errors'] += 1
+                    logger.debug('%s: %s', data, errors)
+                else:
+                    batch.append(data)
+        stats['ignored'] = parser.ignored
+        stats['records'] += parser.ignored
+        stats['timings'] = timings.get()
+    finally:
+        db.connections.close_all()
+    return stats, batch
+
+
+class ShardedStage(Stage):
+    """
+    Stage which splits decompressed file to newline-aligned byte ranges,
+    parses, filters and validates them in a pool of ``jobs`` processes.
+    Valid records are passed to handler in the main process in the order
+    of file.
+
+    Position of stage is byte offset in decompressed file.
+
+    At most ``window`` shards (two per process by default) are submitted
+    at once, so workers do not run ahead of the handler and parsed
+    records do not pile up in memory.
+    """
+    position_kind = 'bytes'
+
+    def __init__(self, name, filepath, handler, jobs=2,
+                 shard_size=SHARD_SIZE, window=None, **kwargs):
+        super(ShardedStage, self).__init__(name, filepath, handler, **kwargs)
+        self.jobs = jobs
+        self.shard_size = shard_size
+        self.window = window or 2 * jobs
+
+    def run(self, parser):
+        schema = self.schema()
+        fields = self.parsing.get('fields', list(schema.fields.keys()))
+        data_filter = self.parsing.get('data_filter')
+        counters = {
+            'records': 0,
+            'ignored': 0,
+            'errors': 0,
+            'imported': 0,
+        }
+        offset = 0
+        state = self.load_checkpoint()
+        if state is not None:
+            if state['done']:
+                return dict(state['counters'])
+            counters.update(state['counters'])
+            offset = state['position']
+        filepath = extract(self.filepath)
+        ranges = split_file(filepath, self.shard_size, start=offset)
+        logger.info('Importing file %s in %s shards by %s processes',
+                    filepath, len(ranges), self.jobs)
+        tasks = (
+            (filepath, start, end, fields, data_filter,
+             self.schema, parser.get_options())
+            for start, end in ranges
+        )
+        last_checkpoint = counters['records'] + counters['ignored']
+        total = float(os.path.getsize(filepath))
+        progress = Progress(self.name, get_fraction=lambda: offset / total,
+                            counters=counters)
+        db.connections.close_all()
+        pool = multiprocessing.Pool(self.jobs)
+        try:
+            results = collections.deque(
+                pool.apply_async(parse_shard, (task,))
+                for task in itertools.islice(tasks, self.window))
+            for start, end in ranges:
+                stats, batch = results.popleft().get()
+                task = next(tasks, None)
+                if task is not None:
+                    results.append(pool.apply_async(parse_shard, (task,)))
+                counters['records'] += stats['records'] - stats['ignored']
+                counters['ignored'] += stats['ignored']
+                counters['errors'] += stats['errors']
+                # Time of workers is added to time of the main process
+                timings.update(stats['timings'])
+                for data in batch:
+                    self.handler(data, **self.handler_kwargs)
+                    counters['imported'] += 1
+                offset = end
+                rows = counters['records'] + counters['ignored']
+                progress.update(rows)
+                if self.is_resumable() and \
+                        rows - last_checkpoint >= self.checkpoint.interval:
+                    self.save_checkpoint(end, counters)
+                    last_checkpoint = rows
+        except Exception:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+        progress.finish()
+        return self.done(counters)
+
+
+def get_max_rss():
+    """
+    Peak resident set size of current process so far in bytes, or of
+    the largest of its terminated children (e.g. shard workers) if it
+    is larger. It is never reset, so it is not the peak of one stage.
+    """
+    max_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports kilobytes, OS X reports bytes
+    if sys.platform != 'darwin':
+        max_rss *= 1024
+    return max_rss
+
+
+def get_summary(name, stats):
+    """
+    Machine-readable summary of finished stage.
+    """
+    summary = {'stage': name}
+    for key in ('records', 'ignored', 'errors', 'imported', 'duration',
+                'max_rss', 'timings', 'memory_peak', 'profile'):
+        if key in stats:
+            summary[key] = stats[key]
+    return summary
+
+
+def run_stage(stage, parser, profiler=None):
+    """
+    Runs stage and returns its name and statistics, including
+    cumulative time of phases of import, peak RSS of the process which
+    ran it so far (``max_rss``, see ``get_max_rss``) and report of
+    ``profiler`` (see ``instrumentation.StageProfiler``).
+    """
+    timings.reset()
+    started = time.time()
+    if profiler:
+        stats, report = profiler.run(stage.name, stage.run, parser)
+        stats.update(report)
+    else:
+        stats = stage.run(parser)
+    stats['duration'] = time.time() - started
+    stats['max_rss'] = get_max_rss()
+    stats['timings'] = timings.get()
+    summary = get_summary(stage.name, stats)
+    summary.pop('profile', None)
+    logger.info('Stage summary: %s', json.dumps(summary, sort_keys=True))
+    return stage.name, stats
+
+
+def run_stage_in_worker(stage, parser_options, profiler=None):
+    """
+    Entry point of worker process.
+    """
+    try:
+        return run_stage(stage, Parser(**parser_options), profiler)
+    finally:
+        db.connections.close_all()
+
+
+class StageScheduler(object):
+    """
+    Runs stages respecting their dependencies. Stages which are not
+    local are sent to a pool of ``jobs`` processes as soon as
+    their dependencies are done, local stages are run in the main
+    process meanwhile.
+    """
+    poll_interval = 0.1
+
+    def __init__(self, stages, parser, jobs=1, profiler=None):
+        self.parser = parser
+        self.jobs = jobs
+        self.profiler = profiler
+        self.stats = {}
+        self.stages = self.sort(list(stages))
+
+    def sort(self, stages):
+        """
+        Returns stages in order of dependencies, otherwise in the given
+        order. Unknown and cyclic dependencies are errors.
+        """
+        names = set(s.name for s in stages)
+        for stage in stages:
+            unknown = set(stage.depends_on) - names
+            if unknown:
+                raise ValueError('Stage {0} depends on unknown stages: '
+                                 '{1}'.format(stage.name,
+                                              ', '.join(sorted(unknown))))
+        ordered = []
+        done = set()
+        pending = list(stages)
+        while pending:
+            stage = next((s for s in pending
+                          if all(d in done for d in s.depends_on)), None)
+            if stage is None:
+                raise ValueError('Stages have cyclic dependencies: '
+                                 '{0}'.format(', '.join(s.name
+                                                        for s in pending)))
+            pending.remove(stage)
+            ordered.append(stage)
+            done.add(stage.name)
+        return ordered
+
+    def run(self):
+        started = time.time()
+        if self.jobs > 1:
+            self.run_parallel()
+        else:
+            for stage in self.stages:
+                self.run_local(stage)
+        self.stats['total'] = {'duration': time.time() - started}
+        return self.stats
+
+    def run_local(self, stage):
+        name, stats = run_stage(stage, self.parser, self.profiler)
+        self.done(name, stats)
+
+    def done(self, name, stats):
+        self.stats[name] = stats
+        logger.info('Stage %s is finished in %.2fs', name, stats['duration'])
+
+    def is_ready(self, stage):
+        return all(d in self.stats for d in stage.depends_on)
+
+    def run_parallel(self):
+        pending = list(self.stages)
+        running = []
+        # Connections must not be shared with forked processes
+        db.connections.close_all()
+        pool = multiprocessing.Pool(self.jobs)
+        try:
+            while pending or running:
+                for stage in [s for s in pending
+                              if not s.local and self.is_ready(s)]:
+                    pending.remove(stage)
+                    running.append(pool.apply_async(
+                        run_stage_in_worker,
+                        (stage, self.parser.get_options(), self.profiler)))
+
+                local = [s for s in pending if s.local and self.is_ready(s)]
+                if local:
+                    pending.remove(local[0])
+                    self.run_local(local[0])
+                    continue
+
+                finished = [r for r in running if r.ready()]
+                for result in finished:
+                    running.remove(result)
+                    self.done(*result.get())
+                if not finished:
+                    if not running:
+                        raise RuntimeError(
+                            'Stages can not be scheduled: {0}'.format(
+                                ', '.join(s.name for s in pending)))
+                    time.sleep(self.poll_interval)
+        except Exception:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
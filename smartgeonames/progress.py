@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals, print_function
+
+import sys
+import time
+
+from smartgeonames import settings
+
+PROGRESS_INTERVAL = settings.PROGRESS_INTERVAL
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{0}:{1:02d}:{2:02d}'.format(hours, minutes, seconds)
+
+
+class Progress(object):
+    """
+    Progress line of long operation with rate and ETA, rewritten
+    at most once per ``interval`` seconds. ``update`` is cheap enough
+    to be called for every row.
+
+    ETA is known if ``total`` or ``get_fraction()`` (done part of work
+    from 0 to 1) is given. Values of ``counters`` dictionary are shown
+    as they are at the moment of rewrite.
+
+    Nothing is written if ``stream`` is not a TTY.
+    """
+    def __init__(self, name, unit='rows', total=None, get_fraction=None,
+                 counters=None, interval=PROGRESS_INTERVAL, stream=None):
+        self.name = name
+        self.unit = unit
+        self.total = total
+        self.get_fraction = get_fraction
+        self.counters = counters
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        isatty = getattr(self.stream, 'isatty', None)
+        self.enabled = bool(isatty and isatty())
+        self.started = time.time()
+        self.next_write = self.started + interval
+        self.width = 0
+
+    def update(self, done):
+        if not self.enabled:
+            return
+        now = time.time()
+        if now >= self.next_write:
+            self.next_write = now + self.interval
+            self.write(done, now)
+
+    def get_message(self, done, now):
+        elapsed = now - self.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        parts = ['{0}: {1} {2}'.format(self.name, done, self.unit),
+                 '{0:.0f} {1}/s'.format(rate, self.unit)]
+        if self.counters:
+            parts.extend('{0}: {1}'.format(key, value)
+                         for key, value in sorted(self.counters.items()))
+        if self.total:
+            fraction = float(done) / self.total
+        elif self.get_fraction:
+            fraction = self.get_fraction()
+        else:
+            fraction = None
+        if fraction:
+            fraction = min(fraction, 1.0)
+            parts.append('{0:.0%}'.format(fraction))
+            parts.append('ETA: {0}'.format(
+                format_duration(elapsed * (1 - fraction) / fraction)))
+        return ', '.join(parts)
+
+    def write(self, done, now):
+        message = self.get_message(done, now)
+        # Erase the rest of longer previous message
+        self.stream.write('\r' + message.ljust(self.width))
+        self.stream.flush()
+        self.width = len(message)
+
+    def finish(self):
+        if self.enabled and self.width:
+            self.stream.write('\n')
+            self.stream.flush()
@@ -8,6 +8,9 @@ from unidecode import unidecode
 
 
 class SmartGeoNamesBaseSchema(Schema):
+    # pre_load processors mirrored by validation.BatchValidator
+    batch_pre_load = ('clean_up',)
+
     @pre_load
     def clean_up(self, in_data):
         in_data = {k: v or None for k, v in in_data.iteritems()}
@@ -70,6 +73,9 @@ class GeoNamesRecordSchema(SmartGeoNamesBaseSchema):
     timezone = fields.String(validate=Length(max=40), allow_none=True)
     modification_date = fields.Date()
 
+    batch_pre_load = SmartGeoNamesBaseSchema.batch_pre_load + (
+        'convert_name_to_asciiname_if_not_exists',)
+
     class Meta:
         ordered = True
 
@@ -80,6 +86,21 @@ class GeoNamesRecordSchema(SmartGeoNamesBaseSchema):
             print(in_data['asciiname'], in_data['name'])
         return in_data
 
+    def pre_load_frame(self, frame):
+        """
+        Column-wise counterpart of ``pre_load`` processors
+        for batch validation of pandas DataFrame.
+        """
+        without_asciiname = frame['asciiname'] == ''
+        if without_asciiname.any():
+            frame = frame.copy()
+            frame.loc[without_asciiname, 'asciiname'] = \
+                frame.loc[without_asciiname, 'name'].map(
+                    lambda name: unidecode(
+                        name.decode('utf-8')
+                        if isinstance(name, bytes) else name))
+        return frame
+
     @post_load
     def post_processing(self, data):
         self.setup_location_point(data)
@@ -192,6 +213,16 @@ class PostalCodeSchema(SmartGeoNamesBaseSchema):
     class Meta:
         ordered = True
 
+    @post_load
+    def setup_location_point(self, data):
+        data['location'] = None
+        if data.get('latitude') is not None and \
+                data.get('longitude') is not None:
+            # Point is (x, y), i.e. (longitude, latitude)
+            data['location'] = Point(float(data['longitude']),
+                                     float(data['latitude']))
+        return data
+
 
 class Admin1CodesSchema(SmartGeoNamesBaseSchema):
     """
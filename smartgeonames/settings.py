@@ -18,6 +18,52 @@ DATA_DIR = getattr(
         )
 )
 
+BATCH_SIZE = getattr(
+        settings, 'SMART_GEONAMES_BATCH_SIZE',
+        10000
+)
+
+# Number of rows in chunk of file parsed by Pandas in low memory mode
+CHUNK_SIZE = getattr(
+        settings, 'SMART_GEONAMES_CHUNK_SIZE',
+        10000
+)
+
+# Size of byte range of file parsed by one worker in sharded mode
+SHARD_SIZE = getattr(
+        settings, 'SMART_GEONAMES_SHARD_SIZE',
+        64 * 1024 * 1024
+)
+
+# Import state is saved every CHECKPOINT_INTERVAL rows of file
+CHECKPOINT_DIR = getattr(
+        settings, 'SMART_GEONAMES_CHECKPOINT_DIR',
+        os.path.join(DATA_DIR, 'checkpoints')
+)
+CHECKPOINT_INTERVAL = getattr(
+        settings, 'SMART_GEONAMES_CHECKPOINT_INTERVAL',
+        5 * BATCH_SIZE
+)
+
+# Number of threads downloading GeoNames files at once
+DOWNLOAD_JOBS = getattr(
+        settings, 'SMART_GEONAMES_DOWNLOAD_JOBS',
+        4
+)
+
+# cProfile statistics of import stages (--profile)
+PROFILE_DIR = getattr(
+        settings, 'SMART_GEONAMES_PROFILE_DIR',
+        os.path.join(DATA_DIR, 'profiles')
+)
+
+# Progress of import and downloads is rewritten once per PROGRESS_INTERVAL
+# seconds
+PROGRESS_INTERVAL = getattr(
+        settings, 'SMART_GEONAMES_PROGRESS_INTERVAL',
+        1.0
+)
+
 # Countries
 COUNTRIES_FILE_PATH = getattr(
         settings, 'SMART_GEONAMES_COUNTRIES_FILE_PATH',
@@ -33,6 +79,19 @@ COUNTRIES_FILTER = getattr(
         settings, 'SMART_GEONAMES_COUNTRIES_FILTER',
         {}
 )
+# Continent codes of countryInfo.txt -> geonameid of continents
+CONTINENTS_GEONAMEIDS = getattr(
+        settings, 'SMART_GEONAMES_CONTINENTS_GEONAMEIDS',
+        {
+            'AF': 6255146,
+            'AS': 6255147,
+            'EU': 6255148,
+            'NA': 6255149,
+            'SA': 6255150,
+            'OC': 6255151,
+            'AN': 6255152,
+        }
+)
 
 # GeoName objects
 OBJECTS_FILE_PATH = getattr(
@@ -77,6 +136,23 @@ OBJECTS_FILTER = getattr(
 )
 OBJECTS_IGNORE = (1,)
 
+# Cities datasets (cities500, cities1000, cities5000 or cities15000)
+# imported instead of all GeoNames records, only with --countries. With
+# None all records are imported.
+CITIES_DATASET = getattr(
+        settings, 'SMART_GEONAMES_CITIES_DATASET',
+        None
+)
+CITIES_FILE_PATH = getattr(
+        settings, 'SMART_GEONAMES_CITIES_FILE_PATH',
+        purl.URL(GEONAMES_URL).path('/export/dump/').as_string() +
+        '{dataset}.zip'
+)
+CITIES_FILE_LOCAL_PATH = getattr(
+        settings, 'SMART_GEONAMES_CITIES_FILE_LOCAL_PATH',
+        os.path.join(DATA_DIR, 'dump', '{dataset}.zip')
+)
+
 # Alternate Names (translations etc.)
 TRANSLATIONS_FILE_PATH = getattr(
         settings, 'SMART_GEONAMES_TRANSLATIONS_FILE_PATH',
@@ -96,6 +172,29 @@ TRANSLATIONS_FILTER = getattr(
         }
 )
 
+# Names of admin divisions
+ADMIN1_CODES_FILE_PATH = getattr(
+        settings, 'SMART_GEONAMES_ADMIN1_CODES_FILE_PATH',
+        purl.URL(GEONAMES_URL).path(
+            '/export/dump/admin1CodesASCII.txt').as_string()
+)
+ADMIN1_CODES_FILE_LOCAL_PATH = getattr(
+        settings, 'SMART_GEONAMES_ADMIN1_CODES_FILE_LOCAL_PATH',
+        os.path.join(DATA_DIR, 'dump', 'admin1CodesASCII.txt')
+)
+ADMIN1_CODES_SCHEMA = getattr(
+        settings, 'SMART_GEONAMES_ADMIN1_CODES_SCHEMA', None)
+ADMIN2_CODES_FILE_PATH = getattr(
+        settings, 'SMART_GEONAMES_ADMIN2_CODES_FILE_PATH',
+        purl.URL(GEONAMES_URL).path('/export/dump/admin2Codes.txt').as_string()
+)
+ADMIN2_CODES_FILE_LOCAL_PATH = getattr(
+        settings, 'SMART_GEONAMES_ADMIN2_CODES_FILE_LOCAL_PATH',
+        os.path.join(DATA_DIR, 'dump', 'admin2Codes.txt')
+)
+ADMIN2_CODES_SCHEMA = getattr(
+        settings, 'SMART_GEONAMES_ADMIN2_CODES_SCHEMA', None)
+
 # Postal codes
 POSTAL_CODES_FILE_PATH = getattr(
         settings, 'SMART_GEONAMES_POSTAL_CODES_FILE_PATH',
@@ -114,6 +213,45 @@ POSTAL_CODES_FILTER = getattr(
         }
 )
 
+# Per-country archives (--countries), {country} is ISO code of country
+COUNTRY_OBJECTS_FILE_PATH = getattr(
+        settings, 'SMART_GEONAMES_COUNTRY_OBJECTS_FILE_PATH',
+        purl.URL(GEONAMES_URL).path('/export/dump/').as_string() +
+        '{country}.zip'
+)
+COUNTRY_OBJECTS_FILE_LOCAL_PATH = getattr(
+        settings, 'SMART_GEONAMES_COUNTRY_OBJECTS_FILE_LOCAL_PATH',
+        os.path.join(DATA_DIR, 'dump', '{country}.zip')
+)
+COUNTRY_TRANSLATIONS_FILE_PATH = getattr(
+        settings, 'SMART_GEONAMES_COUNTRY_TRANSLATIONS_FILE_PATH',
+        purl.URL(GEONAMES_URL).path(
+            '/export/dump/alternatenames/').as_string() + '{country}.zip'
+)
+COUNTRY_TRANSLATIONS_FILE_LOCAL_PATH = getattr(
+        settings, 'SMART_GEONAMES_COUNTRY_TRANSLATIONS_FILE_LOCAL_PATH',
+        os.path.join(DATA_DIR, 'dump', 'alternatenames', '{country}.zip')
+)
+COUNTRY_POSTAL_CODES_FILE_PATH = getattr(
+        settings, 'SMART_GEONAMES_COUNTRY_POSTAL_CODES_FILE_PATH',
+        purl.URL(GEONAMES_URL).path('/export/zip/').as_string() +
+        '{country}.zip'
+)
+COUNTRY_POSTAL_CODES_FILE_LOCAL_PATH = getattr(
+        settings, 'SMART_GEONAMES_COUNTRY_POSTAL_CODES_FILE_LOCAL_PATH',
+        os.path.join(DATA_DIR, 'zip', '{country}.zip')
+)
+# Records without country (continents etc.), they are not included
+# in archives of countries
+NO_COUNTRY_FILE_PATH = getattr(
+        settings, 'SMART_GEONAMES_NO_COUNTRY_FILE_PATH',
+        purl.URL(GEONAMES_URL).path('/export/dump/no-country.zip').as_string()
+)
+NO_COUNTRY_FILE_LOCAL_PATH = getattr(
+        settings, 'SMART_GEONAMES_NO_COUNTRY_FILE_LOCAL_PATH',
+        os.path.join(DATA_DIR, 'dump', 'no-country.zip')
+)
+
 HIERARCHY_FILE_PATH = getattr(
         settings, 'SMART_GEONAMES_HIERARCHY_FILE_PATH',
         purl.URL(GEONAMES_URL).path('/export/dump/hierarchy.zip').as_string()
@@ -123,3 +261,17 @@ HIERARCHY_FILE_LOCAL_PATH = getattr(
         os.path.join(DATA_DIR, 'dump', 'hierarchy.zip')
 )
 HIERARCHY_TREE_ROOT = 0
+HIERARCHY_CACHE_DIR = getattr(
+        settings, 'SMART_GEONAMES_HIERARCHY_CACHE_DIR',
+        os.path.join(DATA_DIR, 'hierarchy')
+)
+
+# Daily deltas (modifications and deletes)
+SYNC_SOURCE = getattr(
+        settings, 'SMART_GEONAMES_SYNC_SOURCE',
+        purl.URL(GEONAMES_URL).path('/export/dump/').as_string()
+)
+SYNC_DATA_DIR = getattr(
+        settings, 'SMART_GEONAMES_SYNC_DATA_DIR',
+        os.path.join(DATA_DIR, 'dump', 'deltas')
+)
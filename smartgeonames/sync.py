@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals, print_function
+
+import datetime
+import logging
+import os
+from contextlib import closing
+
+import requests
+from django.db import transaction
+
+from smartgeonames import settings
+from smartgeonames.filters import objects_filter, translations_filter
+from smartgeonames.models import GeoNamesRecord
+from smartgeonames.pipeline import load_records
+
+HIERARCHY_TREE_ROOT = settings.HIERARCHY_TREE_ROOT
+
+DATE_FORMAT = '%Y-%m-%d'
+
+logger = logging.getLogger("smartgeonames")
+
+
+def get_dates(last_applied, until):
+    """
+    Dates of daily deltas which are not applied yet, in order.
+    """
+    if last_applied is None:
+        return [until]
+    dates = []
+    date = last_applied + datetime.timedelta(days=1)
+    while date <= until:
+        dates.append(date)
+        date += datetime.timedelta(days=1)
+    return dates
+
+
+class DeltaSync(object):
+    """
+    Applies GeoNames daily delta files (deletes and modifications of
+    records and alternate names) to imported GeoNames records.
+
+    ``source`` is URL of GeoNames dump directory or a local directory
+    with delta files. Remote files are fetched by ``fetch(remote, local)``.
+    Hierarchy is only needed for new records and is built on demand by
+    ``get_hierarchy()``.
+    """
+    files = (
+        ('deletes', 'deletes-{0}.txt'),
+        ('modifications', 'modifications-{0}.txt'),
+        ('alternate_names_deletes', 'alternateNamesDeletes-{0}.txt'),
+        ('alternate_names_modifications',
+         'alternateNamesModifications-{0}.txt'),
+    )
+    deletes_fields = ('geonameid', 'name', 'comment')
+    alternate_names_deletes_fields = ('alternateNameId', 'geonameid',
+                                      'comment')
+
+    def __init__(self, source, data_dir, parser, fetch, get_hierarchy,
+                 objects_schema, translations_schema, model=GeoNamesRecord):
+        self.source = source
+        self.data_dir = data_dir
+        self.parser = parser
+        self.fetch = fetch
+        self.get_hierarchy = get_hierarchy
+        self.objects_schema = objects_schema()
+        self.translations_schema = translations_schema()
+        self.model = model
+        self.translation_model = model._parler_meta.root_model
+        self.stats = {}
+
+    @property
+    def is_local(self):
+        return os.path.isdir(self.source)
+
+    def get_file(self, name):
+        """
+        Returns local path of delta file or None if it is not published.
+        """
+        if self.is_local:
+            path = os.path.join(self.source, name)
+            return path if os.path.exists(path) else None
+        remote = '/'.join([self.source.rstrip('/'), name])
+        local = os.path.join(self.data_dir, name)
+        try:
+            return self.fetch(remote, local)
+        except requests.HTTPError as e:
+            logger.warning('Delta file %s is not available: %s', remote, e)
+            return None
+
+    def apply(self, date):
+        """
+        Applies all deltas of date. Returns False if some of delta files
+        of the date are not published yet.
+        """
+        date_string = date.strftime(DATE_FORMAT)
+        paths = {}
+        for kind, template in self.files:
+            path = self.get_file(template.format(date_string))
+            if path is None:
+                return False
+            paths[kind] = path
+        logger.info('Apply GeoNames deltas of %s', date_string)
+        self.stats = {kind: 0 for kind, _ in self.files}
+        with transaction.atomic():
+            for kind, _ in self.files:
+                getattr(self, 'apply_' + kind)(paths[kind])
+        logger.info('Deltas of %s: %s', date_string, self.stats)
+        return True
+
+    def read(self, path, fields, schema=None, data_filter=None):
+        source = self.parser.open(path)
+        if source is None:
+            return
+        with closing(source):
+            for data, errors in load_records(self.parser, source, fields,
+                                             schema, data_filter):
+                if errors:
+                    logger.warning('%s: %s', data, errors)
+                    continue
+                yield data
+
+    def apply_deletes(self, path):
+        for data in self.read(path, self.deletes_fields):
+            obj = self.model.objects.filter(pk=int(data['geonameid'])).first()
+            if obj is not None:
+                # treebeard removes descendants, which are not deleted
+                # by GeoNames, so they are moved to the parent first
+                for child in list(obj.get_children()):
+                    child.move(obj, 'last-sibling')
+                obj.delete()
+                self.stats['deletes'] += 1
+
+    def apply_modifications(self, path):
+        fields = list(self.objects_schema.fields.keys())
+        for data in self.read(path, fields, self.objects_schema,
+                              objects_filter):
+            if self.update_object(data):
+                self.stats['modifications'] += 1
+
+    def update_object(self, data):
+        geonameid = data['geonameid']
+        obj = self.model.objects.filter(pk=geonameid).first()
+        if obj is not None:
+            for name, value in data.items():
+                setattr(obj, name, value)
+            obj.save()
+            return obj
+        parent_id = self.get_hierarchy().parent(geonameid)
+        if parent_id is None:
+            logger.warning('Record %s is not in hierarchy.', geonameid)
+            return None
+        if parent_id == HIERARCHY_TREE_ROOT:
+            return self.model.add_root(**data)
+        parent_obj = self.model.objects.filter(pk=parent_id).first()
+        if parent_obj is None:
+            logger.warning('Parent %s of record %s is not imported.',
+                           parent_id, geonameid)
+            return None
+        return parent_obj.add_child(**data)
+
+    def apply_alternate_names_deletes(self, path):
+        ids = [int(data['alternateNameId']) for data in
+               self.read(path, self.alternate_names_deletes_fields)]
+        translations = self.translation_model.objects.filter(
+            alternatenameid__in=ids)
+        self.stats['alternate_names_deletes'] += translations.count()
+        translations.delete()
+
+    def apply_alternate_names_modifications(self, path):
+        fields = list(self.translations_schema.fields.keys())
+        for data in self.read(path, fields, self.translations_schema,
+                              translations_filter):
+            if data['isHistoric'] or data['isColloquial']:
+                continue
+            obj = self.model.objects.filter(pk=data['geonameid']).first()
+            if obj is None:
+                continue
+            language = data['isolanguage']
+            if obj.has_translation(language):
+                # Import keeps the best name of language, so another
+                # stored name is replaced only by preferred one
+                stored = obj.get_translation(language).alternatenameid
+                if stored != data['alternateNameId'] and \
+                        not data['isPreferredName']:
+                    continue
+            obj.set_current_language(language)
+            obj.name = data['alternate_name']
+            obj.alternatenameid = data['alternateNameId']
+            obj.save_translations()
+            self.stats['alternate_names_modifications'] += 1
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals, print_function
+
+import decimal
+import logging
+
+import numpy
+import pandas
+from django.utils import six
+from marshmallow import fields
+from marshmallow.decorators import (POST_LOAD, PRE_LOAD, VALIDATES,
+                                    VALIDATES_SCHEMA)
+from marshmallow.validate import Length, Range
+
+from smartgeonames.instrumentation import SCHEMA, timings
+
+logger = logging.getLogger("smartgeonames")
+
+INTEGER_RE = r'^\s*[-+]?\d+\s*$'
+
+
+def to_float(value):
+    """
+    Converts value by ``float`` like marshmallow does, NaN if invalid.
+    ``pandas.to_numeric`` may differ from it in the last digit.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return numpy.nan
+
+
+def to_floats(raw):
+    return raw.map(to_float).astype(float)
+
+
+def to_text(value):
+    """
+    Decodes UTF-8 byte string produced by pandas of Python 2.
+    """
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def get_processors(schema):
+    """
+    Returns names of processors of schema by ``(tag, pass_many)``
+    as they are tagged by marshmallow decorators.
+    """
+    processors = {}
+    for name in dir(schema.__class__):
+        tags = getattr(getattr(schema.__class__, name, None),
+                       '__marshmallow_tags__', ())
+        for tag in tags:
+            processors.setdefault(tag, []).append(name)
+    return processors
+
+
+class BatchValidator(object):
+    """
+    Validator of whole pandas DataFrame chunks generated from
+    marshmallow schema. Checks types, lengths, ranges and nulls of
+    columns at once and produces the same data as ``schema.load``
+    for valid rows. Schema is used directly only to get error messages
+    of invalid rows and to run ``post_load`` processors.
+
+    Schema may define ``pre_load_frame(frame)`` as a column-wise
+    counterpart of its ``pre_load`` processors and list their names in
+    ``batch_pre_load``. Schema with other ``pre_load`` processors or
+    with validators of schema is validated row by row.
+    """
+    supported_fields = (
+        fields.Integer,
+        fields.Float,
+        fields.Decimal,
+        fields.Boolean,
+        fields.Date,
+        fields.String,
+    )
+    supported_validators = (Length, Range)
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.fields = schema.fields
+        self.pre_load_frame = getattr(schema, 'pre_load_frame', None)
+        processors = get_processors(schema)
+        self.post_load = [getattr(schema, name)
+                          for name in processors.pop((POST_LOAD, False), [])]
+        self.is_supported = (self.supports_fields() and
+                             self.supports_processors(processors))
+        if not self.is_supported:
+            logger.warning('Schema %s can not be validated in batches, '
+                           'rows will be validated one by one.',
+                           schema.__class__.__name__)
+
+    def supports_fields(self):
+        return all(
+            isinstance(field, self.supported_fields) and
+            all(isinstance(v, self.supported_validators)
+                for v in field.validators)
+            for field in self.fields.values()
+        )
+
+    def supports_processors(self, processors):
+        """
+        Supported are ``pre_load`` processors listed in ``batch_pre_load``
+        and ``post_load`` processors of single records without original
+        data.
+        """
+        pre_load = set(processors.pop((PRE_LOAD, False), []))
+        if not pre_load <= set(getattr(self.schema, 'batch_pre_load', ())):
+            return False
+        if any(tag in (PRE_LOAD, POST_LOAD, VALIDATES, VALIDATES_SCHEMA)
+               for tag, _ in processors):
+            return False
+        return not any(
+            processor.__marshmallow_kwargs__[(POST_LOAD, False)].get(
+                'pass_original')
+            for processor in self.post_load)
+
+    def load(self, frame):
+        """
+        Yields ``(data, errors)`` for every row of frame in order.
+        Data of invalid rows is original row. Rows rejected by batch
+        checks but accepted by schema get data loaded by schema.
+        """
+        if six.PY2 and len(frame):
+            with timings.measure(SCHEMA):
+                frame = frame.apply(lambda column: column.map(to_text)
+                                    if column.dtype == object else column)
+        if not self.is_supported:
+            for row in frame.to_dict(orient='records'):
+                result = self.schema.load(row)
+                yield (row if result.errors else result.data), result.errors
+            return
+
+        with timings.measure(SCHEMA):
+            columns, invalid = self.validate(frame)
+            valid = self.records(columns[~invalid])
+            failed = iter(frame[invalid].to_dict(orient='records'))
+        for is_invalid in invalid:
+            if is_invalid:
+                row = next(failed)
+                result = self.schema.load(row)
+                yield (row if result.errors else result.data), result.errors
+            else:
+                yield next(valid), {}
+
+    def validate(self, frame):
+        """
+        Returns DataFrame of converted columns and boolean mask
+        of invalid rows.
+        """
+        if self.pre_load_frame:
+            frame = self.pre_load_frame(frame)
+        invalid = numpy.zeros(len(frame), dtype=bool)
+        columns = {}
+        for name, field in six.iteritems(self.fields):
+            if name in frame:
+                raw = frame[name]
+            else:
+                raw = pandas.Series([''] * len(frame), index=frame.index)
+            missing = (raw.isnull() | (raw == '')).values
+            value, errors = self.convert(field, raw)
+            errors |= self.check_validators(field, value)
+            if not field.allow_none:
+                invalid |= missing
+            invalid |= errors & ~missing
+            columns[name] = value
+        return pandas.DataFrame(columns, index=frame.index), invalid
+
+    def convert(self, field, raw):
+        if isinstance(field, fields.Integer):
+            value = to_floats(raw)
+            errors = ~raw.str.match(INTEGER_RE).fillna(False).astype(bool)
+        elif isinstance(field, fields.Float):
+            value = to_floats(raw)
+            errors = value.isnull()
+        elif isinstance(field, fields.Decimal):
+            # Keep original strings to not lose precision
+            value = raw
+            errors = to_floats(raw).isnull()
+        elif isinstance(field, fields.Boolean):
+            is_true = raw.isin([six.text_type(v) for v in field.truthy])
+            is_false = raw.isin([six.text_type(v) for v in field.falsy])
+            value = pandas.Series(
+                numpy.where(is_true, True, numpy.where(is_false, False, None)),
+                index=raw.index, dtype=object)
+            errors = ~(is_true | is_false)
+        elif isinstance(field, fields.Date):
+            # pandas of Python 2 expects native strings
+            value = pandas.to_datetime(raw, format=str('%Y-%m-%d'),
+                                       errors=str('coerce'))
+            errors = value.isnull()
+        else:
+            value = raw
+            errors = pandas.Series(False, index=raw.index)
+        return value, numpy.array(errors, dtype=bool)
+
+    def check_validators(self, field, value):
+        errors = numpy.zeros(len(value), dtype=bool)
+        for validator in field.validators:
+            if isinstance(validator, Length):
+                measured = value.str.len()
+            elif value.dtype == object:
+                measured = to_floats(value)
+            else:
+                measured = value
+            if validator.min is not None:
+                errors |= (measured < validator.min).values
+            if validator.max is not None:
+                errors |= (measured > validator.max).values
+        return errors
+
+    def records(self, columns):
+        names = list(self.fields.keys())
+        values = [self.to_python(self.fields[name], columns[name])
+                  for name in names]
+        return (self.process(dict(six.moves.zip(names, row)))
+                for row in six.moves.zip(*values))
+
+    def process(self, data):
+        for processor in self.post_load:
+            result = processor(data)
+            if result is not None:
+                data = result
+        return data
+
+    def to_python(self, field, column):
+        values = column.values
+        if isinstance(field, fields.Integer):
+            return [None if numpy.isnan(v) else int(v) for v in values]
+        elif isinstance(field, fields.Float):
+            return [None if numpy.isnan(v) else float(v) for v in values]
+        elif isinstance(field, fields.Decimal):
+            return [decimal.Decimal(v) if v else None for v in values]
+        elif isinstance(field, fields.Boolean):
+            return [None if v is None else bool(v) for v in values]
+        elif isinstance(field, fields.Date):
+            return [None if pandas.isnull(v) else v.date()
+                    for v in column]
+        return [v or None for v in values]
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` backends module.
+"""
+from __future__ import unicode_literals
+
+import mock
+from django.contrib.gis.db.models import GeometryField
+from django.db.models import AutoField
+from django.test import SimpleTestCase
+
+from smartgeonames.backends import CopyBackend
+
+
+def get_field(value, column='name'):
+    field = mock.Mock(column=column)
+    field.pre_save.return_value = value
+    field.get_db_prep_save.side_effect = lambda value, connection: value
+    return field
+
+
+class TestCopyBackend(SimpleTestCase):
+
+    def setUp(self):
+        self.backend = CopyBackend()
+        self.connection = mock.Mock()
+
+    def to_copy_value(self, value):
+        return self.backend.to_copy_value(get_field(value), mock.sentinel.obj,
+                                          self.connection)
+
+    def test_special_characters_are_escaped(self):
+        self.assertEqual(self.to_copy_value('a\tb\nc\rd\\e'),
+                         'a\\tb\\nc\\rd\\\\e')
+
+    def test_null(self):
+        self.assertEqual(self.to_copy_value(None), '\\N')
+
+    def test_null_after_preparation(self):
+        field = get_field('')
+        field.get_db_prep_save.side_effect = None
+        field.get_db_prep_save.return_value = None
+        self.assertEqual(
+            self.backend.to_copy_value(field, mock.sentinel.obj,
+                                       self.connection),
+            '\\N')
+
+    def test_bools(self):
+        self.assertEqual(self.to_copy_value(True), 't')
+        self.assertEqual(self.to_copy_value(False), 'f')
+
+    def test_numbers(self):
+        self.assertEqual(self.to_copy_value(524901), '524901')
+
+    def test_non_ascii_text(self):
+        self.assertEqual(self.to_copy_value('Москва'), 'Москва')
+        self.assertEqual(self.to_copy_value('Москва'.encode('utf-8')),
+                         'Москва')
+
+    def test_geometry_is_hex_ewkb_with_srid_of_field(self):
+        field = mock.Mock(spec=GeometryField, srid=4326)
+        point = mock.Mock(srid=None)
+        field.pre_save.return_value = point
+        point.clone.return_value.hexewkb = b'0101000020E6100000'
+
+        value = self.backend.to_copy_value(field, mock.sentinel.obj,
+                                           self.connection)
+
+        self.assertEqual(value, '0101000020E6100000')
+        self.assertEqual(point.clone.return_value.srid, 4326)
+        self.assertFalse(field.get_db_prep_save.called)
+
+    @mock.patch('smartgeonames.backends.connections')
+    def test_bulk_insert(self, connections):
+        connection = connections.__getitem__.return_value
+        connection.ops.quote_name.side_effect = '"{0}"'.format
+        copied = []
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.cursor.copy_expert.side_effect = \
+            lambda sql, stream: copied.append((sql, stream.read()))
+        model = mock.Mock()
+        model._meta.db_table = 'smartgeonames_postalcode'
+        model._meta.concrete_fields = [
+            mock.Mock(spec=AutoField, column='id'),
+            get_field('101000', column='code'),
+            get_field('Мос\tква', column='place_name'),
+            get_field(None, column='admin1_id'),
+        ]
+
+        self.backend.bulk_insert(model, [mock.sentinel.first,
+                                         mock.sentinel.second])
+
+        self.assertEqual(copied, [(
+            'COPY "smartgeonames_postalcode" '
+            '("code", "place_name", "admin1_id") FROM STDIN',
+            '101000\tМос\\tква\t\\N\n' * 2,
+        )])
+
+    def test_nothing_to_insert(self):
+        with mock.patch('smartgeonames.backends.connections') as connections:
+            self.backend.bulk_insert(mock.Mock(), [])
+
+        self.assertFalse(connections.__getitem__.called)
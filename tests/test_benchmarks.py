@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` benchmarks.
+"""
+
+import io
+import shutil
+import tempfile
+import zipfile
+
+from django.test import SimpleTestCase
+
+from benchmarks.generator import DumpGenerator, get_path, parse_size
+from benchmarks.run import compare
+
+
+class TestDumpGenerator(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def read_zip(self, name):
+        with zipfile.ZipFile(get_path(self.directory, name)) as zfile:
+            text = zfile.read(zfile.namelist()[0]).decode('utf-8')
+        return [line.split('\t') for line in text.splitlines()]
+
+    def test_generate(self):
+        DumpGenerator(self.directory, 2000).generate()
+        objects = self.read_zip('objects')
+        self.assertEqual(len(objects), 2000)
+        self.assertTrue(all(len(row) == 19 for row in objects))
+        ids = [int(row[0]) for row in objects]
+        self.assertEqual(ids, sorted(set(ids)))
+
+        hierarchy = self.read_zip('hierarchy')
+        self.assertTrue(hierarchy)
+        self.assertTrue(all(int(parent) in ids and int(child) in ids
+                            for parent, child, _ in hierarchy))
+        self.assertTrue(all(len(row) == 8
+                            for row in self.read_zip('translations')))
+        self.assertTrue(all(len(row) == 12
+                            for row in self.read_zip('postal_codes')))
+
+        with io.open(get_path(self.directory, 'countries'),
+                     encoding='utf-8') as f:
+            countries = [line for line in f if not line.startswith('#')]
+        self.assertTrue(all(len(line.split('\t')) == 19
+                            for line in countries))
+
+    def test_deterministic(self):
+        other = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other)
+        DumpGenerator(self.directory, 1000, seed=1).generate()
+        DumpGenerator(other, 1000, seed=1).generate()
+        with io.open(get_path(self.directory, 'admin2_codes'),
+                     encoding='utf-8') as f, \
+                io.open(get_path(other, 'admin2_codes'),
+                        encoding='utf-8') as g:
+            self.assertEqual(f.read(), g.read())
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size('10k'), 10000)
+        self.assertEqual(parse_size('1.5M'), 1500000)
+        self.assertEqual(parse_size('500'), 500)
+
+
+class TestCompare(SimpleTestCase):
+
+    def get_result(self, rows_per_second, peak_rss):
+        return {
+            'size': 10000,
+            'memory_mode': 'low',
+            'without_pandas': False,
+            'database': 'spatialite',
+            'rows_per_second': rows_per_second,
+            'peak_rss': peak_rss,
+        }
+
+    def test_compare(self):
+        baseline = [self.get_result(1000, 100)]
+        self.assertEqual(compare([self.get_result(950, 105)], baseline), [])
+        self.assertEqual(
+            len(compare([self.get_result(800, 200)], baseline)), 2)
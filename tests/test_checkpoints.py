@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` checkpoints module.
+"""
+
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from smartgeonames.checkpoints import Checkpoint
+
+
+class TestCheckpoint(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.checkpoint = Checkpoint(self.directory)
+
+    def test_save_and_load(self):
+        self.checkpoint.save('objects', {'position': 10})
+        self.assertEqual(self.checkpoint.load('objects'), {'position': 10})
+        self.assertIsNone(self.checkpoint.load('translations'))
+
+    def test_failed_commit_keeps_previous_state(self):
+        self.checkpoint.save('objects', {'position': 10})
+
+        def commit():
+            raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            self.checkpoint.save('objects', {'position': 20}, commit)
+        self.assertEqual(self.checkpoint.load('objects'), {'position': 10})
+
+    def test_interrupted_save_is_verified(self):
+        path = self.checkpoint.get_path('objects')
+        self.checkpoint.save('objects', {'position': 20})
+        shutil.move(path, path + '.part')
+        self.assertIsNone(
+            self.checkpoint.load('objects', verify=lambda state: False))
+
+        self.checkpoint.save('objects', {'position': 20})
+        shutil.move(path, path + '.part')
+        self.assertEqual(
+            self.checkpoint.load('objects', verify=lambda state: True),
+            {'position': 20})
+
+    def test_journal(self):
+        self.checkpoint.save('objects', {'position': 10}, journal=[1])
+        self.checkpoint.save('objects', {'position': 20}, journal=[2])
+
+        state = self.checkpoint.load('objects')
+        self.assertEqual(state['position'], 20)
+        self.assertEqual(state['journal'], [[1], [2]])
+
+    def test_journal_of_rejected_state_is_truncated(self):
+        path = self.checkpoint.get_path('objects')
+        self.checkpoint.save('objects', {'position': 10}, journal=[1])
+        shutil.copy(path, path + '.previous')
+        self.checkpoint.save('objects', {'position': 20}, journal=[2])
+        shutil.move(path, path + '.part')
+        shutil.move(path + '.previous', path)
+
+        state = self.checkpoint.load('objects', verify=lambda state: False)
+        self.assertEqual(state['position'], 10)
+        self.assertEqual(state['journal'], [[1]])
+
+        self.checkpoint.save('objects', {'position': 30}, journal=[3])
+        self.assertEqual(self.checkpoint.load('objects')['journal'],
+                         [[1], [3]])
+
+    def test_clear(self):
+        self.checkpoint.save('objects', {'position': 10}, journal=[1])
+        self.checkpoint.clear()
+        self.assertIsNone(self.checkpoint.load('objects'))
+        self.assertEqual(os.listdir(self.directory), [])
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` management command.
+"""
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from django.core.management import CommandError
+from django.test import SimpleTestCase
+
+from smartgeonames.management.commands import smartgeonames as command
+from smartgeonames.manifest import Manifest
+from smartgeonames.pipeline import Stage
+
+
+class TestCommandOptions(SimpleTestCase):
+
+    def setUp(self):
+        self.command = command.Command()
+
+    def test_get_countries(self):
+        self.assertEqual(self.command.get_countries(None), [])
+        self.assertEqual(self.command.get_countries(' ru, by,,RU '),
+                         ['RU', 'BY'])
+        for value in ('RUS', 'R1', 'ru,x'):
+            with self.assertRaises(CommandError):
+                self.command.get_countries(value)
+
+    def test_get_files_of_all_countries(self):
+        files, optional = self.command.get_files([])
+        self.assertEqual([remote for remote, _ in files], [
+            command.HIERARCHY_FILE_PATH,
+            command.COUNTRIES_FILE_PATH,
+            command.ADMIN1_CODES_FILE_PATH,
+            command.ADMIN2_CODES_FILE_PATH,
+            command.OBJECTS_FILE_PATH,
+            command.TRANSLATIONS_FILE_PATH,
+            command.POSTAL_CODES_FILE_PATH,
+        ])
+        self.assertEqual(optional, set())
+
+    def test_get_files_of_countries(self):
+        files, optional = self.command.get_files(['RU', 'BY'])
+        remotes = [remote for remote, _ in files]
+        self.assertEqual(remotes[:5], [
+            command.HIERARCHY_FILE_PATH,
+            command.COUNTRIES_FILE_PATH,
+            command.ADMIN1_CODES_FILE_PATH,
+            command.ADMIN2_CODES_FILE_PATH,
+            command.NO_COUNTRY_FILE_PATH,
+        ])
+        self.assertEqual(len(remotes), 11)
+        self.assertNotIn(command.OBJECTS_FILE_PATH, remotes)
+        for country in ('RU', 'BY'):
+            self.assertIn(command.COUNTRY_OBJECTS_FILE_PATH.format(
+                country=country), remotes)
+            self.assertIn(command.COUNTRY_TRANSLATIONS_FILE_PATH.format(
+                country=country), remotes)
+        # Postal codes are not published for all countries
+        self.assertEqual(optional, set(
+            command.COUNTRY_POSTAL_CODES_FILE_PATH.format(country=country)
+            for country in ('RU', 'BY')))
+        self.assertTrue(optional <= set(remotes))
+
+    def test_get_files_of_cities(self):
+        files, _ = self.command.get_files(['RU'], 'cities15000')
+        remotes = [remote for remote, _ in files]
+        self.assertNotIn(command.HIERARCHY_FILE_PATH, remotes)
+        self.assertIn(command.CITIES_FILE_PATH.format(dataset='cities15000'),
+                      remotes)
+
+
+class TestSkipUnchanged(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.command = command.Command()
+        self.command.manifest = Manifest(
+            os.path.join(directory, 'manifest.json'))
+        self.fingerprints = {
+            'hierarchy': '1',
+            'objects': '2',
+            'translations': '3',
+            'postal_codes': '4',
+        }
+        for name, sha256 in self.fingerprints.items():
+            self.command.manifest.set_imported(name, name + '.txt', sha256)
+
+    def get_stages(self):
+        return [
+            Stage('hierarchy', 'hierarchy.txt', None, local=True),
+            Stage('objects', 'objects.txt', None, local=True,
+                  depends_on=('hierarchy',)),
+            Stage('translations', 'translations.txt', None,
+                  depends_on=('objects',)),
+            Stage('postal_codes', 'postal_codes.txt', None),
+        ]
+
+    def get_names(self, stages):
+        return [stage.name for stage in stages]
+
+    def test_unchanged_stages_are_skipped(self):
+        stages = self.command.skip_unchanged(self.get_stages(),
+                                             self.fingerprints)
+        self.assertEqual(stages, [])
+
+    def test_changed_stage_is_imported(self):
+        self.fingerprints['postal_codes'] = '5'
+        stages = self.command.skip_unchanged(self.get_stages(),
+                                             self.fingerprints)
+        self.assertEqual(self.get_names(stages), ['postal_codes'])
+
+    def test_dependent_stages_are_imported(self):
+        # Local stages share hierarchy, so all of them are imported
+        self.fingerprints['hierarchy'] = '5'
+        stages = self.command.skip_unchanged(self.get_stages(),
+                                             self.fingerprints)
+        self.assertEqual(self.get_names(stages),
+                         ['hierarchy', 'objects', 'translations'])
+        self.assertEqual(stages[2].depends_on, ('objects',))
+
+    def test_dependencies_on_skipped_stages_are_removed(self):
+        self.fingerprints['translations'] = '5'
+        stages = self.command.skip_unchanged(self.get_stages(),
+                                             self.fingerprints)
+        self.assertEqual(self.get_names(stages), ['translations'])
+        self.assertEqual(stages[0].depends_on, ())
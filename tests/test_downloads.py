@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` downloads module.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+from django.test import SimpleTestCase
+from django.utils.six.moves import BaseHTTPServer, socketserver
+
+from smartgeonames.downloads import Downloader, DownloadError
+from smartgeonames.manifest import Manifest, get_sha256
+
+
+class GeoNamesHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Stand-in of GeoNames server. Serves ``files`` of server by path,
+    supports conditional and Range requests. Responses are logged to
+    ``log`` of server as ``(path, status)``. If ``interrupt`` of server
+    is set, connection is closed after half of file.
+    """
+    def do_GET(self):
+        content = self.server.files.get(self.path)
+        if content is None:
+            self.respond(404)
+            return
+        etag = '"{0}"'.format(hashlib.md5(content).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.respond(304)
+            return
+        start = 0
+        if self.headers.get('Range') and \
+                self.headers.get('If-Range') == etag:
+            start = int(self.headers['Range'][len('bytes='):-1])
+        body = content[start:]
+        self.respond(206 if start else 200, {
+            'Content-Length': str(len(body)),
+            'ETag': etag,
+        })
+        if self.server.interrupt:
+            body = body[:len(body) // 2]
+        self.wfile.write(body)
+
+    def respond(self, status, headers=None):
+        self.server.log.append((self.path, status))
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if not headers:
+            self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class GeoNamesServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, files):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           GeoNamesHandler)
+        self.files = files
+        self.log = []
+        self.interrupt = False
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}'.format(self.server_address[1])
+
+
+class TestDownloader(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.server = GeoNamesServer({
+            '/dump/hierarchy.zip': b'hierarchy' * 10000,
+            '/dump/allCountries.zip': b'objects' * 1000000,
+            '/dump/countryInfo.txt': b'countries',
+        })
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.manifest = Manifest(os.path.join(self.directory,
+                                              'manifest.json'))
+        self.downloader = Downloader(self.manifest, jobs=2)
+
+    def get_files(self, *names):
+        return [(self.server.url + '/dump/' + name,
+                 os.path.join(self.directory, 'dump', name))
+                for name in names]
+
+    def test_download_all(self):
+        files = self.get_files('hierarchy.zip', 'allCountries.zip',
+                               'countryInfo.txt')
+        paths = self.downloader.download_all(files)
+        for remote, local in files:
+            self.assertEqual(paths[remote], local)
+            with open(local, 'rb') as f:
+                self.assertEqual(f.read(),
+                                 self.server.files[remote[len(
+                                     self.server.url):]])
+        self.assertEqual(sorted(Manifest(self.manifest.path).load()['files']),
+                         sorted(remote for remote, _ in files))
+        for remote, local in files:
+            self.assertEqual(self.manifest.get_file(remote)['sha256'],
+                             get_sha256(local))
+
+    def test_failure_keeps_other_downloads(self):
+        files = self.get_files('hierarchy.zip', 'missing.zip',
+                               'countryInfo.txt')
+        with self.assertRaises(DownloadError) as context:
+            self.downloader.download_all(files)
+        self.assertEqual([remote for remote, _ in context.exception.failures],
+                         [files[1][0]])
+        self.assertEqual(sorted(self.manifest.load()['files']),
+                         sorted([files[0][0], files[2][0]]))
+
+    def test_concurrent_manifest_updates(self):
+        local = os.path.join(self.directory, 'file')
+        open(local, 'w').close()
+        threads = [
+            threading.Thread(target=self.manifest.add_file, args=(
+                'remote-{0}'.format(i), '{0}-{1}'.format(local, i)))
+            for i in range(20)
+        ]
+        for i in range(20):
+            shutil.copy(local, '{0}-{1}'.format(local, i))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(Manifest(self.manifest.path).load()['files']),
+                         20)
+
+    def test_conditional_download(self):
+        [(remote, local)] = self.get_files('countryInfo.txt')
+        self.downloader.download(remote, local)
+        self.downloader.download(remote, local)
+        self.assertEqual([status for _, status in self.server.log],
+                         [200, 304])
+
+    def test_changed_local_file_is_downloaded_again(self):
+        [(remote, local)] = self.get_files('countryInfo.txt')
+        self.downloader.download(remote, local)
+        with open(local, 'ab') as f:
+            f.write(b'changed')
+        self.downloader.download(remote, local)
+        self.assertEqual([status for _, status in self.server.log],
+                         [200, 200])
+
+    def test_resume(self):
+        [(remote, local)] = self.get_files('allCountries.zip')
+        self.server.interrupt = True
+        with self.assertRaises(Exception):
+            self.downloader.download(remote, local)
+        self.assertFalse(os.path.exists(local))
+        self.assertTrue(os.path.exists(local + '.part'))
+
+        self.server.interrupt = False
+        self.downloader.download(remote, local)
+        self.assertEqual(self.server.log[-1][1], 206)
+        with open(local, 'rb') as f:
+            self.assertEqual(f.read(),
+                             self.server.files['/dump/allCountries.zip'])
+        self.assertFalse(os.path.exists(local + '.part'))
+        self.assertEqual(self.manifest.get_file(remote)['sha256'],
+                         get_sha256(local))
+
+    def test_changed_file_is_downloaded_again(self):
+        [(remote, local)] = self.get_files('allCountries.zip')
+        self.server.interrupt = True
+        with self.assertRaises(Exception):
+            self.downloader.download(remote, local)
+
+        self.server.interrupt = False
+        self.server.files['/dump/allCountries.zip'] = b'changed' * 1000
+        self.downloader.download(remote, local)
+        self.assertEqual(self.server.log[-1][1], 200)
+        with open(local, 'rb') as f:
+            self.assertEqual(f.read(), b'changed' * 1000)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` filters module.
+"""
+
+import mock
+import pandas
+from django.test import SimpleTestCase
+
+from smartgeonames import settings
+from smartgeonames.filters import DataFilter, IdsFilter
+
+
+class TestDataFilter(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(settings, 'OBJECTS_FILTER', {
+            'feature_code': lambda x: x in ('PCLI', 'ADM1'),
+            'country_code': ('RU', 'UA'),
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.data_filter = DataFilter('OBJECTS_FILTER')
+        self.frame = pandas.DataFrame({
+            'feature_code': ['PCLI', 'ADM1', 'PPL', 'PCLI'],
+            'country_code': ['RU', 'UA', 'RU', 'DE'],
+        })
+
+    def test_mask_is_equal_to_row_filter(self):
+        rows = self.frame.to_dict(orient='records')
+        self.assertEqual(list(self.data_filter.mask(self.frame)),
+                         [self.data_filter(row) for row in rows])
+        self.assertEqual(list(self.data_filter.mask(self.frame)),
+                         [True, True, False, False])
+
+    def test_empty_filter_is_false(self):
+        with mock.patch.object(settings, 'OBJECTS_FILTER', {}):
+            self.assertFalse(self.data_filter)
+
+    def test_ignore(self):
+        data_filter = self.data_filter.ignore('country_code')
+        self.assertEqual(list(data_filter.mask(self.frame)),
+                         [True, True, False, True])
+        self.assertTrue(data_filter({'feature_code': 'PCLI'}))
+        self.assertEqual(len(self.data_filter.filters), 2)
+
+    def test_restrict(self):
+        data_filter = self.data_filter.restrict('country_code', ['DE'])
+        self.assertEqual(list(data_filter.mask(self.frame)),
+                         [False, False, False, True])
+
+
+class TestIdsFilter(SimpleTestCase):
+
+    def test_filter(self):
+        ids = set()
+        data_filter = IdsFilter(ids)
+        frame = pandas.DataFrame({'geonameid': ['1', '2', '3']})
+        self.assertTrue(data_filter)
+        self.assertFalse(data_filter({'geonameid': '2'}))
+        ids.update(['2', '3'])
+        self.assertTrue(data_filter({'geonameid': '2'}))
+        self.assertEqual(list(data_filter.mask(frame)), [False, True, True])
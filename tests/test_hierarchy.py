@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` hierarchy module.
+"""
+
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from smartgeonames.handlers import object_handler, LevelSpool, CityHierarchy
+from smartgeonames.hierarchy import HierarchyIndex
+from smartgeonames.settings import HIERARCHY_TREE_ROOT
+
+
+class FakeLoader(object):
+
+    def __init__(self):
+        self.created = []
+
+    def add_root(self, **data):
+        self.created.append((HIERARCHY_TREE_ROOT, data['geonameid']))
+
+    def add_child(self, parent_id, **data):
+        self.created.append((parent_id, data['geonameid']))
+
+    def finish(self):
+        pass
+
+
+EDGES = (
+    (6295630, 6255148),
+    (6255148, 2017370),
+    (2017370, 2122311),
+    (6255148, 690791),
+    (2017370, 6255148),
+    (99, 0),
+)
+
+
+def get_index():
+    index = HierarchyIndex()
+    for parent, child in EDGES:
+        index.add_edge(parent, child)
+    index.build()
+    return index
+
+
+class TestHierarchyIndex(SimpleTestCase):
+
+    def setUp(self):
+        self.index = get_index()
+
+    def test_lookups(self):
+        self.assertEqual(self.index.parent(6295630), HIERARCHY_TREE_ROOT)
+        self.assertEqual(self.index.parent(2122311), 2017370)
+        self.assertIsNone(self.index.parent(1))
+        self.assertEqual(self.index.children(6255148), [690791, 2017370])
+        self.assertEqual(self.index.children(HIERARCHY_TREE_ROOT),
+                         [99, 6295630])
+
+    def test_first_parent_wins(self):
+        self.assertEqual(self.index.parent(6255148), 6295630)
+
+    def test_size_and_depth(self):
+        self.assertEqual(self.index.size(), 7)
+        self.assertEqual(self.index.depth(), 4)
+
+    def test_children_wait_for_parents(self):
+        loader = FakeLoader()
+        for geonameid in (2122311, 2017370, 6255148, 6295630):
+            object_handler({'geonameid': geonameid}, self.index, loader)
+
+        self.assertEqual(loader.created, [
+            (HIERARCHY_TREE_ROOT, 6295630),
+            (6295630, 6255148),
+            (6255148, 2017370),
+            (2017370, 2122311),
+        ])
+        self.assertFalse(self.index.pending)
+        self.assertFalse(self.index.objects)
+
+    def test_changes_are_restored(self):
+        loader = FakeLoader()
+        self.index.track_changes()
+        journal = []
+        object_handler({'geonameid': 2122311}, self.index, loader)
+        object_handler({'geonameid': 6295630}, self.index, loader)
+        journal.append(self.index.get_changes())
+        object_handler({'geonameid': 690791}, self.index, loader)
+        object_handler({'geonameid': 6255148}, self.index, loader)
+        journal.append(self.index.get_changes())
+        changes = self.index.get_changes()
+        self.assertEqual(len(changes['created']), 0)
+        self.assertEqual(changes['pending'], [])
+
+        index = get_index()
+        for changes in journal:
+            index.apply_changes(changes)
+
+        # 690791 is created with its parent, so it is not saved as pending
+        self.assertEqual(list(journal[1]['created']), [690791, 6255148])
+        self.assertEqual([entry[1] for entry in journal[1]['pending']],
+                         [None])
+        for geonameid in (6295630, 6255148, 690791):
+            self.assertTrue(index.is_created(geonameid))
+        self.assertFalse(index.is_created(2017370))
+        self.assertEqual(index.pending, {2017370: [2122311]})
+        self.assertEqual(index.objects, {2122311: {'geonameid': 2122311}})
+        self.assertEqual(index.pending, self.index.pending)
+
+    def test_saved_index_is_loaded(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache = os.path.join(directory, 'hierarchy')
+        self.index.save(cache)
+
+        index = HierarchyIndex()
+        self.assertTrue(index.load(cache))
+        self.assertEqual(index.parent(2122311), 2017370)
+        self.assertEqual(index.children(6255148), [690791, 2017370])
+        self.assertEqual(index.depth(), 4)
+        self.assertFalse(index.is_created(2122311))
+        index.set_created(2122311)
+        self.assertTrue(index.is_created(2122311))
+        self.assertFalse(HierarchyIndex().load(os.path.join(directory, 'x')))
+
+    def test_levels_are_created_in_order(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        loader = FakeLoader()
+        spool = LevelSpool(self.index, loader, directory)
+        # 690791 has no imported parent
+        for geonameid in (2122311, 690791, 2017370, 6295630):
+            spool.add({'geonameid': geonameid})
+        spool.load()
+
+        self.assertEqual(loader.created, [(HIERARCHY_TREE_ROOT, 6295630)])
+        spool.close()
+        self.assertEqual(os.listdir(directory), [])
+
+        # Parent 6295630 is already created
+        loader = FakeLoader()
+        spool = LevelSpool(self.index, loader, directory)
+        for geonameid in (2122311, 2017370, 6255148, 99):
+            spool.add({'geonameid': geonameid})
+        spool.load()
+        self.assertEqual(loader.created, [
+            (HIERARCHY_TREE_ROOT, 99),
+            (6295630, 6255148),
+            (6255148, 2017370),
+            (2017370, 2122311),
+        ])
+
+    def test_records_wait_for_parents_from_later_stage(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        loader = FakeLoader()
+        spool = LevelSpool(self.index, loader, directory)
+        for geonameid in (2122311, 2017370, 690791):
+            spool.add({'geonameid': geonameid})
+        spool.load()
+        self.assertEqual(loader.created, [])
+        self.assertEqual(spool.waiting, 3)
+
+        for geonameid in (6295630, 6255148):
+            spool.add({'geonameid': geonameid})
+        spool.load()
+        self.assertEqual(loader.created, [
+            (HIERARCHY_TREE_ROOT, 6295630),
+            (6295630, 6255148),
+            (6255148, 2017370),
+            (6255148, 690791),
+            (2017370, 2122311),
+        ])
+        self.assertEqual(spool.waiting, 0)
+        spool.close()
+        self.assertEqual(os.listdir(directory), [])
+
+
+class TestCityHierarchy(SimpleTestCase):
+
+    def test_cities_are_attached_by_codes(self):
+        tree = HierarchyIndex()
+        hierarchy = CityHierarchy(tree)
+        hierarchy.add_country({'geonameid': 2017370,
+                               'iso_3166_1_a2': 'RU', 'continent': 'EU'})
+        hierarchy.add_division({'geonameid': 524894,
+                                'concatenated_code': 'RU.48'})
+        hierarchy.add_city({'geonameid': '524901', 'country_code': 'RU',
+                            'admin1_code': '48'})
+        hierarchy.add_city({'geonameid': '498817', 'country_code': 'RU',
+                            'admin1_code': '00'})
+        hierarchy.add_city({'geonameid': '703448', 'country_code': 'UA',
+                            'admin1_code': '12'})
+        hierarchy.build()
+
+        self.assertEqual(tree.parent(6255148), HIERARCHY_TREE_ROOT)
+        self.assertEqual(tree.parent(2017370), 6255148)
+        self.assertEqual(tree.parent(524901), 524894)
+        self.assertEqual(tree.parent(498817), 2017370)
+        self.assertFalse(tree.contains(703448))
+        self.assertEqual(hierarchy.ancestors,
+                         set(['6255148', '2017370', '524894']))
+        self.assertEqual(hierarchy.skipped, 1)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` instrumentation module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.test import SimpleTestCase
+
+from smartgeonames.instrumentation import StageProfiler, Timings, WRITE, \
+    timed, timings, tracemalloc
+
+
+class TestTimings(SimpleTestCase):
+
+    def test_measure_and_update(self):
+        phases = Timings()
+        with phases.measure('parse'):
+            pass
+        phases.add('parse', 1.0)
+        phases.update({'parse': 1.0, 'write': 2.0})
+        totals = phases.get()
+        self.assertGreaterEqual(totals['parse'], 2.0)
+        self.assertEqual(totals['write'], 2.0)
+
+        phases.reset()
+        self.assertEqual(phases.get(), {})
+
+    def test_timed(self):
+        @timed(WRITE)
+        def write(value):
+            return value
+
+        timings.reset()
+        self.assertEqual(write(1), 1)
+        self.assertIn(WRITE, timings.get())
+
+
+class TestStageProfiler(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_disabled(self):
+        profiler = StageProfiler()
+        self.assertFalse(profiler)
+        self.assertEqual(profiler.run('objects', sum, [1, 2]), (3, {}))
+
+    def test_profile(self):
+        profiler = StageProfiler(self.directory)
+        result, report = profiler.run('objects', sorted, [2, 1])
+        self.assertEqual(result, [1, 2])
+        self.assertTrue(os.path.exists(report['profile']['path']))
+        self.assertTrue(report['profile']['functions'])
+
+    @unittest.skipIf(tracemalloc is None, 'tracemalloc is not available')
+    def test_trace_memory(self):
+        profiler = StageProfiler(trace_memory=True)
+        result, report = profiler.run('objects', list, range(1000))
+        self.assertEqual(len(result), 1000)
+        self.assertGreater(report['memory_peak'], 0)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` loaders module.
+"""
+
+import mock
+import numpy
+from django.test import SimpleTestCase
+
+from smartgeonames.hierarchy import HierarchyIndex
+from smartgeonames.loaders import BulkTreeLoader, TranslationLoader, \
+    PostalCodeLoader, CountryInfoLoader
+from smartgeonames.models import GeoNamesRecord
+
+
+class TestBulkTreeLoader(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(GeoNamesRecord, 'get_last_root_node',
+                                    return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loader = self.get_loader()
+
+    def get_loader(self, existing=()):
+        loader = BulkTreeLoader(batch_size=1000)
+        loader.existing = numpy.array(existing, dtype=numpy.int32)
+        loader.write = mock.Mock()
+        loader.update = mock.Mock()
+        loader.update_numchild = mock.Mock()
+        return loader
+
+    def load(self, loader):
+        loader.add_root(geonameid=10, name='Earth')
+        loader.add_child(10, geonameid=20, name='Europe', population=1)
+        loader.add_child(20, geonameid=30, name='Russia')
+        loader.finish()
+
+    def test_paths_are_computed_like_treebeard(self):
+        earth = self.loader.add_root(geonameid=10, name='Earth')
+        europe = self.loader.add_child(10, geonameid=20, name='Europe')
+        asia = self.loader.add_child(10, geonameid=30, name='Asia')
+        russia = self.loader.add_child(20, geonameid=40, name='Russia')
+        other = self.loader.add_root(geonameid=50, name='Other')
+
+        self.assertEqual(earth.path, '0001')
+        self.assertEqual(europe.path, '00010001')
+        self.assertEqual(asia.path, '00010002')
+        self.assertEqual(russia.path, '000100010001')
+        self.assertEqual(russia.depth, 3)
+        self.assertEqual(other.path, '0002')
+        self.assertEqual(earth.numchild, 2)
+        self.assertEqual(europe.numchild, 1)
+        self.assertEqual(asia.numchild, 0)
+
+    def test_numchild_of_written_parent_is_updated(self):
+        self.loader.add_root(geonameid=10, name='Earth')
+        self.loader.flush()
+        self.loader.add_child(10, geonameid=20, name='Europe')
+        self.loader.flush()
+
+        self.assertEqual(self.loader.write.call_count, 2)
+        self.loader.update_numchild.assert_called_with({10: 1})
+
+    def test_only_nodes_which_may_get_children_are_kept(self):
+        tree = HierarchyIndex()
+        for parent, child in ((10, 20), (10, 30), (20, 40)):
+            tree.add_edge(parent, child)
+        tree.build()
+        self.loader.tree = tree
+        self.loader.add_root(geonameid=10, name='Earth')
+        self.loader.add_child(10, geonameid=20, name='Europe')
+        self.assertEqual(sorted(self.loader.nodes), [10, 20])
+        self.loader.add_child(10, geonameid=30, name='Asia')
+        self.assertEqual(sorted(self.loader.nodes), [20])
+        russia = self.loader.add_child(20, geonameid=40, name='Russia')
+        self.assertEqual(self.loader.nodes, {})
+        self.assertEqual(russia.path, '000100010001')
+        self.loader.finish()
+        objects, _ = self.loader.write.call_args[0]
+        self.assertEqual([obj.numchild for obj in objects], [2, 1, 0, 0])
+
+    def test_existing_records_are_updated(self):
+        self.load(self.loader)
+        objects, _ = self.loader.write.call_args[0]
+        self.assertEqual([obj.pk for obj in objects], [10, 20, 30])
+
+        # The same file is imported again into populated database
+        loader = self.get_loader(existing=[10, 20, 30])
+        self.load(loader)
+        objects, translations = loader.write.call_args[0]
+        self.assertEqual(objects, [])
+        self.assertEqual(translations, [])
+        updates = loader.update.call_args[0][0]
+        self.assertEqual([pk for pk, _, _ in updates], [10, 20, 30])
+        self.assertEqual(updates[1][1], {'population': 1})
+        self.assertEqual(updates[1][2], {'name': 'Europe'})
+        self.assertEqual(loader.updated, 3)
+        loader.update_numchild.assert_called_with({})
+
+
+class TestTranslationLoader(SimpleTestCase):
+
+    def setUp(self):
+        self.loader = TranslationLoader()
+        self.loader.imported = numpy.array([524901, 703448],
+                                           dtype=numpy.int32)
+
+    def add(self, alternatenameid, geonameid, name, **flags):
+        data = {
+            'alternateNameId': alternatenameid,
+            'geonameid': geonameid,
+            'isolanguage': 'ru',
+            'alternate_name': name,
+            'isPreferredName': None,
+            'isShortName': None,
+            'isColloquial': None,
+            'isHistoric': None,
+        }
+        data.update(flags)
+        self.loader.add(data)
+
+    def test_best_name_is_kept(self):
+        self.add(1, 524901, 'Moskva')
+        self.add(2, 524901, 'Moscow City', isShortName=True)
+        self.add(3, 524901, 'Moskau', isHistoric=True)
+        self.add(4, 703448, 'Kiev')
+        self.add(5, 703448, 'Kyiv', isPreferredName=True)
+        self.add(6, 703448, 'Kiyv')
+        self.add(7, 1, 'Not imported', isPreferredName=True)
+
+        self.assertEqual(self.loader.names, {
+            (524901, 'ru'): ((True, False), 'Moscow City', 2),
+            (703448, 'ru'): ((False, True), 'Kyiv', 5),
+        })
+
+
+class TestPostalCodeLoader(SimpleTestCase):
+
+    def setUp(self):
+        self.loader = PostalCodeLoader(batch_size=1000)
+        self.loader.index.countries = {'RU': 2017370}
+        self.loader.index.divisions = {
+            ('RU', '48'): 524894,
+            ('RU', '48', '1'): 1,
+        }
+
+    def add(self, country_code, *codes):
+        codes += (None,) * (3 - len(codes))
+        return self.loader.add({
+            'country_code': country_code,
+            'postal_code': '101000',
+            'place_name': 'Moskva',
+            'admin_code1': codes[0],
+            'admin_code2': codes[1],
+            'admin_code3': codes[2],
+            'location': mock.sentinel.location,
+            'accuracy': 4,
+        })
+
+    def test_admin_divisions_are_resolved(self):
+        with mock.patch.object(self.loader, 'model') as model:
+            self.add('RU', '48', '1', '2')
+            self.add('RU', '99')
+            self.add('UA', '12')
+
+        self.assertEqual(model.call_count, 2)
+        first, second = [kwargs for _, kwargs in model.call_args_list]
+        self.assertEqual(first['country_id'], 2017370)
+        self.assertEqual(
+            (first['admin1_id'], first['admin2_id'], first['admin3_id']),
+            (524894, 1, None))
+        self.assertEqual(second['admin1_id'], None)
+        self.assertEqual(self.loader.skipped, 1)
+        self.assertEqual(len(self.loader.pending), 2)
+
+    def test_existing_postal_codes_are_replaced(self):
+        self.loader.batch_size = 1
+        self.loader.backend = mock.Mock()
+        with mock.patch.object(self.loader, 'model') as model, \
+                mock.patch('smartgeonames.loaders.transaction'):
+            model.return_value.country_id = 2017370
+            self.add('RU', '48')
+            self.add('RU', '48')
+
+        model.objects.filter.assert_called_once_with(
+            country_id__in=set([2017370]))
+        model.objects.filter.return_value.delete.assert_called_once_with()
+        self.assertEqual(self.loader.backend.bulk_insert.call_count, 2)
+        self.assertEqual(self.loader.written, 2)
+
+
+class TestCountryInfoLoader(SimpleTestCase):
+
+    def setUp(self):
+        self.loader = CountryInfoLoader(model=mock.Mock())
+        self.loader.imported = {2017370, 6255148}
+        self.loader.capitals = {('RU', 'Moscow'): 524901}
+        self.loader.index.countries = {'UA': 690791, 'BY': 630336}
+        self.loader.index.divisions = {}
+
+    def test_related_records_are_resolved(self):
+        obj, neighbours = self.loader.resolve({
+            'iso_3166_1_a2': 'RU',
+            'iso_3166_1_a3': 'RUS',
+            'iso_3166_1_numeric': '643',
+            'geonameid': 2017370,
+            'capital': 'Moscow',
+            'area': 17100000,
+            'population': 140702000,
+            'continent': 'EU',
+            'fips': 'RS',
+            'tld': '.ru',
+            'currency_code': 'RUB',
+            'postal_code_format': '######',
+            'postal_code_regex': None,
+            'languages': 'ru,tt',
+            'neighbours': 'GE,CN,BY,UA',
+        })
+
+        kwargs = self.loader.model.call_args[1]
+        self.assertEqual(kwargs['country_id'], 2017370)
+        self.assertEqual(kwargs['capital_id'], 524901)
+        self.assertEqual(kwargs['continent_id'], 6255148)
+        self.assertEqual(obj.postal_code_regex, '')
+        self.assertEqual(neighbours, [630336, 690791])
+
+    def test_existing_rows_are_updated_in_batch(self):
+        model = self.loader.model
+        model.side_effect = lambda **kwargs: mock.Mock(
+            pk=kwargs['iso_3166_1_a2'], **kwargs)
+        model.objects.values_list.return_value = ['RU', 'UA']
+        model._meta.get_field.side_effect = lambda name: mock.Mock(
+            attname=name)
+        self.loader.backend = mock.Mock()
+        self.loader.build = mock.Mock()
+        for code in ('RU', 'BY', 'UA'):
+            data = dict((name, None) for name in (
+                'iso_3166_1_a3', 'iso_3166_1_numeric', 'geonameid',
+                'capital', 'area', 'population', 'continent', 'neighbours'
+            ) + self.loader.blank_fields)
+            data['iso_3166_1_a2'] = code
+            self.loader.add(data)
+        with mock.patch('smartgeonames.loaders.transaction'):
+            self.loader.finish()
+
+        created = self.loader.backend.bulk_insert.call_args_list[0][0][1]
+        self.assertEqual([obj.pk for obj in created], ['BY'])
+        model.objects.filter.assert_any_call(pk__in=['RU', 'UA'])
+        update = model.objects.filter.return_value.update
+        self.assertEqual(update.call_count, 1)
+        values = update.call_args[1]
+        self.assertIn('modified', values)
+        self.assertIn('population', values)
+        self.assertNotIn('created', values)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` lookups module.
+"""
+
+import mock
+from django.test import SimpleTestCase
+
+from smartgeonames import lookups
+
+
+class TestAdminCodes(SimpleTestCase):
+
+    def setUp(self):
+        lookups.clear_cache()
+        self.addCleanup(lookups.clear_cache)
+        patcher = mock.patch.object(lookups.AdminCode, 'objects')
+        objects = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.values_list = objects.values_list
+        self.values_list.return_value.iterator.return_value = [
+            ('RU', '48', '', 524894, 'Moskva', 'Moskva'),
+            ('US', 'CO', '107', 5581553, 'Routt County', 'Routt County'),
+        ]
+
+    def test_admin_divisions_of_record(self):
+        record = mock.Mock(country_code='US', admin1_code='CO',
+                           admin2_code='107')
+        admin1, admin2 = lookups.get_admin_divisions(record)
+
+        self.assertIsNone(admin1)
+        self.assertEqual(admin2.geonameid, 5581553)
+        self.assertEqual(lookups.get_admin1('RU', '48').name, 'Moskva')
+        self.assertIsNone(lookups.get_admin2('RU', '48', None))
+
+    def test_codes_are_loaded_once(self):
+        lookups.get_admin1('RU', '48')
+        lookups.get_admin1('RU', '47')
+        self.assertEqual(self.values_list.call_count, 1)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` manifest module.
+"""
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from smartgeonames.manifest import Manifest, get_sha256
+
+
+class TestManifest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'manifest.json')
+        self.manifest = Manifest(self.path)
+        self.local = os.path.join(self.directory, 'allCountries.zip')
+        with open(self.local, 'wb') as f:
+            f.write(b'objects')
+        self.manifest.add_file('http://example.com/allCountries.zip',
+                               self.local, etag='"1"', size=7,
+                               sha256=get_sha256(self.local))
+
+    def test_find_file(self):
+        entry = Manifest(self.path).find_file(self.local)
+        self.assertEqual(entry['etag'], '"1"')
+        self.assertIsNone(self.manifest.find_file('missing.zip'))
+
+    def test_verify(self):
+        self.assertTrue(self.manifest.verify(self.local))
+        self.assertTrue(self.manifest.verify(self.local, deep=True))
+        # Same size, other content and modification time
+        with open(self.local, 'wb') as f:
+            f.write(b'changed')
+        os.utime(self.local, (0, 0))
+        self.assertFalse(self.manifest.verify(self.local))
+
+    def test_imports(self):
+        sha256 = self.manifest.get_sha256(self.local)
+        self.assertFalse(self.manifest.is_imported('objects', sha256))
+        self.manifest.set_imported('objects', self.local, sha256)
+        manifest = Manifest(self.path)
+        self.assertTrue(manifest.is_imported('objects', sha256))
+        self.assertFalse(manifest.is_imported('objects', 'other'))
+        self.assertFalse(manifest.is_imported('objects', None))
+
+    def test_migrate(self):
+        status = os.path.join(self.directory, 'status.csv')
+        with io.open(status, 'w', encoding='utf-8') as f:
+            f.write('remote,local,etag,content_length,last_modified,date\n'
+                    'http://example.com/other.zip,{0},"""2""",7,,\n'
+                    'sync,http://example.com/,,,,2020-01-01\n'.format(
+                        self.local))
+        self.manifest.migrate(status)
+        self.assertFalse(os.path.exists(status))
+        manifest = Manifest(self.path)
+        self.assertEqual(manifest.find_file(self.local)['etag'], '"2"')
+        self.assertEqual(len(manifest.load()['files']), 1)
+        self.assertEqual(manifest.get_sync()['date'], '2020-01-01')
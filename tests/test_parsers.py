@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` parsers module.
+"""
+
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from smartgeonames.filters import remove_comments, remove_blank_lines
+from smartgeonames.parsers import Parser, split_file
+
+
+class TestSplitFile(SimpleTestCase):
+
+    def setUp(self):
+        fd, self.filepath = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'1\tfirst\n22\tsecond\n333\tthird\n4444\tfourth\n')
+
+    def tearDown(self):
+        os.remove(self.filepath)
+
+    def test_ranges_are_aligned_to_lines(self):
+        ranges = split_file(self.filepath, 10)
+        with open(self.filepath, 'rb') as f:
+            content = f.read()
+
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(content))
+        for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, next_start)
+        for start, end in ranges:
+            self.assertTrue(content[start:end].endswith(b'\n'))
+
+    def test_whole_file_in_one_range(self):
+        self.assertEqual(split_file(self.filepath, 1024),
+                         [(0, os.path.getsize(self.filepath))])
+
+
+class TestPreProcessors(SimpleTestCase):
+
+    def test_pre_processors_are_streamed(self):
+        fd, filepath = tempfile.mkstemp(suffix='.txt')
+        content = b'#ISO\tISO3\n\nRU\tRUS\n# comment\nUA\tUKR\n'
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        self.addCleanup(os.remove, filepath)
+
+        parser = Parser(without_pandas_mode=True)
+        source = parser.open(filepath, (remove_comments, remove_blank_lines))
+        try:
+            rows = list(parser.read(source, ('iso', 'iso3')))
+        finally:
+            source.close()
+
+        self.assertEqual([r['iso'] for r in rows], ['RU', 'UA'])
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+
+class TestSkip(SimpleTestCase):
+
+    def setUp(self):
+        fd, self.filepath = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'1\tfirst\n2\tsecond\n3\tthird\n4\tfourth\n')
+        self.addCleanup(os.remove, self.filepath)
+
+    def read(self, parser, skip):
+        source = parser.open(self.filepath)
+        try:
+            rows = [r['id'] for r in
+                    parser.read(source, ('id', 'name'), skip=skip)]
+        finally:
+            source.close()
+        return rows
+
+    def test_reading_continues_from_position(self):
+        for without_pandas_mode in (False, True):
+            parser = Parser(without_pandas_mode=without_pandas_mode)
+            self.assertEqual(self.read(parser, 2), ['3', '4'])
+            self.assertEqual(parser.position, 4)
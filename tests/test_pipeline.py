@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` pipeline module.
+"""
+
+import shutil
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
+
+import mock
+from django.test import SimpleTestCase
+from django.utils import six
+
+from smartgeonames.checkpoints import Checkpoint, CheckpointError
+from smartgeonames.parsers import Parser
+from smartgeonames.pipeline import ShardedStage, Stage, StageScheduler
+
+
+class RecordedStage(Stage):
+
+    def __init__(self, name, runs, **kwargs):
+        super(RecordedStage, self).__init__(name, None, None, **kwargs)
+        self.runs = runs
+
+    def run(self, parser):
+        self.runs.append((self.name, threading.current_thread().name))
+        return {'records': 0}
+
+
+class TestStageScheduler(SimpleTestCase):
+
+    def setUp(self):
+        self.runs = []
+
+    def stage(self, name, *depends_on, **kwargs):
+        return RecordedStage(name, self.runs, depends_on=depends_on,
+                             **kwargs)
+
+    def get_order(self):
+        return [name for name, _ in self.runs]
+
+    def test_stages_are_run_in_order_of_dependencies(self):
+        stages = [
+            self.stage('translations', 'objects'),
+            self.stage('objects', 'hierarchy'),
+            self.stage('countries'),
+            self.stage('hierarchy'),
+        ]
+
+        stats = StageScheduler(stages, Parser()).run()
+
+        self.assertEqual(self.get_order(),
+                         ['countries', 'hierarchy', 'objects',
+                          'translations'])
+        self.assertEqual(set(stats), set(['countries', 'hierarchy',
+                                          'objects', 'translations',
+                                          'total']))
+
+    def test_parallel(self):
+        stages = [
+            self.stage('hierarchy', local=True),
+            self.stage('objects', 'hierarchy', local=True),
+            self.stage('translations', 'objects'),
+            self.stage('postal_codes', 'objects'),
+            self.stage('countries', 'objects', local=True),
+            self.stage('admin1_codes'),
+        ]
+        main_thread = threading.current_thread().name
+
+        with mock.patch('smartgeonames.pipeline.multiprocessing') as mp:
+            mp.Pool = ThreadPool
+            stats = StageScheduler(stages, Parser(), jobs=2).run()
+
+        threads = dict(self.runs)
+        self.assertEqual(set(threads), set(stage.name for stage in stages))
+        for stage in stages:
+            self.assertIn(stage.name, stats)
+            if stage.local:
+                self.assertEqual(threads[stage.name], main_thread)
+            else:
+                self.assertNotEqual(threads[stage.name], main_thread)
+        order = self.get_order()
+        for stage in stages:
+            for dependency in stage.depends_on:
+                self.assertLess(order.index(dependency),
+                                order.index(stage.name))
+
+    def test_unknown_dependency(self):
+        with six.assertRaisesRegex(self, ValueError,
+                                   'unknown stages: hierarchy'):
+            StageScheduler([self.stage('objects', 'hierarchy')], Parser())
+
+    def test_cyclic_dependency(self):
+        stages = [
+            self.stage('countries'),
+            self.stage('objects', 'translations'),
+            self.stage('translations', 'objects'),
+        ]
+        with six.assertRaisesRegex(self, ValueError,
+                                   'cyclic dependencies: objects, '
+                                   'translations'):
+            StageScheduler(stages, Parser())
+        self.assertEqual(self.runs, [])
+
+
+class TestStageCheckpoint(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.checkpoint = Checkpoint(directory)
+        self.resumable = mock.Mock()
+        self.resumable.get_state.return_value = {'last_pk': 10}
+        self.resumable.get_changes.return_value = []
+
+    def stage(self, stage_class=Stage):
+        return stage_class('objects', None, None, checkpoint=self.checkpoint,
+                           resumable=self.resumable)
+
+    def test_state_is_restored_from_journal(self):
+        stage = self.stage()
+        self.resumable.get_changes.side_effect = [[1], [2]]
+        stage.save_checkpoint(100, {'records': 100})
+        stage.save_checkpoint(200, {'records': 200})
+
+        state = self.stage().load_checkpoint()
+
+        self.assertEqual(state['position'], 200)
+        self.resumable.set_state.assert_called_once_with({'last_pk': 10},
+                                                         [[1], [2]])
+
+    def test_position_of_other_kind_is_not_resumed(self):
+        self.stage(ShardedStage).save_checkpoint(4096, {'records': 100})
+
+        with self.assertRaises(CheckpointError):
+            self.stage().load_checkpoint()
+        self.assertFalse(self.resumable.set_state.called)
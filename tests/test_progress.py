@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` progress module.
+"""
+
+import io
+
+from django.test import SimpleTestCase
+
+from smartgeonames.progress import Progress, format_duration
+
+
+class TTY(io.StringIO):
+
+    def isatty(self):
+        return True
+
+
+class TestProgress(SimpleTestCase):
+
+    def test_disabled_without_tty(self):
+        stream = io.StringIO()
+        progress = Progress('objects', interval=0, stream=stream)
+        progress.update(10)
+        progress.finish()
+        self.assertFalse(progress.enabled)
+        self.assertEqual(stream.getvalue(), '')
+
+    def test_throttled(self):
+        stream = TTY()
+        progress = Progress('objects', interval=3600, stream=stream)
+        progress.update(10)
+        self.assertEqual(stream.getvalue(), '')
+
+        progress.next_write = 0
+        progress.update(20)
+        progress.update(30)
+        self.assertEqual(stream.getvalue().count('\r'), 1)
+
+    def test_message(self):
+        progress = Progress('objects', total=100, counters={'errors': 2},
+                            stream=TTY())
+        message = progress.get_message(25, progress.started + 10)
+        self.assertEqual(message, 'objects: 25 rows, 2 rows/s, errors: 2, '
+                                  '25%, ETA: 0:00:30')
+
+    def test_format_duration(self):
+        self.assertEqual(format_duration(3725.5), '1:02:05')
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` schemas module.
+"""
+from __future__ import unicode_literals
+
+from django.test import SimpleTestCase
+
+from smartgeonames.schemas import PostalCodeSchema
+
+
+class TestPostalCodeSchema(SimpleTestCase):
+
+    def setUp(self):
+        self.schema = PostalCodeSchema()
+
+    def load(self, latitude, longitude):
+        row = {
+            'country_code': 'RU',
+            'postal_code': '101000',
+            'place_name': 'Moskva',
+        }
+        if latitude is not None:
+            row.update(latitude=latitude, longitude=longitude)
+        data, errors = self.schema.load(row)
+        self.assertEqual(errors, {})
+        return data['location']
+
+    def test_location_is_longitude_and_latitude(self):
+        location = self.load('55.7522', '37.6156')
+        self.assertEqual(location.coords, (37.6156, 55.7522))
+
+    def test_zero_coordinates_are_kept(self):
+        location = self.load('0', '-78.5')
+        self.assertEqual(location.coords, (-78.5, 0.0))
+        location = self.load('51.4779', '0')
+        self.assertEqual(location.coords, (0.0, 51.4779))
+
+    def test_missing_coordinates(self):
+        self.assertIsNone(self.load(None, None))
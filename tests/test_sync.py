@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` sync module.
+"""
+from __future__ import unicode_literals
+
+import datetime
+import os
+import shutil
+import tempfile
+
+import mock
+from django.test import SimpleTestCase
+
+from smartgeonames.parsers import Parser
+from smartgeonames.schemas import AlternateNameSchema, GeoNamesRecordSchema
+from smartgeonames.sync import DeltaSync, get_dates
+
+
+class TestGetDates(SimpleTestCase):
+
+    def test_dates_after_last_applied(self):
+        self.assertEqual(
+            get_dates(datetime.date(2016, 2, 27), datetime.date(2016, 3, 1)),
+            [datetime.date(2016, 2, 28),
+             datetime.date(2016, 2, 29),
+             datetime.date(2016, 3, 1)])
+
+    def test_nothing_to_apply(self):
+        self.assertEqual(
+            get_dates(datetime.date(2016, 3, 1), datetime.date(2016, 3, 1)),
+            [])
+
+    def test_only_last_day_without_last_applied(self):
+        self.assertEqual(get_dates(None, datetime.date(2016, 3, 1)),
+                         [datetime.date(2016, 3, 1)])
+
+
+DELTAS = {
+    'deletes-2016-03-01.txt': [
+        '2017370\tRussia\tduplicate',
+        '1\tNowhere\tnot imported',
+    ],
+    'modifications-2016-03-01.txt': [
+        '524901\tMoscow\tMoscow\t\t55.75222\t37.61556\tP\tPPLC\tRU\t'
+        '\t48\t\t\t\t10381222\t\t144\tEurope/Moscow\t2016-03-01',
+        '468902\tYaroslavl\tYaroslavl\t\t57.62987\t39.87368\tP\tPPLA\tRU'
+        '\t\t88\t\t\t\t591486\t\t99\tEurope/Moscow\t2016-03-01',
+        '6255148\tEurope\tEurope\t\t48.69096\t9.14062\tL\tCONT\t\t'
+        '\t\t\t\t\t741000000\t\t1\t\t2016-03-01',
+    ],
+    'alternateNamesDeletes-2016-03-01.txt': [
+        '100\t524901\tduplicate',
+        '200\t468902\twrong',
+    ],
+    'alternateNamesModifications-2016-03-01.txt': [
+        '300\t524901\tru\tMoskva\t1\t\t\t',
+        '400\t468902\tru\tYaroslavl-na-Volge\t\t\t\t',
+        '600\t524901\tru\tMoskva-staraya\t\t\t\t1',
+        '500\t524901\ten\tMoscow\t1\t\t\t',
+    ],
+}
+
+
+class TestDeltaSync(SimpleTestCase):
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        for name, lines in DELTAS.items():
+            with open(os.path.join(self.source, name), 'wb') as f:
+                f.write('\n'.join(lines + ['']).encode('utf-8'))
+        self.records = {
+            2017370: mock.Mock(),
+            524901: mock.Mock(),
+            468902: None,
+            12345: mock.Mock(),
+        }
+        for record in self.records.values():
+            if record is not None:
+                record.get_children.return_value = []
+        self.model = mock.Mock()
+        self.model.objects.filter.side_effect = self.filter
+        translations = self.model._parler_meta.root_model.objects.filter
+        translations.return_value.count.return_value = 2
+        self.hierarchy = mock.Mock()
+        self.hierarchy.parent.return_value = 12345
+        self.sync = DeltaSync(self.source, self.source, Parser(),
+                              mock.Mock(), lambda: self.hierarchy,
+                              GeoNamesRecordSchema, AlternateNameSchema,
+                              model=self.model)
+        transaction = mock.patch('smartgeonames.sync.transaction')
+        transaction.start()
+        self.addCleanup(transaction.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.source)
+
+    def filter(self, pk):
+        queryset = mock.Mock()
+        queryset.first.return_value = self.records.get(pk)
+        return queryset
+
+    def apply(self):
+        return self.sync.apply(datetime.date(2016, 3, 1))
+
+    def test_not_published_deltas_are_not_applied(self):
+        os.remove(os.path.join(self.source, 'deletes-2016-03-01.txt'))
+
+        self.assertFalse(self.apply())
+        self.assertFalse(self.model.objects.filter.called)
+
+    def test_deletes(self):
+        self.assertTrue(self.apply())
+
+        self.records[2017370].delete.assert_called_once_with()
+        self.assertEqual(self.sync.stats['deletes'], 1)
+
+    def test_descendants_survive_delete(self):
+        country = self.records[2017370]
+        calls = mock.Mock()
+        children = [calls.first, calls.second]
+        country.get_children.return_value = children
+        country.delete = calls.delete
+
+        self.assertTrue(self.apply())
+
+        self.assertEqual(calls.mock_calls, [
+            mock.call.first.move(country, 'last-sibling'),
+            mock.call.second.move(country, 'last-sibling'),
+            mock.call.delete(),
+        ])
+
+    def test_modifications(self):
+        self.assertTrue(self.apply())
+
+        moscow = self.records[524901]
+        self.assertEqual(moscow.population, 10381222)
+        self.assertEqual(moscow.feature_code, 'PPLC')
+        moscow.save.assert_called_once_with()
+        self.hierarchy.parent.assert_called_once_with(468902)
+        parent = self.records[12345]
+        self.assertEqual(parent.add_child.call_count, 1)
+        _, data = parent.add_child.call_args
+        self.assertEqual(data['geonameid'], 468902)
+        self.assertEqual(data['name'], 'Yaroslavl')
+        self.assertEqual(self.sync.stats['modifications'], 2)
+
+    def test_alternate_names_deletes(self):
+        self.assertTrue(self.apply())
+
+        translations = self.sync.translation_model.objects.filter
+
+        translations.assert_called_once_with(alternatenameid__in=[100, 200])
+        translations.return_value.delete.assert_called_once_with()
+        self.assertEqual(self.sync.stats['alternate_names_deletes'], 2)
+
+    def test_alternate_names_modifications(self):
+        moscow = self.records[524901]
+
+        self.assertTrue(self.apply())
+
+        moscow.set_current_language.assert_called_once_with('ru')
+        self.assertEqual(moscow.name, 'Moskva')
+        self.assertEqual(moscow.alternatenameid, 300)
+        moscow.save_translations.assert_called_once_with()
+        self.assertEqual(self.sync.stats['alternate_names_modifications'], 1)
+
+    def test_modified_stored_name_is_applied(self):
+        yaroslavl = self.records[468902] = mock.Mock()
+        yaroslavl.get_translation.return_value.alternatenameid = 400
+
+        self.assertTrue(self.apply())
+
+        yaroslavl.get_translation.assert_called_once_with('ru')
+        self.assertEqual(yaroslavl.name, 'Yaroslavl-na-Volge')
+        yaroslavl.save_translations.assert_called_once_with()
+
+    def test_other_stored_name_is_kept_for_not_preferred_one(self):
+        yaroslavl = self.records[468902] = mock.Mock()
+        yaroslavl.get_translation.return_value.alternatenameid = 401
+
+        self.assertTrue(self.apply())
+
+        self.assertFalse(yaroslavl.save_translations.called)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_django-smart-geonames
+------------
+
+Tests for `django-smart-geonames` validation module.
+"""
+from __future__ import unicode_literals
+
+import os
+import tempfile
+from contextlib import closing
+
+import pandas
+from django.test import SimpleTestCase
+from django.utils import six
+from marshmallow import Schema, fields, pre_load
+
+from smartgeonames.parsers import Parser
+from smartgeonames.schemas import AlternateNameSchema, GeoNamesRecordSchema
+from smartgeonames.validation import BatchValidator
+
+
+class TestBatchValidator(SimpleTestCase):
+
+    def setUp(self):
+        self.schema = AlternateNameSchema()
+        self.validator = BatchValidator(self.schema)
+        self.frame = pandas.DataFrame([
+            ['1', '524901', 'ru', 'Moskva', '1', '', '', ''],
+            ['2', 'abc', 'ru', 'Moskva', '', '', '', ''],
+            ['3', '524901', 'too-long', 'Moskva', '', '', '', ''],
+            ['', '524901', '', 'Moskva', '0', '1', '', ''],
+        ], columns=list(self.schema.fields.keys()))
+
+    def test_invalid_rows_mask(self):
+        _, invalid = self.validator.validate(self.frame)
+        self.assertEqual(list(invalid), [False, True, True, True])
+
+    def test_result_is_equal_to_schema_load(self):
+        for row, (data, errors) in zip(self.frame.to_dict(orient='records'),
+                                       self.validator.load(self.frame)):
+            result = self.schema.load(row)
+            self.assertEqual(bool(errors), bool(result.errors))
+            if not errors:
+                self.assertEqual(data, result.data)
+
+    def test_non_ascii_names_are_text(self):
+        # 150 characters, but 300 bytes in UTF-8
+        name = 'Ж' * 150
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write('1\t524901\tru\t{0}\t1\t\t\t\n'.format(name)
+                    .encode('utf-8'))
+        parser = Parser()
+        fields = list(self.schema.fields.keys())
+        with closing(parser.open(path)) as source:
+            frames = list(parser.read_frames(source, fields))
+        expected = self.schema.load(dict(zip(
+            fields, ['1', '524901', 'ru', name, '1', '', '', ''])))
+
+        [(data, errors)] = self.validator.load(frames[0])
+
+        self.assertEqual(errors, {})
+        self.assertEqual(data, expected.data)
+        self.assertEqual(data['alternate_name'], name)
+        self.assertIsInstance(data['alternate_name'], six.text_type)
+        self.assertIsInstance(data['isolanguage'], six.text_type)
+
+    def test_schema_with_unknown_pre_load_is_loaded_by_rows(self):
+        class UpperSchema(Schema):
+            name = fields.String()
+
+            @pre_load
+            def upper(self, data):
+                data['name'] = data['name'].upper()
+                return data
+
+        validator = BatchValidator(UpperSchema())
+        frame = pandas.DataFrame([['moskva']], columns=['name'])
+
+        self.assertFalse(validator.is_supported)
+        self.assertEqual(list(validator.load(frame)),
+                         [({'name': 'MOSKVA'}, {})])
+
+
+class TestGeoNamesRecordBatchValidator(SimpleTestCase):
+
+    def setUp(self):
+        self.schema = GeoNamesRecordSchema()
+        self.validator = BatchValidator(self.schema)
+        self.frame = pandas.DataFrame([
+            ['524901', 'Moscow', 'Moscow', '', '55.75222', '37.61556', 'P',
+             'PPLC', 'RU', '', '48', '', '', '', '10381222', '', '144',
+             'Europe/Moscow', '2017-07-05'],
+            ['2017370', 'Russia', 'Russia', '', '60.0', '100.0', 'A',
+             'PCLI', 'RU', '', '00', '', '', '', '140702000', '', '207',
+             'Asia/Krasnoyarsk', '2016-10-26'],
+            ['1', 'Nowhere', 'Nowhere', '', '', '', 'P', 'PPL', 'RU', '',
+             '', '', '', '', '0', '-12', '0', '', '2012-01-01'],
+            ['abc', 'Broken', 'Broken', '', '1.1', '2.2', 'P', 'PPL', 'RU',
+             '', '', '', '', '', '0', '', '0', '', '2012-13-40'],
+        ], columns=list(self.schema.fields.keys()))
+
+    def test_result_is_equal_to_schema_load(self):
+        for row, (data, errors) in zip(self.frame.to_dict(orient='records'),
+                                       self.validator.load(self.frame)):
+            result = self.schema.load(row)
+            self.assertEqual(bool(errors), bool(result.errors))
+            if errors:
+                continue
+            location = data.pop('location')
+            expected = result.data.pop('location')
+            self.assertEqual(data, result.data)
+            if expected is None:
+                self.assertIsNone(location)
+            else:
+                self.assertEqual(location.coords, expected.coords)